@@ -0,0 +1,67 @@
+"""
+Benchmark for the chunker
+Measures throughput and window fill over large synthetic documents
+
+Usage:
+    python bench_chunking.py [--mb 5] [--model text-embedding-3-small]
+"""
+import argparse
+import random
+import time
+import tracemalloc
+
+from services.chunking import get_tokenizer, iter_chunk_spans
+
+WORDS = (
+    "pricing plan starter enterprise refund policy account password reset invoice "
+    "integration webhook widget assistant knowledge base support ticket escalation"
+).split()
+
+
+def make_document(target_bytes: int, seed: int = 42) -> str:
+    """Paragraphs of random sentences, roughly target_bytes long"""
+    rng = random.Random(seed)
+    paragraphs = []
+    size = 0
+    while size < target_bytes:
+        sentences = [
+            " ".join(rng.choice(WORDS) for _ in range(rng.randint(6, 24))).capitalize() + "."
+            for _ in range(rng.randint(2, 8))
+        ]
+        paragraph = " ".join(sentences)
+        paragraphs.append(paragraph)
+        size += len(paragraph) + 2
+    return "\n\n".join(paragraphs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--mb", type=float, default=5.0, help="Document size in MiB")
+    parser.add_argument("--model", default="text-embedding-3-small", help="Embedding model tokenizer")
+    parser.add_argument("--chunk-tokens", type=int, default=512)
+    parser.add_argument("--overlap", type=float, default=0.2)
+    args = parser.parse_args()
+
+    text = make_document(int(args.mb * 1024 * 1024))
+    tokenizer = get_tokenizer(args.model)
+    print(f"Document: {len(text) / 1e6:.1f}M chars, tokenizer: {type(tokenizer).__name__} ({args.model})")
+
+    started = time.perf_counter()
+    spans = list(iter_chunk_spans(text, tokenizer, args.chunk_tokens, args.overlap))
+    elapsed = time.perf_counter() - started
+
+    # Separate pass: tracemalloc slows allocation-heavy code too much to time it
+    tracemalloc.start()
+    list(iter_chunk_spans(text, tokenizer, args.chunk_tokens, args.overlap))
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    budget = min(args.chunk_tokens, tokenizer.max_tokens)
+    fill = sum(tokens for _, _, tokens in spans) / (len(spans) * budget)
+    print(f"✓ {len(spans)} chunks in {elapsed:.2f}s ({len(text) / 1e6 / elapsed:.1f}M chars/s)")
+    print(f"✓ Average window fill: {fill:.1%} of {budget} tokens")
+    print(f"✓ Peak traced memory: {peak / 1e6:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Benchmark for the in-process vector store
+Measures upsert throughput and exact top-k query latency on random vectors (no network)
+
+Usage:
+    python bench_vector_store.py [--vectors 10000] [--dim 384] [--queries 1000] [--top-k 5] [--segments] [--ann --nprobe 16]
+"""
+import argparse
+import tempfile
+import time
+
+import numpy as np
+
+from services.local_vector_store import NumpyVectorStore
+from services.vector_segments import SegmentVectorStore
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--vectors", type=int, default=10000, help="Vectors in the namespace")
+    parser.add_argument("--dim", type=int, default=384, help="Embedding dimension")
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--batch-size", type=int, default=100, help="Vectors per upsert call")
+    parser.add_argument("--segments", action="store_true", help="Memory-mapped on-disk segments instead of heap matrices")
+    parser.add_argument("--ann", action="store_true", help="Search segments through an IVF index (implies --segments)")
+    parser.add_argument("--nprobe", type=int, default=16, help="IVF lists scanned per query")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    vectors = rng.standard_normal((args.vectors, args.dim)).astype(np.float32)
+    if args.segments or args.ann:
+        store = SegmentVectorStore(tempfile.mkdtemp(prefix="bench-vectors-"))
+        # Without --ann the threshold is out of reach, so search stays exact
+        store.configure_ann("bench", threshold=0 if args.ann else args.vectors + 1, nprobe=args.nprobe)
+        print(f"Segment store in {store.root}")
+    else:
+        store = NumpyVectorStore()
+
+    started = time.perf_counter()
+    for start in range(0, args.vectors, args.batch_size):
+        batch = vectors[start:start + args.batch_size]
+        store.upsert("bench", [
+            (f"doc#{start + i}", vector.tolist(), {"chunk_index": start + i})
+            for i, vector in enumerate(batch)
+        ])
+    elapsed = time.perf_counter() - started
+    print(f"✓ Upserted {args.vectors} x {args.dim} vectors in {elapsed:.2f}s ({args.vectors / elapsed:.0f} vectors/s)")
+    if args.ann:
+        started = time.perf_counter()
+        store.close()  # Waits for the background index build
+        view = store._namespace("bench").snapshot()
+        print(f"✓ IVF index: {view.index.nlist} lists, waited {time.perf_counter() - started:.2f}s for the build")
+
+    queries = rng.standard_normal((args.queries, args.dim)).astype(np.float32).tolist()
+    latencies = []
+    recall = []
+    for query in queries:
+        started = time.perf_counter()
+        matches = store.query("bench", args.top_k, vector=query)
+        latencies.append(time.perf_counter() - started)
+        if args.ann:
+            q = np.asarray(query, dtype=np.float32)
+            exact = np.argsort(-(vectors @ q / np.linalg.norm(vectors, axis=1)))[:args.top_k]
+            recall.append(len({f"doc#{i}" for i in exact} & {m.id for m in matches}) / args.top_k)
+
+    p50, p99 = np.percentile(latencies, [50, 99]) * 1000
+    print(f"✓ {args.queries} queries (top-{args.top_k}): p50 {p50:.3f} ms, p99 {p99:.3f} ms")
+    if recall:
+        # Uniformly random vectors have no clusters, so this is a worst case for IVF recall
+        print(f"✓ Recall@{args.top_k} vs exact search: {np.mean(recall):.3f} (nprobe {args.nprobe})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Offline bulk ingestion of a directory
+Ingests every PDF/text file (and the contents of zip/tar archives) under a
+directory, several documents at a time. Progress is checkpointed, so rerunning
+after an interruption skips documents that are already ingested and unchanged.
+
+Usage:
+    python ingest_dir.py ./customer-docs --assistant-id acme [--concurrency 4] [--restart]
+"""
+import argparse
+import asyncio
+import logging
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from services.aio import shutdown_executors
+from services.bulk import (
+    BULK_INGEST_CONCURRENCY,
+    BulkCheckpoint,
+    BulkStats,
+    checkpoint_path,
+    iter_directory,
+    run_bulk_ingest,
+)
+from services.lexical import close_lexical_index
+from services.vector_store import close_vector_store
+
+
+async def ingest_directory(args) -> BulkStats:
+    checkpoint = BulkCheckpoint(args.checkpoint or checkpoint_path(args.assistant_id), resume=not args.restart)
+    print(f"Ingesting {args.directory} for assistant {args.assistant_id} (checkpoint: {checkpoint.path})")
+
+    def on_document_done(document, stats: BulkStats):
+        processed = stats.documents_done + stats.documents_failed
+        if processed % args.report_every == 0:
+            print(f"  {stats.summary()}")
+
+    return await run_bulk_ingest(
+        iter_directory(args.directory),
+        args.assistant_id,
+        checkpoint=checkpoint,
+        concurrency=args.concurrency,
+        on_document_done=on_document_done,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("directory", help="Directory to ingest (searched recursively)")
+    parser.add_argument("--assistant-id", required=True)
+    parser.add_argument("--concurrency", type=int, default=BULK_INGEST_CONCURRENCY, help="Documents in flight")
+    parser.add_argument("--checkpoint", help="Checkpoint file (default: per-assistant file in BULK_CHECKPOINT_DIR)")
+    parser.add_argument("--restart", action="store_true", help="Ignore the checkpoint and re-ingest everything")
+    parser.add_argument("--report-every", type=int, default=10, help="Print stats every N documents")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    try:
+        stats = asyncio.run(ingest_directory(args))
+    finally:
+        close_vector_store()  # Waits for background compactions of the local store
+        close_lexical_index()  # Waits for a background fold of the keyword index
+        shutdown_executors()
+
+    print(f"✓ {stats.summary()}")
+    for failure in stats.failures:
+        print(f"✗ {failure['document_key']}: {failure['error']}")
+    raise SystemExit(1 if stats.failures else 0)
+
+
+if __name__ == "__main__":
+    main()
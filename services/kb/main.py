@@ -2,29 +2,69 @@
 Knowledge Base Service - RAG Pipeline
 Handles document ingestion, embedding, and retrieval
 """
+import asyncio
 import os
+import json
 import logging
 import re
 import secrets
+import time
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, UploadFile, File, HTTPException, Header, Depends
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
 from dotenv import load_dotenv
 import uvicorn
 from typing import List, Dict, Optional
 
-from services.ingestion import ingest_document
-from services.retrieval import search_knowledge_base
-from services.llm import generate_rag_response
+from services.aio import run_io, shutdown_executors
+from services.bulk import (
+    BULK_MAX_ARCHIVE_BYTES,
+    BULK_MAX_DOCUMENTS,
+    BulkDocument,
+    BulkLimitError,
+    InvalidArchiveError,
+    detect_content_type,
+    expand_archive,
+    is_archive,
+)
+from services.jobs import QueueFullError, get_job_queue
+from services.spool import SpooledUpload, UploadTooLargeError, release_source, spool_upload
+from services.answer_cache import get_answer_cache
+from services.retrieval import embed_query, search_knowledge_base, search_knowledge_base_batch
+from services.history import compact_history
+from services.lexical import close_lexical_index
+from services.llm import close_llm_clients, generate_rag_response, start_llm_client, stream_rag_response
+from services.vector_store import close_vector_store, warm_up_vector_store
 
 load_dotenv()
 
-app = FastAPI(title="Resonance KB Service", version="0.1.0")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Start ingestion workers; drain queued uploads before the process exits
+    job_queue = get_job_queue()
+    job_queue.start()
+    # Open the index connection now, so the first query does not pay for host lookup and TLS
+    await run_io(warm_up_vector_store)
+    # One pooled LLM client for the worker's lifetime (keep-alive connections are reused across turns)
+    start_llm_client()
+    yield
+    await job_queue.shutdown()
+    await close_llm_clients()
+    close_vector_store()
+    close_lexical_index()
+    shutdown_executors()
+
+
+app = FastAPI(title="Resonance KB Service", version="0.1.0", lifespan=lifespan)
 
 logger = logging.getLogger("resonance.kb")
 
 KB_SERVICE_API_KEY = os.getenv("KB_SERVICE_API_KEY", "")
-MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", "10485760"))  # 10 MiB default
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", "10485760"))  # 10 MiB default; uploads are spooled to disk
+SEARCH_BATCH_MAX_QUERIES = int(os.getenv("SEARCH_BATCH_MAX_QUERIES", "64"))
 
 def _parse_allowed_origins() -> List[str]:
     raw = os.getenv("ALLOWED_ORIGINS", "")
@@ -55,11 +95,63 @@ def normalize_assistant_id(value: Optional[str]) -> str:
         raise HTTPException(status_code=400, detail="Invalid assistant_id")
     return assistant_id
 
+def normalize_document_key(value: Optional[str], filename: Optional[str]) -> str:
+    # Default identity is the filename within the assistant.
+    document_key = (value or filename or "").strip()
+    if not document_key or len(document_key) > 256:
+        raise HTTPException(status_code=400, detail="Invalid document_key")
+    return document_key
+
+def sse_event(event: str, data: Dict) -> str:
+    """One Server-Sent Events message with a JSON payload"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+async def read_upload(file: UploadFile) -> SpooledUpload:
+    if file.content_type not in ("application/pdf", "text/plain"):
+        raise HTTPException(status_code=415, detail="Unsupported content type")
+
+    # Stream to a spool file with a hard cap (enforced mid-stream) to reduce DoS risk
+    try:
+        return await spool_upload(file, max_bytes=MAX_UPLOAD_BYTES)
+    except UploadTooLargeError:
+        raise HTTPException(status_code=413, detail="File too large")
+
+async def read_bulk_upload(file: UploadFile) -> List[BulkDocument]:
+    # Archives are expanded into one spool file per supported member
+    name = file.filename or ""
+    if is_archive(name):
+        try:
+            archive = await spool_upload(file, max_bytes=BULK_MAX_ARCHIVE_BYTES)
+        except UploadTooLargeError:
+            raise HTTPException(status_code=413, detail="Archive too large")
+        try:
+            return await run_io(expand_archive, archive, name, MAX_UPLOAD_BYTES)
+        except UploadTooLargeError:
+            raise HTTPException(status_code=413, detail="File too large")
+        except BulkLimitError:
+            raise HTTPException(status_code=413, detail="Too many documents")
+        except InvalidArchiveError:
+            raise HTTPException(status_code=400, detail="Invalid archive")
+        finally:
+            archive.cleanup()
+
+    # Multipart clients often send octet-stream; fall back to the file extension
+    content_type = file.content_type
+    if content_type not in ("application/pdf", "text/plain"):
+        content_type = detect_content_type(name)
+        if content_type is None:
+            raise HTTPException(status_code=415, detail="Unsupported content type")
+    try:
+        content = await spool_upload(file, max_bytes=MAX_UPLOAD_BYTES)
+    except UploadTooLargeError:
+        raise HTTPException(status_code=413, detail="File too large")
+    return [BulkDocument(document_key=name, filename=name, content_type=content_type, content=content)]
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=_parse_allowed_origins(),
     allow_credentials=False,
-    allow_methods=["GET", "POST"],
+    allow_methods=["GET", "POST", "PUT"],
     allow_headers=["Authorization", "Content-Type"],
 )
 
@@ -70,6 +162,19 @@ class SearchRequest(BaseModel):
     top_k: int = Field(5, ge=1, le=20)
 
 
+class BatchSearchQuery(BaseModel):
+    query: str = Field(..., min_length=1, max_length=4000)
+    # Defaults to the batch's assistant_id / top_k
+    assistant_id: Optional[str] = Field(default=None, min_length=1, max_length=64, pattern=r"^[A-Za-z0-9_-]+$")
+    top_k: Optional[int] = Field(default=None, ge=1, le=20)
+
+
+class BatchSearchRequest(BaseModel):
+    queries: List[BatchSearchQuery] = Field(..., min_length=1, max_length=SEARCH_BATCH_MAX_QUERIES)
+    assistant_id: Optional[str] = Field(default=None, min_length=1, max_length=64, pattern=r"^[A-Za-z0-9_-]+$")
+    top_k: int = Field(5, ge=1, le=20)
+
+
 class ChatRequest(BaseModel):
     query: str = Field(..., min_length=1, max_length=4000)
     assistant_id: str = Field(..., min_length=1, max_length=64, pattern=r"^[A-Za-z0-9_-]+$")
@@ -77,6 +182,36 @@ class ChatRequest(BaseModel):
     system_prompt: Optional[str] = Field(default=None, max_length=4000)
 
 
+def chat_sources(context_chunks: List[Dict]) -> List[Dict]:
+    return [
+        {
+            "source": chunk.get("source", "unknown"),
+            "score": chunk.get("score", 0),
+        }
+        for chunk in context_chunks
+    ]
+
+
+async def retrieve_chat_context(request: ChatRequest, assistant_id: str):
+    """
+    Retrieve context for a chat turn; first turns are also looked up in the answer cache
+    Returns (context chunks, cached answer or None, key to store a fresh answer under or None)
+    The query is embedded once and the vector serves both retrieval and the cache lookup
+    """
+    answer_cache = get_answer_cache() if not request.conversation_history else None
+    query_vector = await embed_query(request.query) if answer_cache is not None else None
+    context_chunks = await search_knowledge_base(
+        query=request.query,
+        assistant_id=assistant_id,
+        top_k=5,
+        query_vector=query_vector,
+    )
+    if answer_cache is None:
+        return context_chunks, None, None
+    cached, answer_key = answer_cache.lookup(assistant_id, query_vector, context_chunks, request.system_prompt)
+    return context_chunks, cached, answer_key
+
+
 @app.get("/")
 async def root():
     return {"message": "Welcome to Resonance KB Service", "version": "0.1.0"}
@@ -87,44 +222,148 @@ async def health():
     return {"status": "ok", "service": "Resonance KB Service", "version": "0.1.0"}
 
 
-@app.post("/api/knowledge-base/upload", dependencies=[Depends(require_kb_auth)])
+@app.post("/api/knowledge-base/upload", status_code=202, dependencies=[Depends(require_kb_auth)])
 async def upload_document(
     file: UploadFile = File(...),
     assistant_id: str = None,
 ):
     """
-    Upload and process a document (PDF, text, etc.)
-    Returns document ID and status
+    Upload a document (PDF, text, etc.) for background processing
+    Returns job ID and document ID immediately; poll the job endpoint for progress
     """
     try:
         resolved_assistant_id = normalize_assistant_id(assistant_id)
+        content = await read_upload(file)
+        
+        # Queue document for ingestion (the job deletes the spool file when it finishes)
+        try:
+            job = get_job_queue().submit(
+                content=content,
+                filename=file.filename,
+                assistant_id=resolved_assistant_id,
+                content_type=file.content_type,
+            )
+        except Exception:
+            release_source(content)
+            raise
+        
+        return {
+            "job_id": job.job_id,
+            "document_id": job.document_id,
+            "status": job.status,
+        }
+    except HTTPException:
+        raise
+    except QueueFullError:
+        raise HTTPException(status_code=503, detail="Ingestion queue full, retry later")
+    except Exception as e:
+        logger.exception("Upload failed")
+        raise HTTPException(status_code=500, detail="Internal server error")
 
-        if file.content_type not in ("application/pdf", "text/plain"):
-            raise HTTPException(status_code=415, detail="Unsupported content type")
 
-        # Read file content with a hard cap to reduce DoS risk
-        content = await file.read(MAX_UPLOAD_BYTES + 1)
-        if len(content) > MAX_UPLOAD_BYTES:
-            raise HTTPException(status_code=413, detail="File too large")
+@app.put("/api/knowledge-base/documents", status_code=202, dependencies=[Depends(require_kb_auth)])
+async def update_document(
+    file: UploadFile = File(...),
+    assistant_id: str = None,
+    document_key: str = None,
+):
+    """
+    Create or update a document identified by document_key (defaults to the filename)
+    Only changed chunks are re-embedded; chunks no longer present are deleted
+    """
+    try:
+        resolved_assistant_id = normalize_assistant_id(assistant_id)
+        resolved_document_key = normalize_document_key(document_key, file.filename)
+        content = await read_upload(file)
         
-        # Process document
-        result = await ingest_document(
-            content=content,
-            filename=file.filename,
-            assistant_id=resolved_assistant_id,
-            content_type=file.content_type,
-        )
+        try:
+            job = get_job_queue().submit(
+                content=content,
+                filename=file.filename,
+                assistant_id=resolved_assistant_id,
+                content_type=file.content_type,
+                document_key=resolved_document_key,
+            )
+        except Exception:
+            release_source(content)
+            raise
         
         return {
-            "document_id": result["document_id"],
-            "status": "processed",
-            "chunks": result["chunks"],
+            "job_id": job.job_id,
+            "document_id": job.document_id,
+            "document_key": resolved_document_key,
+            "status": job.status,
         }
     except HTTPException:
         raise
+    except QueueFullError:
+        raise HTTPException(status_code=503, detail="Ingestion queue full, retry later")
     except Exception as e:
-        logger.exception("Upload failed")
+        logger.exception("Document update failed")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+
+@app.post("/api/knowledge-base/bulk", status_code=202, dependencies=[Depends(require_kb_auth)])
+async def bulk_upload(
+    files: List[UploadFile] = File(...),
+    assistant_id: str = None,
+    resume_token: Optional[str] = None,
+):
+    """
+    Upload many documents (PDF/text files and zip/tar archives) as one background job
+    Documents are ingested concurrently and checkpointed per job; re-posting with the
+    resume_token of an interrupted job skips the documents it ingested unchanged
+    """
+    documents: List[BulkDocument] = []
+    submitted = False
+    try:
+        resolved_assistant_id = normalize_assistant_id(assistant_id)
+        if resume_token is not None and not re.fullmatch(r"[A-Za-z0-9_-]{1,64}", resume_token):
+            raise HTTPException(status_code=400, detail="Invalid resume_token")
+        for file in files:
+            documents.extend(await read_bulk_upload(file))
+            if len(documents) > BULK_MAX_DOCUMENTS:
+                raise HTTPException(status_code=413, detail="Too many documents")
+        if not documents:
+            raise HTTPException(status_code=400, detail="No supported documents")
+        # Each key is one keyed document; a repeated key would race on the same records
+        keys = set()
+        for document in documents:
+            if document.document_key in keys:
+                raise HTTPException(status_code=400, detail=f"Duplicate document: {document.document_key}")
+            keys.add(document.document_key)
+        
+        job = get_job_queue().submit_bulk(documents, resolved_assistant_id, resume_token=resume_token)
+        submitted = True
+        
+        return {
+            "job_id": job.job_id,
+            "documents": len(documents),
+            "status": job.status,
+            "resume_token": job.checkpoint_id,
+        }
+    except HTTPException:
+        raise
+    except QueueFullError:
+        raise HTTPException(status_code=503, detail="Ingestion queue full, retry later")
+    except Exception as e:
+        logger.exception("Bulk upload failed")
         raise HTTPException(status_code=500, detail="Internal server error")
+    finally:
+        if not submitted:
+            for document in documents:
+                release_source(document.content)
+
+
+@app.get("/api/knowledge-base/jobs/{job_id}", dependencies=[Depends(require_kb_auth)])
+async def get_ingestion_job(job_id: str):
+    """
+    Report ingestion job status, current stage and chunk counts
+    """
+    job = get_job_queue().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
 
 
 @app.post("/api/knowledge-base/search", dependencies=[Depends(require_kb_auth)])
@@ -152,6 +391,34 @@ async def search_documents(request: SearchRequest):
         raise HTTPException(status_code=500, detail="Internal server error")
 
 
+@app.post("/api/knowledge-base/search/batch", dependencies=[Depends(require_kb_auth)])
+async def search_documents_batch(request: BatchSearchRequest):
+    """
+    Run up to SEARCH_BATCH_MAX_QUERIES searches, optionally across assistants
+    Queries are embedded in one call and searched concurrently; results follow input order
+    """
+    try:
+        searches = []
+        for item in request.queries:
+            assistant_id = item.assistant_id or request.assistant_id
+            if assistant_id is None:
+                raise HTTPException(status_code=422, detail="assistant_id is required for every query")
+            searches.append((item.query, normalize_assistant_id(assistant_id), item.top_k or request.top_k))
+        results = await search_knowledge_base_batch(searches)
+        
+        return {
+            "results": [
+                {"query": query, "assistant_id": assistant_id, "results": found}
+                for (query, assistant_id, _), found in zip(searches, results)
+            ],
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.exception("Batch search failed")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+
 @app.post("/api/knowledge-base/chat", dependencies=[Depends(require_kb_auth)])
 async def chat_with_rag(request: ChatRequest):
     """
@@ -161,14 +428,21 @@ async def chat_with_rag(request: ChatRequest):
     """
     try:
         resolved_assistant_id = normalize_assistant_id(request.assistant_id)
-        # Cap history size defensively (even if client submits more).
-        history = (request.conversation_history or [])[:20]
-        # Step 1: Search knowledge base
-        context_chunks = await search_knowledge_base(
-            query=request.query,
-            assistant_id=resolved_assistant_id,
-            top_k=5,
+        # Step 1: Search knowledge base (and look for a cached answer to a similar question)
+        # while history beyond the token budget is summarized
+        history_task = asyncio.create_task(
+            compact_history(request.conversation_history or [], resolved_assistant_id)
         )
+        try:
+            context_chunks, cached, answer_key = await retrieve_chat_context(request, resolved_assistant_id)
+        except BaseException:
+            history_task.cancel()
+            raise
+        if cached is not None:
+            # A cached answer never waits for (or pays for) the summary
+            history_task.cancel()
+            return {"response": cached.answer, "sources": cached.sources, "cached": True}
+        history = await history_task
         
         # Step 2: Generate response with context
         response = await generate_rag_response(
@@ -177,16 +451,14 @@ async def chat_with_rag(request: ChatRequest):
             conversation_history=history,
             system_prompt=request.system_prompt,
         )
+        sources = chat_sources(context_chunks)
+        if answer_key is not None:
+            get_answer_cache().store(answer_key, response, sources)
         
         return {
             "response": response,
-            "sources": [
-                {
-                    "source": chunk.get("source", "unknown"),
-                    "score": chunk.get("score", 0),
-                }
-                for chunk in context_chunks
-            ],
+            "sources": sources,
+            "cached": False,
         }
     except HTTPException:
         raise
@@ -195,6 +467,99 @@ async def chat_with_rag(request: ChatRequest):
         raise HTTPException(status_code=500, detail="Internal server error")
 
 
+@app.post("/api/knowledge-base/chat/stream", dependencies=[Depends(require_kb_auth)])
+async def chat_with_rag_stream(request: ChatRequest):
+    """
+    Stream a RAG chat response as Server-Sent Events
+    1. "sources" as soon as retrieval finishes
+    2. "token" for each content delta from the LLM
+    3. "done" with token usage and timings (or "error" if generation fails midway)
+    """
+    started = time.perf_counter()
+    try:
+        resolved_assistant_id = normalize_assistant_id(request.assistant_id)
+        # History is summarized while retrieval runs, but only the LLM call waits for it,
+        # so "sources" (and a cached answer) go out without the summarization round-trip
+        history_task = asyncio.create_task(
+            compact_history(request.conversation_history or [], resolved_assistant_id)
+        )
+        try:
+            context_chunks, cached, answer_key = await retrieve_chat_context(request, resolved_assistant_id)
+        except BaseException:
+            history_task.cancel()
+            raise
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.exception("Chat retrieval failed")
+        raise HTTPException(status_code=500, detail="Internal server error")
+    retrieval_ms = (time.perf_counter() - started) * 1000
+
+    async def events():
+        try:
+            async for event in chat_events():
+                yield event
+        finally:
+            history_task.cancel()  # No-op once the summary is done; stops it on a cache hit or disconnect
+
+    async def chat_events():
+        sources = cached.sources if cached is not None else chat_sources(context_chunks)
+        yield sse_event("sources", {"sources": sources})
+        if cached is not None:
+            # The whole cached answer goes out as one token event
+            yield sse_event("token", {"content": cached.answer})
+            total_ms = round((time.perf_counter() - started) * 1000, 1)
+            yield sse_event("done", {
+                "model": None,
+                "finish_reason": "stop",
+                "usage": None,
+                "cached": True,
+                "timing": {"retrieval_ms": round(retrieval_ms, 1), "first_token_ms": total_ms, "total_ms": total_ms},
+            })
+            return
+        first_token_ms = None
+        answer = []
+        try:
+            history = await history_task
+            async for event in stream_rag_response(
+                user_query=request.query,
+                context_chunks=context_chunks,
+                conversation_history=history,
+                system_prompt=request.system_prompt,
+            ):
+                if event["type"] == "delta":
+                    if first_token_ms is None:
+                        first_token_ms = (time.perf_counter() - started) * 1000
+                    answer.append(event["content"])
+                    yield sse_event("token", {"content": event["content"]})
+                else:
+                    # Truncated answers (finish_reason "length") are not reused
+                    if answer_key is not None and event["finish_reason"] == "stop":
+                        get_answer_cache().store(answer_key, "".join(answer), sources)
+                    yield sse_event("done", {
+                        "model": event["model"],
+                        "finish_reason": event["finish_reason"],
+                        "usage": event["usage"],
+                        "cached": False,
+                        "timing": {
+                            "retrieval_ms": round(retrieval_ms, 1),
+                            "first_token_ms": round(first_token_ms, 1) if first_token_ms is not None else None,
+                            "total_ms": round((time.perf_counter() - started) * 1000, 1),
+                        },
+                    })
+        except Exception:
+            # Headers are already sent, so the failure is reported in-band
+            logger.exception("Chat stream failed")
+            yield sse_event("error", {"detail": "Internal server error"})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        # Proxies (e.g. nginx) must not buffer the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 if __name__ == "__main__":
     uvicorn.run(
         "main:app",
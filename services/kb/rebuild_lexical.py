@@ -0,0 +1,45 @@
+"""
+Rebuild the BM25 keyword index of assistants from the vector store
+Backfills chunks ingested before LEXICAL_SEARCH_ENABLED was turned on, or fills the
+local index of a new replica. Chunk text is read back from the vector store, so
+nothing is re-extracted or re-embedded; chunks the store no longer has are dropped.
+
+Usage:
+    python rebuild_lexical.py --assistant-id acme [--assistant-id globex]
+"""
+import argparse
+import asyncio
+import logging
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from services.aio import shutdown_executors
+from services.ingestion import rebuild_lexical_index
+from services.lexical import close_lexical_index
+from services.vector_store import close_vector_store
+
+
+async def rebuild(assistant_ids) -> None:
+    for assistant_id in assistant_ids:
+        chunks = await rebuild_lexical_index(assistant_id)
+        print(f"✓ {assistant_id}: {chunks} chunks indexed")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--assistant-id", action="append", required=True, help="Assistant to rebuild (repeatable)")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    try:
+        asyncio.run(rebuild(args.assistant_id))
+    finally:
+        close_vector_store()
+        close_lexical_index()  # Waits for a background fold of the keyword index
+        shutdown_executors()
+
+
+if __name__ == "__main__":
+    main()
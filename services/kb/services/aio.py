@@ -0,0 +1,88 @@
+"""
+Async execution helpers for blocking SDK calls:
+1. I/O-bound calls (Pinecone SDK) run on a bounded thread pool
+2. CPU-bound work (sentence-transformers encode) runs on a dedicated executor
+3. Pure-Python CPU work (PDF parsing) runs on a process pool to sidestep the GIL
+Keeps the event loop free so health checks and searches stay responsive
+while a large upload is embedding.
+"""
+import asyncio
+import functools
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Optional
+
+# Configuration
+IO_EXECUTOR_WORKERS = int(os.getenv("IO_EXECUTOR_WORKERS", "16"))
+# Encoding is CPU-bound and torch already uses all cores per call; a small pool
+# avoids oversubscribing the CPU while still releasing the event loop.
+CPU_EXECUTOR_WORKERS = int(os.getenv("CPU_EXECUTOR_WORKERS", "1"))
+PROCESS_EXECUTOR_WORKERS = int(os.getenv("PROCESS_EXECUTOR_WORKERS", str(os.cpu_count() or 1)))
+
+_io_executor: Optional[ThreadPoolExecutor] = None
+_cpu_executor: Optional[ThreadPoolExecutor] = None
+_process_executor: Optional[ProcessPoolExecutor] = None
+
+
+def get_io_executor() -> ThreadPoolExecutor:
+    global _io_executor
+    if _io_executor is None:
+        _io_executor = ThreadPoolExecutor(max_workers=IO_EXECUTOR_WORKERS, thread_name_prefix="kb-io")
+    return _io_executor
+
+
+def get_cpu_executor() -> ThreadPoolExecutor:
+    global _cpu_executor
+    if _cpu_executor is None:
+        _cpu_executor = ThreadPoolExecutor(max_workers=CPU_EXECUTOR_WORKERS, thread_name_prefix="kb-cpu")
+    return _cpu_executor
+
+
+def get_process_executor() -> ProcessPoolExecutor:
+    global _process_executor
+    if _process_executor is None:
+        # spawn: forking a process that holds torch/HTTP client threads is unsafe
+        _process_executor = ProcessPoolExecutor(
+            max_workers=PROCESS_EXECUTOR_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _process_executor
+
+
+async def run_io(fn: Callable[..., Any], *args, **kwargs) -> Any:
+    """Run a blocking network call (e.g. Pinecone upsert/query) off the event loop"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_io_executor(), functools.partial(fn, *args, **kwargs))
+
+
+async def run_cpu(fn: Callable[..., Any], *args, **kwargs) -> Any:
+    """Run CPU-bound work (e.g. model.encode) on the dedicated compute executor"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_cpu_executor(), functools.partial(fn, *args, **kwargs))
+
+
+async def run_process(fn: Callable[..., Any], *args, **kwargs) -> Any:
+    """Run a picklable module-level function in the process pool"""
+    global _process_executor
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(get_process_executor(), functools.partial(fn, *args, **kwargs))
+    except BrokenProcessPool:
+        # A worker died (e.g. OOM); replace the pool so later calls can succeed
+        if _process_executor is not None:
+            _process_executor.shutdown(wait=False, cancel_futures=True)
+        _process_executor = None
+        raise
+
+
+def shutdown_executors() -> None:
+    """Stop executor threads and worker processes (called on app shutdown)"""
+    global _io_executor, _cpu_executor, _process_executor
+    for executor in (_io_executor, _cpu_executor, _process_executor):
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+    _io_executor = None
+    _cpu_executor = None
+    _process_executor = None
@@ -0,0 +1,131 @@
+"""
+Approximate nearest-neighbour index for large local namespaces (IVF, pure NumPy):
+1. k-means on a sample of live rows picks nlist centroids (spherical: rows are unit length)
+2. Each row is filed under its nearest centroid; the lists are one row array sorted by list
+3. A query scores the centroids, then only the rows in the nprobe best lists
+4. Rows added after a build are assigned on insert and appended to a small tail file
+Recall rises with nprobe and falls with nlist; both can be tuned per namespace.
+Rows the index does not cover yet are always scanned, so results never miss new chunks.
+"""
+import json
+import os
+import shutil
+from typing import Optional
+
+import numpy as np
+
+from services.local_vector_store import normalize_rows, top_k_indices
+
+# Configuration
+LOCAL_VECTOR_ANN_THRESHOLD = int(os.getenv("LOCAL_VECTOR_ANN_THRESHOLD", "50000"))  # Rows before switching from exact search
+LOCAL_VECTOR_ANN_NPROBE = int(os.getenv("LOCAL_VECTOR_ANN_NPROBE", "16"))  # Lists scanned per query
+LOCAL_VECTOR_ANN_NLIST = int(os.getenv("LOCAL_VECTOR_ANN_NLIST", "0"))  # 0: sqrt(rows)
+LOCAL_VECTOR_ANN_REBUILD_RATIO = float(os.getenv("LOCAL_VECTOR_ANN_REBUILD_RATIO", "0.5"))  # Tail size (vs built rows) that triggers a rebuild
+
+_TRAIN_ITERATIONS = 10
+_TRAIN_SAMPLE_PER_LIST = 32
+_ASSIGN_BLOCK_ROWS = 65536
+
+
+def default_nlist(rows: int) -> int:
+    return max(1, int(np.sqrt(rows)))
+
+
+def assign_lists(centroids: np.ndarray, vectors: np.ndarray) -> np.ndarray:
+    """Nearest centroid (by dot product) of each unit-length row, in blocks to bound memory"""
+    lists = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), _ASSIGN_BLOCK_ROWS):
+        block = np.asarray(vectors[start:start + _ASSIGN_BLOCK_ROWS], dtype=np.float32)
+        lists[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+    return lists
+
+
+def train_centroids(vectors: np.ndarray, rows: np.ndarray, nlist: int, seed: int = 0) -> np.ndarray:
+    """Spherical k-means over a sample of the given rows; returns (nlist, dim) unit centroids"""
+    rng = np.random.default_rng(seed)
+    nlist = max(1, min(nlist, len(rows)))
+    sample_rows = np.sort(rng.choice(rows, size=min(len(rows), nlist * _TRAIN_SAMPLE_PER_LIST), replace=False))
+    sample = np.asarray(vectors[sample_rows], dtype=np.float32)
+    centroids = sample[rng.choice(len(sample), size=nlist, replace=False)].copy()
+    for _ in range(_TRAIN_ITERATIONS):
+        labels = assign_lists(centroids, sample)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, sample)
+        counts = np.bincount(labels, minlength=nlist)
+        # Empty lists are reseeded from random sample rows
+        empty = counts == 0
+        sums[empty] = sample[rng.choice(len(sample), size=int(empty.sum()))]
+        centroids = normalize_rows(sums).astype(np.float32)
+    return centroids
+
+
+class IVFIndex:
+    """
+    One built index inside a segment directory:
+    centroids.f32, order.i64 (row ids sorted by list), bounds.i64 (list start offsets),
+    tail.i32 (lists of rows appended after the build), index.json (nlist, built rows)
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, "index.json"), "r", encoding="utf-8") as f:
+            header = json.load(f)
+        self.nlist = header["nlist"]
+        self.built_rows = header["rows"]
+        self.centroids = np.fromfile(os.path.join(path, "centroids.f32"), dtype=np.float32).reshape(self.nlist, -1)
+        self.bounds = np.fromfile(os.path.join(path, "bounds.i64"), dtype=np.int64)
+        if self.built_rows:
+            self.order = np.memmap(os.path.join(path, "order.i64"), dtype=np.int64, mode="r", shape=(self.built_rows,))
+        else:
+            self.order = np.zeros(0, dtype=np.int64)
+        self.tail = np.fromfile(os.path.join(path, "tail.i32"), dtype=np.int32)
+
+    @property
+    def covered_rows(self) -> int:
+        return self.built_rows + len(self.tail)
+
+    def candidates(self, query: np.ndarray, nprobe: int, rows: int) -> np.ndarray:
+        """Rows to score exactly for a unit query: the nprobe nearest lists plus uncovered rows"""
+        probes = top_k_indices(self.centroids @ query, nprobe)
+        parts = [self.order[self.bounds[i]:self.bounds[i + 1]] for i in probes]
+        parts.append(self.built_rows + np.flatnonzero(np.isin(self.tail, probes)))
+        parts.append(np.arange(self.covered_rows, rows, dtype=np.int64))
+        candidates = np.concatenate(parts).astype(np.int64, copy=False)
+        return candidates[candidates < rows]
+
+    def row_lists(self) -> np.ndarray:
+        """List of every covered row, indexed by row"""
+        lists = np.empty(self.covered_rows, dtype=np.int32)
+        lists[np.asarray(self.order)] = np.repeat(np.arange(self.nlist, dtype=np.int32), np.diff(self.bounds))
+        lists[self.built_rows:] = self.tail
+        return lists
+
+    def append(self, lists: np.ndarray) -> None:
+        """Record the lists of rows appended to the segment (must directly follow covered_rows)"""
+        with open(os.path.join(self.path, "tail.i32"), "ab") as f:
+            f.write(np.asarray(lists, dtype=np.int32).tobytes())
+
+
+def write_index(path: str, centroids: np.ndarray, lists: np.ndarray, tail: np.ndarray) -> None:
+    """Write a new index directory (replacing any previous one at the same path)"""
+    nlist = len(centroids)
+    tmp = path + ".tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    order = np.argsort(lists, kind="stable").astype(np.int64)
+    bounds = np.concatenate([[0], np.cumsum(np.bincount(lists, minlength=nlist))]).astype(np.int64)
+    np.ascontiguousarray(centroids, dtype=np.float32).tofile(os.path.join(tmp, "centroids.f32"))
+    order.tofile(os.path.join(tmp, "order.i64"))
+    bounds.tofile(os.path.join(tmp, "bounds.i64"))
+    np.asarray(tail, dtype=np.int32).tofile(os.path.join(tmp, "tail.i32"))
+    with open(os.path.join(tmp, "index.json"), "w", encoding="utf-8") as f:
+        json.dump({"nlist": nlist, "rows": len(lists)}, f)
+    shutil.rmtree(path, ignore_errors=True)
+    os.rename(tmp, path)
+
+
+def open_index(path: str) -> Optional[IVFIndex]:
+    try:
+        return IVFIndex(path)
+    except (FileNotFoundError, ValueError, KeyError):
+        return None  # Not built yet, or replaced while opening
@@ -0,0 +1,163 @@
+"""
+Semantic answer cache:
+1. Chat answers are cached per assistant together with the query vector used for retrieval
+2. A question reuses a cached answer when its vector is within ANSWER_CACHE_MIN_SIMILARITY
+   (cosine) of the cached question's, and retrieval returned the same chunks and the
+   system prompt is the same, so the answer rests on the same context
+3. Entries share one byte budget (LRU) and expire after ANSWER_CACHE_TTL_SECONDS
+4. Ingesting into an assistant drops its entries; an answer generated while an ingest
+   ran is not stored (same generation scheme as the search result cache)
+Only first turns are cached: with conversation history, a paraphrase can still need a different answer.
+Queries need a vector from the local or OpenAI provider (Pinecone embeds queries server-side).
+"""
+import hashlib
+import itertools
+import os
+from dataclasses import dataclass
+from typing import Dict, FrozenSet, List, Optional, Tuple
+
+import numpy as np
+
+from services import embeddings
+from services.memory_cache import LRUCache
+
+# Configuration
+ANSWER_CACHE_MAX_BYTES = int(os.getenv("ANSWER_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))  # 0 disables
+ANSWER_CACHE_TTL_SECONDS = float(os.getenv("ANSWER_CACHE_TTL_SECONDS", "3600"))
+ANSWER_CACHE_MIN_SIMILARITY = float(os.getenv("ANSWER_CACHE_MIN_SIMILARITY", "0.95"))
+
+# Approximate per-entry overhead on top of the answer and vector (dataclass, ids, sources)
+_ANSWER_OVERHEAD_BYTES = 512
+
+
+@dataclass
+class CachedAnswer:
+    answer: str
+    sources: List[Dict]
+    chunk_ids: FrozenSet[str]
+    system_prompt: Optional[str]
+    vector: np.ndarray
+
+
+@dataclass
+class AnswerKey:
+    """What a fresh answer is stored under (returned by lookup, like a result cache key)"""
+    assistant_id: str
+    generation: int
+    vector: np.ndarray
+    chunk_ids: FrozenSet[str]
+    system_prompt: Optional[str]
+
+
+def chunk_ids(chunks: List[Dict]) -> FrozenSet[str]:
+    """Identity of the retrieved context: document, chunk position and a digest of the text"""
+    return frozenset(
+        f"{chunk.get('document_id')}:{chunk.get('chunk_index')}:"
+        f"{hashlib.sha256((chunk.get('content') or '').encode('utf-8')).hexdigest()[:16]}"
+        for chunk in chunks
+    )
+
+
+class AnswerCache:
+    """Per-process answer cache; vectors are indexed per assistant, entries live in one LRU"""
+
+    def __init__(
+        self,
+        max_bytes: Optional[int] = None,
+        ttl_seconds: Optional[float] = None,
+        min_similarity: Optional[float] = None,
+    ):
+        self.entries = LRUCache(
+            max_bytes=ANSWER_CACHE_MAX_BYTES if max_bytes is None else max_bytes,
+            ttl_seconds=ANSWER_CACHE_TTL_SECONDS if ttl_seconds is None else ttl_seconds,
+        )
+        self.min_similarity = ANSWER_CACHE_MIN_SIMILARITY if min_similarity is None else min_similarity
+        self._keys: Dict[str, List[Tuple[str, int]]] = {}  # Entry keys per assistant
+        self._generations: Dict[str, int] = {}
+        self._ids = itertools.count()
+
+    def lookup(
+        self,
+        assistant_id: str,
+        query_vector: List[float],
+        chunks: List[Dict],
+        system_prompt: Optional[str] = None,
+    ) -> Tuple[Optional[CachedAnswer], AnswerKey]:
+        """Return (cached answer or None, key to store a fresh answer under)"""
+        vector = np.asarray(query_vector, dtype=np.float32)
+        vector = vector / (np.linalg.norm(vector) or 1.0)
+        answer_key = AnswerKey(
+            assistant_id=assistant_id,
+            generation=self._generations.get(assistant_id, 0),
+            vector=vector,
+            chunk_ids=chunk_ids(chunks),
+            system_prompt=system_prompt,
+        )
+
+        # Evicted and expired entries leave the assistant's key list as it is scanned
+        live = []
+        for key in self._keys.get(assistant_id, []):
+            entry = self.entries.peek(key)
+            if entry is not None:
+                live.append((key, entry))
+        if live:
+            self._keys[assistant_id] = [key for key, _ in live]
+        else:
+            self._keys.pop(assistant_id, None)
+            return None, answer_key
+
+        similarities = np.stack([entry.vector for _, entry in live]) @ vector
+        for i in np.argsort(-similarities):
+            if similarities[i] < self.min_similarity:
+                break
+            key, entry = live[i]
+            if entry.chunk_ids == answer_key.chunk_ids and entry.system_prompt == system_prompt:
+                self.entries.get(key)  # Counts the hit and refreshes recency
+                return entry, answer_key
+        return None, answer_key
+
+    def store(self, answer_key: AnswerKey, answer: str, sources: List[Dict]) -> None:
+        if answer_key.generation != self._generations.get(answer_key.assistant_id, 0):
+            return  # The assistant ingested since retrieval; the answer may be stale
+        key = (answer_key.assistant_id, next(self._ids))
+        entry = CachedAnswer(
+            answer=answer,
+            sources=[dict(source) for source in sources],
+            chunk_ids=answer_key.chunk_ids,
+            system_prompt=answer_key.system_prompt,
+            vector=answer_key.vector,
+        )
+        size = (
+            len(answer.encode("utf-8"))
+            + len(answer_key.system_prompt or "")
+            + answer_key.vector.nbytes
+            + 64 * len(answer_key.chunk_ids)
+            + _ANSWER_OVERHEAD_BYTES
+        )
+        self.entries.put(key, entry, size=size)
+        self._keys.setdefault(answer_key.assistant_id, []).append(key)
+
+    def invalidate(self, assistant_id: str) -> None:
+        self._generations[assistant_id] = self._generations.get(assistant_id, 0) + 1
+        for key in self._keys.pop(assistant_id, []):
+            self.entries.delete(key)
+
+
+# Process-wide cache used by the chat endpoints and invalidated by ingestion
+_answer_cache: Optional[AnswerCache] = None
+
+
+def get_answer_cache() -> Optional[AnswerCache]:
+    """Shared answer cache, or None when disabled (ANSWER_CACHE_MAX_BYTES=0 or Pinecone embeddings)"""
+    global _answer_cache
+    if ANSWER_CACHE_MAX_BYTES <= 0 or embeddings.EMBEDDING_PROVIDER == "pinecone":
+        return None
+    if _answer_cache is None:
+        _answer_cache = AnswerCache()
+    return _answer_cache
+
+
+def invalidate_answers(assistant_id: str) -> None:
+    """Drop cached answers for an assistant after its records change"""
+    if _answer_cache is not None:
+        _answer_cache.invalidate(assistant_id)
@@ -0,0 +1,130 @@
+"""
+Dynamic micro-batching for local embedding models:
+1. Callers submit texts and await their own vectors
+2. Concurrent requests are gathered into one batch (up to max_batch_size)
+3. A partial batch is dispatched once its oldest item has waited max_wait_ms
+4. Query embeddings jump ahead of queued document chunks
+One encode() call over many texts uses the CPU's SIMD throughput far better
+than many single-string calls.
+"""
+import asyncio
+import os
+import time
+from collections import deque
+from typing import Callable, Deque, List, Optional, Tuple
+
+import numpy as np
+
+from services.aio import run_cpu
+
+# Configuration
+LOCAL_EMBEDDING_MAX_BATCH = int(os.getenv("LOCAL_EMBEDDING_MAX_BATCH", "32"))
+LOCAL_EMBEDDING_MAX_WAIT_MS = float(os.getenv("LOCAL_EMBEDDING_MAX_WAIT_MS", "5"))
+LOCAL_EMBEDDING_MAX_INFLIGHT = int(os.getenv("LOCAL_EMBEDDING_MAX_INFLIGHT", "1"))
+
+# (text, future, enqueued_at)
+_Item = Tuple[str, asyncio.Future, float]
+
+
+class EmbeddingBatcher:
+    """
+    Gathers concurrent embedding requests into batched encode calls.
+    encode: blocking function mapping a list of texts to a 2D array (runs on the CPU executor)
+    """
+
+    def __init__(
+        self,
+        encode: Callable[[List[str]], np.ndarray],
+        max_batch_size: int = LOCAL_EMBEDDING_MAX_BATCH,
+        max_wait_ms: float = LOCAL_EMBEDDING_MAX_WAIT_MS,
+        max_inflight: int = LOCAL_EMBEDDING_MAX_INFLIGHT,
+    ):
+        self.encode = encode
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000
+        self.max_inflight = max(1, max_inflight)
+        self.batches_dispatched = 0
+        self._queries: Deque[_Item] = deque()
+        self._chunks: Deque[_Item] = deque()
+        self._inflight = 0
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    async def embed(self, texts: List[str], priority: bool = False) -> np.ndarray:
+        """Embed a list of texts; returns one row per text, in order"""
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+        futures = self._enqueue(texts, priority)
+        vectors = await asyncio.gather(*futures)
+        return np.stack(vectors)
+
+    async def embed_one(self, text: str) -> np.ndarray:
+        """Embed a single query string (served ahead of document chunks)"""
+        (future,) = self._enqueue([text], priority=True)
+        return await future
+
+    def _enqueue(self, texts: List[str], priority: bool) -> List[asyncio.Future]:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # New event loop (e.g. between test runs): drop state bound to the old one
+            self._loop = loop
+            self._queries.clear()
+            self._chunks.clear()
+            self._inflight = 0
+            self._timer = None
+
+        now = time.monotonic()
+        target = self._queries if priority else self._chunks
+        futures = []
+        for text in texts:
+            future = loop.create_future()
+            target.append((text, future, now))
+            futures.append(future)
+        self._dispatch()
+        return futures
+
+    def _pending(self) -> int:
+        return len(self._queries) + len(self._chunks)
+
+    def _oldest_enqueued_at(self) -> float:
+        return min(queue[0][2] for queue in (self._queries, self._chunks) if queue)
+
+    def _dispatch(self) -> None:
+        """Start as many batches as allowed; otherwise arm the max-wait timer"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        while self._pending() and self._inflight < self.max_inflight:
+            wait_left = self._oldest_enqueued_at() + self.max_wait - time.monotonic()
+            if self._pending() < self.max_batch_size and wait_left > 0:
+                self._timer = self._loop.call_later(wait_left, self._dispatch)
+                return
+            batch = self._take_batch()
+            self._inflight += 1
+            self.batches_dispatched += 1
+            self._loop.create_task(self._run_batch(batch))
+
+    def _take_batch(self) -> List[_Item]:
+        batch = []
+        for queue in (self._queries, self._chunks):
+            while queue and len(batch) < self.max_batch_size:
+                batch.append(queue.popleft())
+        return batch
+
+    async def _run_batch(self, batch: List[_Item]) -> None:
+        # Skip texts whose callers went away before the batch started
+        live = [item for item in batch if not item[1].done()]
+        try:
+            if live:
+                vectors = await run_cpu(self.encode, [text for text, _, _ in live])
+                for (_, future, _), vector in zip(live, vectors):
+                    if not future.done():
+                        future.set_result(vector)
+        except Exception as e:
+            for _, future, _ in live:
+                if not future.done():
+                    future.set_exception(e)
+        finally:
+            self._inflight -= 1
+            self._dispatch()
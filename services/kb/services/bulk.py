@@ -0,0 +1,339 @@
+"""
+Bulk ingestion of many documents (API bulk endpoint and offline CLI):
+1. Archives (zip/tar) are expanded member by member into spool files
+2. Several documents are ingested concurrently, so one document's extraction
+   overlaps another's embedding and upserts (local embeddings share micro-batches)
+3. Each finished document is appended to the run's checkpoint; resuming an interrupted run
+   skips documents finished unchanged, and a run that completes removes its checkpoint
+4. Throughput (docs/s, chunks/s) is tracked for progress reporting
+Documents are ingested as keyed documents, so reruns never duplicate chunks.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import posixpath
+import tarfile
+import time
+import zipfile
+from dataclasses import dataclass, field
+from io import BytesIO
+from typing import Callable, Dict, Iterable, List, Optional
+
+from services.aio import run_io
+from services.ingestion import ingest_document
+from services.pipeline import iterate_blocking
+from services.spool import (
+    UPLOAD_SPOOL_DIR,
+    DocumentSource,
+    SpooledUpload,
+    open_source,
+    release_source,
+    spool_file,
+)
+
+logger = logging.getLogger("resonance.kb.bulk")
+
+# Configuration
+BULK_INGEST_CONCURRENCY = int(os.getenv("BULK_INGEST_CONCURRENCY", "4"))  # Documents in flight per bulk run
+BULK_MAX_DOCUMENTS = int(os.getenv("BULK_MAX_DOCUMENTS", "1000"))
+BULK_MAX_ARCHIVE_BYTES = int(os.getenv("BULK_MAX_ARCHIVE_BYTES", str(500 * 1024 * 1024)))  # 500 MiB
+BULK_CHECKPOINT_DIR = os.path.expanduser(os.getenv("BULK_CHECKPOINT_DIR", "~/.cache/resonance-kb/bulk"))
+
+CONTENT_TYPES = {
+    ".pdf": "application/pdf",
+    ".txt": "text/plain",
+    ".md": "text/plain",
+}
+ARCHIVE_SUFFIXES = (".zip", ".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tar.xz")
+
+
+class BulkLimitError(ValueError):
+    """Raised when a bulk request has too many documents"""
+
+
+class InvalidArchiveError(ValueError):
+    """Raised when an uploaded archive cannot be read"""
+
+
+@dataclass
+class BulkDocument:
+    document_key: str  # Relative path; stable identity for incremental updates
+    filename: str
+    content_type: str
+    content: DocumentSource
+
+
+@dataclass
+class BulkStats:
+    documents_total: int = 0
+    documents_done: int = 0
+    documents_skipped: int = 0  # Unchanged since the checkpoint
+    documents_failed: int = 0
+    chunks: int = 0
+    chunks_added: int = 0
+    chunks_removed: int = 0
+    chunks_failed: int = 0
+    failures: List[Dict] = field(default_factory=list)
+    started_at: float = field(default_factory=time.time)
+    finished_at: Optional[float] = None
+
+    @property
+    def elapsed(self) -> float:
+        return max(1e-9, (self.finished_at or time.time()) - self.started_at)
+
+    @property
+    def docs_per_second(self) -> float:
+        return self.documents_done / self.elapsed
+
+    @property
+    def chunks_per_second(self) -> float:
+        return self.chunks / self.elapsed
+
+    def summary(self) -> str:
+        return (
+            f"{self.documents_done}/{self.documents_total} docs ({self.documents_skipped} unchanged, "
+            f"{self.documents_failed} failed), {self.chunks} chunks in {self.elapsed:.1f}s "
+            f"({self.docs_per_second:.2f} docs/s, {self.chunks_per_second:.1f} chunks/s)"
+        )
+
+    def to_dict(self) -> Dict:
+        return {
+            "documents_total": self.documents_total,
+            "documents_done": self.documents_done,
+            "documents_skipped": self.documents_skipped,
+            "documents_failed": self.documents_failed,
+            "chunks": self.chunks,
+            "chunks_added": self.chunks_added,
+            "chunks_removed": self.chunks_removed,
+            "chunks_failed": self.chunks_failed,
+            "failures": self.failures,
+            "elapsed_seconds": round(self.elapsed, 3),
+            "docs_per_second": round(self.docs_per_second, 3),
+            "chunks_per_second": round(self.chunks_per_second, 3),
+        }
+
+
+class BulkCheckpoint:
+    """
+    Append-only JSON-lines record of ingested documents: {key, fingerprint, document_id, chunks}.
+    Appends are line-sized, so an interrupted run loses at most the line being written.
+    """
+
+    def __init__(self, path: str, resume: bool = True):
+        self.path = path
+        self._done: Dict[str, str] = {}
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        if resume and os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                        self._done[entry["key"]] = entry["fingerprint"]
+                    except (ValueError, KeyError):
+                        continue  # Torn last line from an interrupted run
+
+    def is_done(self, key: str, fingerprint: str) -> bool:
+        return self._done.get(key) == fingerprint
+
+    def mark_done(self, key: str, fingerprint: str, document_id: str, chunks: int) -> None:
+        entry = {"key": key, "fingerprint": fingerprint, "document_id": document_id, "chunks": chunks}
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry) + "\n")
+        self._done[key] = fingerprint
+
+    def clear(self) -> None:
+        """Forget every document (the run completed, so there is nothing to resume)"""
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+        self._done.clear()
+
+
+def checkpoint_path(assistant_id: str, run_id: Optional[str] = None) -> str:
+    """Checkpoint file of one bulk run (bulk jobs), or the assistant's CLI checkpoint when run_id is None"""
+    if run_id is None:
+        return os.path.join(BULK_CHECKPOINT_DIR, f"{assistant_id}.jsonl")
+    return os.path.join(BULK_CHECKPOINT_DIR, assistant_id, f"{run_id}.jsonl")
+
+
+def detect_content_type(name: str) -> Optional[str]:
+    return CONTENT_TYPES.get(os.path.splitext(name)[1].lower())
+
+
+def is_archive(name: str) -> bool:
+    return name.lower().endswith(ARCHIVE_SUFFIXES)
+
+
+def fingerprint(source: DocumentSource) -> str:
+    """sha256 of a document's bytes (blocking; spool files are hashed through the mmap)"""
+    digest = hashlib.sha256()
+    with open_source(source) as stream:
+        while True:
+            piece = stream.read(1024 * 1024)
+            if not piece:
+                break
+            digest.update(piece)
+    return digest.hexdigest()
+
+
+def expand_archive(
+    archive: DocumentSource,
+    archive_name: str,
+    max_member_bytes: int,
+    max_documents: int = BULK_MAX_DOCUMENTS,
+    spool_dir: Optional[str] = UPLOAD_SPOOL_DIR,
+) -> List[BulkDocument]:
+    """
+    Spool each supported member of a zip/tar archive to its own file (blocking).
+    Unsupported members are skipped; member sizes are enforced while reading.
+    Document keys are "<archive_name>/<member path>".
+    """
+    documents: List[BulkDocument] = []
+
+    def add(member_name: str, fileobj) -> None:
+        member_name = posixpath.normpath(member_name.replace("\\", "/")).lstrip("/")
+        content_type = detect_content_type(member_name)
+        if content_type is None or member_name.startswith(".."):
+            return
+        if len(documents) >= max_documents:
+            raise BulkLimitError(f"Archive has more than {max_documents} documents")
+        spooled = spool_file(fileobj, max_member_bytes, spool_dir=spool_dir)
+        documents.append(BulkDocument(
+            document_key=f"{archive_name}/{member_name}",
+            filename=posixpath.basename(member_name),
+            content_type=content_type,
+            content=spooled,
+        ))
+
+    # A plain file handle: zipfile needs a full file object, which mmap is not
+    stream = open(archive.path, "rb") if isinstance(archive, SpooledUpload) else BytesIO(archive)
+    try:
+        with stream:
+            if archive_name.lower().endswith(".zip"):
+                with zipfile.ZipFile(stream) as zf:
+                    for info in zf.infolist():
+                        if not info.is_dir():
+                            with zf.open(info) as member:
+                                add(info.filename, member)
+            else:
+                # Streaming mode: members are read in order without seeking back
+                with tarfile.open(fileobj=stream, mode="r|*") as tf:
+                    for info in tf:
+                        if info.isfile():
+                            add(info.name, tf.extractfile(info))
+    except (zipfile.BadZipFile, tarfile.TarError, EOFError) as e:
+        for document in documents:
+            release_source(document.content)
+        raise InvalidArchiveError(f"Cannot read archive {archive_name}") from e
+    except BaseException:
+        for document in documents:
+            release_source(document.content)
+        raise
+    return documents
+
+
+def iter_directory(root: str) -> Iterable[BulkDocument]:
+    """
+    Supported files under a directory, read in place (never deleted), in sorted order.
+    Archives are expanded into spool files. Hidden files and directories are skipped.
+    """
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(d for d in dirnames if not d.startswith("."))
+        for name in sorted(filenames):
+            if name.startswith("."):
+                continue
+            path = os.path.join(dirpath, name)
+            key = os.path.relpath(path, root).replace(os.sep, "/")
+            if is_archive(name):
+                archive = SpooledUpload(path=path, size=os.path.getsize(path), temporary=False)
+                yield from expand_archive(archive, key, max_member_bytes=BULK_MAX_ARCHIVE_BYTES)
+                continue
+            content_type = detect_content_type(name)
+            if content_type is not None:
+                source = SpooledUpload(path=path, size=os.path.getsize(path), temporary=False)
+                yield BulkDocument(document_key=key, filename=name, content_type=content_type, content=source)
+
+
+async def run_bulk_ingest(
+    documents: Iterable[BulkDocument],
+    assistant_id: str,
+    checkpoint: Optional[BulkCheckpoint] = None,
+    concurrency: int = BULK_INGEST_CONCURRENCY,
+    stats: Optional[BulkStats] = None,
+    on_document_done: Optional[Callable[[BulkDocument, BulkStats], None]] = None,
+) -> BulkStats:
+    """
+    Ingest documents with up to `concurrency` in flight.
+    A failing document is recorded in stats.failures and does not stop the run.
+    Each document's spool file is released once it is processed.
+    The checkpoint is removed once every document is ingested in full.
+    """
+    stats = stats or BulkStats()
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def ingest_one(document: BulkDocument) -> None:
+        try:
+            digest = await run_io(fingerprint, document.content)
+            if checkpoint is not None and checkpoint.is_done(document.document_key, digest):
+                stats.documents_skipped += 1
+            else:
+                result = await ingest_document(
+                    content=document.content,
+                    filename=document.filename,
+                    assistant_id=assistant_id,
+                    content_type=document.content_type,
+                    document_key=document.document_key,
+                )
+                stats.chunks += result["chunks"]
+                stats.chunks_added += result.get("chunks_added", result["chunks"])
+                stats.chunks_removed += result.get("chunks_removed", 0)
+                stats.chunks_failed += result.get("chunks_failed", 0)
+                # Partially upserted documents are not checkpointed, so a rerun retries them
+                if checkpoint is not None and not result.get("chunks_failed"):
+                    await run_io(
+                        checkpoint.mark_done, document.document_key, digest, result["document_id"], result["chunks"]
+                    )
+            stats.documents_done += 1
+        except Exception as e:
+            logger.warning("Bulk ingest of %s failed: %s", document.document_key, type(e).__name__)
+            stats.documents_failed += 1
+            stats.failures.append({"document_key": document.document_key, "error": type(e).__name__})
+        finally:
+            release_source(document.content)
+            semaphore.release()
+        if on_document_done:
+            on_document_done(document, stats)
+
+    sized = hasattr(documents, "__len__")
+    if sized and not stats.documents_total:
+        stats.documents_total = len(documents)
+
+    async def produce():
+        if sized:
+            for document in documents:
+                yield document
+        else:
+            # Lazy sources (directory walks, archive expansion) do blocking I/O
+            async for document in iterate_blocking(iter(documents)):
+                yield document
+
+    tasks = []
+    try:
+        async for document in produce():
+            if not sized:
+                stats.documents_total += 1
+            # Acquire before creating the task so lazily produced documents are not all spooled at once
+            await semaphore.acquire()
+            tasks.append(asyncio.create_task(ingest_one(document)))
+        await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    stats.finished_at = time.time()
+    if checkpoint is not None and not stats.documents_failed and not stats.chunks_failed:
+        await run_io(checkpoint.clear)
+    return stats
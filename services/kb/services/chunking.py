@@ -0,0 +1,171 @@
+"""
+Token-accurate text chunking:
+1. Tokenize once with the active embedding model's tokenizer (char offsets per token)
+2. Pack tokens into windows that fill the model's token budget
+3. Prefer breaking at paragraph, then sentence boundaries in the second half of a window
+4. Emit chunks as (start, end) character offsets; text is sliced once per chunk
+Runs in linear time over the document regardless of overlap.
+"""
+import itertools
+import logging
+import re
+from functools import lru_cache
+from typing import Iterator, List, Tuple
+
+import numpy as np
+
+logger = logging.getLogger("resonance.kb.chunking")
+
+# Maximum input tokens per embedding model (used when the tokenizer cannot tell us)
+MODEL_MAX_TOKENS = {
+    "all-MiniLM-L6-v2": 256,
+    "all-MiniLM-L12-v2": 256,
+    "all-mpnet-base-v2": 384,
+    "text-embedding-3-small": 8191,
+    "text-embedding-3-large": 8191,
+    "llama-text-embed-v2": 2048,
+    "multilingual-e5-large": 507,
+}
+DEFAULT_MAX_TOKENS = 512
+
+_PARAGRAPH_BREAK = re.compile(r"\n[ \t]*\n")
+_SENTENCE_END = re.compile(r"[.!?](?=\s)|\n")
+# Approximate subword tokens: words split into pieces of up to 4 chars, punctuation separate.
+# Slightly over-counts real BPE/WordPiece tokens, so chunks never overshoot the model window.
+_APPROX_TOKEN = re.compile(r"\w{1,4}|[^\w\s]")
+
+
+class Tokenizer:
+    """Maps text to per-token character offsets"""
+
+    def __init__(self, name: str, max_tokens: int):
+        self.name = name
+        self.max_tokens = max_tokens
+
+    def token_spans(self, text: str) -> Tuple[np.ndarray, np.ndarray]:
+        """Return (starts, ends) character offsets of each token"""
+        raise NotImplementedError
+
+    def count(self, text: str) -> int:
+        return len(self.token_spans(text)[0])
+
+
+class ApproximateTokenizer(Tokenizer):
+    """Regex tokenizer used when no model tokenizer is available"""
+
+    def token_spans(self, text: str) -> Tuple[np.ndarray, np.ndarray]:
+        flat = np.fromiter(
+            itertools.chain.from_iterable(m.span() for m in _APPROX_TOKEN.finditer(text)), dtype=np.int64
+        )
+        spans = flat.reshape(-1, 2)
+        return spans[:, 0], spans[:, 1]
+
+
+class HuggingFaceTokenizer(Tokenizer):
+    """Fast (Rust) tokenizer from sentence-transformers / transformers"""
+
+    def __init__(self, tokenizer, max_tokens: int, name: str = "huggingface"):
+        # [CLS] and [SEP] count against the model window
+        special = tokenizer.num_special_tokens_to_add() if hasattr(tokenizer, "num_special_tokens_to_add") else 2
+        super().__init__(name, max(1, max_tokens - special))
+        self.tokenizer = tokenizer
+
+    def token_spans(self, text: str) -> Tuple[np.ndarray, np.ndarray]:
+        encoding = self.tokenizer(
+            text,
+            add_special_tokens=False,
+            return_offsets_mapping=True,
+            return_attention_mask=False,
+            verbose=False,
+        )
+        spans = np.array(encoding["offset_mapping"], dtype=np.int64).reshape(-1, 2)
+        return spans[:, 0], spans[:, 1]
+
+
+class TiktokenTokenizer(Tokenizer):
+    """OpenAI BPE tokenizer"""
+
+    def __init__(self, encoding, max_tokens: int, name: str):
+        super().__init__(name, max_tokens)
+        self.encoding = encoding
+
+    def token_spans(self, text: str) -> Tuple[np.ndarray, np.ndarray]:
+        tokens = self.encoding.encode(text, disallowed_special=())
+        decoded, starts = self.encoding.decode_with_offsets(tokens)
+        if decoded != text:
+            # Tokens splitting a multi-byte character do not round-trip; offsets would be unreliable
+            return ApproximateTokenizer(self.name, self.max_tokens).token_spans(text)
+        starts = np.array(starts, dtype=np.int64)
+        ends = np.append(starts[1:], len(text)) if len(starts) else starts
+        return starts, ends
+
+    def count(self, text: str) -> int:
+        return len(self.encoding.encode(text, disallowed_special=()))
+
+
+@lru_cache(maxsize=None)
+def get_tokenizer(model_name: str) -> Tokenizer:
+    """
+    Cached tokenizer for an API-hosted embedding model.
+    Local sentence-transformers models wrap their own tokenizer (see HuggingFaceTokenizer).
+    """
+    max_tokens = MODEL_MAX_TOKENS.get(model_name, DEFAULT_MAX_TOKENS)
+    if model_name.startswith("text-embedding-"):
+        try:
+            import tiktoken
+            return TiktokenTokenizer(tiktoken.encoding_for_model(model_name), max_tokens, model_name)
+        except Exception:
+            logger.warning("tiktoken unavailable for %s; using approximate token counts", model_name)
+    return ApproximateTokenizer(model_name, max_tokens)
+
+
+def iter_chunk_spans(
+    text: str,
+    tokenizer: Tokenizer,
+    chunk_tokens: int,
+    overlap: float = 0.2,
+) -> Iterator[Tuple[int, int, int]]:
+    """
+    Yield (start_char, end_char, token_count) for each chunk.
+    chunk_tokens is capped at the tokenizer's model window.
+    """
+    starts, ends = tokenizer.token_spans(text)
+    n = len(starts)
+    if n == 0:
+        return
+
+    budget = max(1, min(chunk_tokens, tokenizer.max_tokens))
+    overlap_tokens = min(int(budget * overlap), budget - 1)
+    min_break = max(1, budget // 2)  # Only break early if at least half the window is used
+
+    # For every token index k: the last token <= k that ends a paragraph / sentence (-1 if none)
+    last_paragraph = _last_boundary_token(ends, [m.start() for m in _PARAGRAPH_BREAK.finditer(text)], n)
+    last_sentence = _last_boundary_token(ends, [m.end() for m in _SENTENCE_END.finditer(text)], n)
+
+    first = 0
+    while first < n:
+        limit = first + budget  # Exclusive token index
+        if limit >= n:
+            yield int(starts[first]), int(ends[n - 1]), n - first
+            return
+
+        stop = limit
+        for boundaries in (last_paragraph, last_sentence):
+            candidate = boundaries[limit - 1] + 1
+            if candidate - first >= min_break:
+                stop = candidate
+                break
+
+        yield int(starts[first]), int(ends[stop - 1]), stop - first
+        first = max(first + 1, stop - overlap_tokens)
+
+
+def _last_boundary_token(ends: np.ndarray, boundary_chars: List[int], n: int) -> np.ndarray:
+    marks = np.full(n, -1, dtype=np.int64)
+    if boundary_chars:
+        # Token ending at or before each boundary character
+        idx = np.searchsorted(ends, np.array(boundary_chars, dtype=np.int64), side="right") - 1
+        idx = idx[idx >= 0]
+        marks[idx] = idx
+    return np.maximum.accumulate(marks)
+
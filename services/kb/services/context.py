@@ -0,0 +1,174 @@
+"""
+Token-budgeted context packing for RAG prompts:
+1. Chunks are taken in ranking order until RAG_CONTEXT_TOKEN_BUDGET (counted with the LLM's tokenizer) is spent
+2. Text a chunk shares with an already packed neighbour of the same document costs nothing,
+   since chunks overlap (CHUNK_OVERLAP) and the shared text is only sent once
+3. Overlaps come from the chunks' start/end offsets, verified against their text
+   (offsets of keyed documents can predate an edit); without offsets the text itself is matched
+4. Packed chunks of a document that overlap or touch are merged into one passage
+Passages keep the best score of their chunks and are emitted in ranking order
+(the hybrid fused_score when retrieval provides one, else the similarity score).
+"""
+import os
+from functools import lru_cache
+from typing import Dict, List, Optional
+
+from services.chunking import ApproximateTokenizer, TiktokenTokenizer, Tokenizer
+
+# Configuration
+RAG_CONTEXT_TOKEN_BUDGET = int(os.getenv("RAG_CONTEXT_TOKEN_BUDGET", "3000"))  # Knowledge-base tokens per prompt
+
+# Shortest shared prefix/suffix treated as chunk overlap when matching text without offsets
+MIN_OVERLAP_CHARS = 32
+
+
+@lru_cache(maxsize=None)
+def get_llm_tokenizer(model_name: str) -> Tokenizer:
+    """Tokenizer of a chat model: tiktoken for OpenAI models, else approximate (counts run slightly high)"""
+    try:
+        import tiktoken
+        return TiktokenTokenizer(tiktoken.encoding_for_model(model_name), RAG_CONTEXT_TOKEN_BUDGET, model_name)
+    except Exception:
+        # Ollama models are not known to tiktoken; over-counting keeps prompts inside the budget
+        return ApproximateTokenizer(model_name, RAG_CONTEXT_TOKEN_BUDGET)
+
+
+def rank_score(chunk: Dict) -> float:
+    """Score chunks are ranked by: the fused hybrid score when present, else the similarity"""
+    fused = chunk.get("fused_score")
+    return fused if fused is not None else chunk.get("score") or 0.0
+
+
+def source_header(chunk: Dict) -> str:
+    return f"[Source: {chunk.get('source', 'unknown')}]\n"
+
+
+def text_overlap(first: Dict, second: Dict) -> int:
+    """Number of leading characters of second that repeat the end of first"""
+    a, b = first.get("content") or "", second.get("content") or ""
+    if first.get("end") is not None and second.get("start") is not None:
+        claimed = first["end"] - second["start"]
+        if claimed <= 0:
+            return 0
+        if claimed <= min(len(a), len(b)) and a[-claimed:] == b[:claimed]:
+            return claimed
+    # No usable offsets: find the longest suffix of a that starts b
+    probe = b[:MIN_OVERLAP_CHARS]
+    if len(probe) < MIN_OVERLAP_CHARS:
+        return 0
+    index = a.find(probe, max(0, len(a) - len(b)))
+    while index != -1:
+        if b.startswith(a[index:]):
+            return len(a) - index
+        index = a.find(probe, index + 1)
+    return 0
+
+
+def touches(first: Dict, second: Dict) -> bool:
+    """True when second continues first (overlapping or directly adjacent)"""
+    if first.get("end") is not None and first.get("end") == second.get("start"):
+        return True
+    return text_overlap(first, second) > 0
+
+
+def document_positions(chunks: List[Dict]) -> Dict[int, Optional[int]]:
+    """
+    Position of each chunk (by list index) within its document, for ordering neighbours:
+    character offsets when every chunk of the document has them, else chunk indexes.
+    Chunks without a document_id get None and are never merged.
+    """
+    by_document: Dict[str, List[int]] = {}
+    for i, chunk in enumerate(chunks):
+        if chunk.get("document_id") is not None:
+            by_document.setdefault(chunk["document_id"], []).append(i)
+    positions: Dict[int, Optional[int]] = {i: None for i in range(len(chunks))}
+    for members in by_document.values():
+        for field in ("start", "chunk_index"):
+            if all(chunks[i].get(field) is not None for i in members):
+                positions.update({i: chunks[i][field] for i in members})
+                break
+    return positions
+
+
+def pack_context(
+    chunks: List[Dict],
+    token_budget: Optional[int] = None,
+    tokenizer: Optional[Tokenizer] = None,
+) -> List[Dict]:
+    """
+    Select and merge retrieved chunks into passages that fit the token budget
+    Returns passages shaped like chunks ("content", "source", "score", "document_id", "page")
+    The best chunk is trimmed to the budget rather than dropped; later chunks that do not fit are skipped
+    """
+    budget = RAG_CONTEXT_TOKEN_BUDGET if token_budget is None else token_budget
+    tokenizer = tokenizer or ApproximateTokenizer("approximate", budget)
+    positions = document_positions(chunks)
+    order = sorted(range(len(chunks)), key=lambda i: rank_score(chunks[i]), reverse=True)
+
+    packed: List[int] = []
+    remaining = budget
+    for i in order:
+        chunk = chunks[i]
+        text = chunk.get("content") or ""
+        # Closest packed neighbours of the same document on either side
+        before = after = None
+        if positions[i] is not None:
+            for j in packed:
+                if positions[j] is None or chunk.get("document_id") != chunks[j].get("document_id"):
+                    continue
+                if positions[j] < positions[i] and (before is None or positions[j] > positions[before]):
+                    before = j
+                elif positions[j] > positions[i] and (after is None or positions[j] < positions[after]):
+                    after = j
+        head = text_overlap(chunks[before], chunk) if before is not None else 0
+        tail = text_overlap(chunk, chunks[after]) if after is not None else 0
+        if head + tail >= len(text):
+            packed.append(i)  # Already covered by its neighbours
+            continue
+        joins = (before is not None and touches(chunks[before], chunk)) or (after is not None and touches(chunk, chunks[after]))
+        cost = tokenizer.count(text[head:len(text) - tail]) + (0 if joins else tokenizer.count(source_header(chunk)))
+        if cost <= remaining:
+            packed.append(i)
+            remaining -= cost
+        elif not packed and remaining > 0:
+            # Trim the best chunk at a token boundary so the prompt is never empty
+            _, ends = tokenizer.token_spans(text)
+            keep = remaining - tokenizer.count(source_header(chunk))
+            if keep > 0 and len(ends):
+                trimmed = text[:int(ends[min(keep, len(ends)) - 1])]
+                chunks = chunks[:i] + [{**chunk, "content": trimmed, "end": None}] + chunks[i + 1:]
+                packed.append(i)
+            break
+
+    # Merge packed chunks into passages, document by document in position order
+    passages: List[Dict] = []
+    ranks: List[float] = []
+    merged = sorted(packed, key=lambda i: (
+        positions[i] is None, str(chunks[i].get("document_id")), positions[i] if positions[i] is not None else i,
+    ))
+    previous = None
+    for i in merged:
+        chunk = chunks[i]
+        if (
+            previous is not None
+            and positions[i] is not None
+            and positions[previous] is not None
+            and chunk.get("document_id") == chunks[previous].get("document_id")
+            and touches(chunks[previous], chunk)
+        ):
+            passage = passages[-1]
+            passage["content"] += (chunk.get("content") or "")[text_overlap(chunks[previous], chunk):]
+            passage["score"] = max(passage["score"], chunk.get("score") or 0.0)
+            ranks[-1] = max(ranks[-1], rank_score(chunk))
+        else:
+            passages.append({
+                "content": chunk.get("content") or "",
+                "source": chunk.get("source", "unknown"),
+                "score": chunk.get("score") or 0.0,
+                "document_id": chunk.get("document_id"),
+                "page": chunk.get("page"),
+            })
+            ranks.append(rank_score(chunk))
+        previous = i
+    order = sorted(range(len(passages)), key=lambda p: ranks[p], reverse=True)
+    return [passages[p] for p in order]
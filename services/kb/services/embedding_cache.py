@@ -0,0 +1,159 @@
+"""
+Content-addressed embedding cache:
+1. Keyed by sha256(provider, model, normalized text)
+2. Vectors stored as float32 blobs in a local SQLite file (shared by workers)
+3. Least-recently-used entries are evicted once the store exceeds its size budget
+Re-uploading a near-identical document only embeds the chunks that changed.
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+# Configuration
+EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() == "true"
+EMBEDDING_CACHE_PATH = os.path.expanduser(
+    os.getenv("EMBEDDING_CACHE_PATH", "~/.cache/resonance-kb/embeddings.sqlite3")
+)
+EMBEDDING_CACHE_MAX_BYTES = int(os.getenv("EMBEDDING_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))  # 512 MiB
+
+# Evict down to this fraction of the budget so eviction is not triggered on every write
+_EVICT_TARGET_RATIO = 0.9
+# SQLite limits host parameters per statement
+_SQL_BATCH = 500
+
+
+def normalize_text(text: str) -> str:
+    """Normalize unicode form and whitespace so trivially different chunks share a key"""
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+def cache_key(provider: str, model: str, text: str) -> str:
+    payload = f"{provider}\x00{model}\x00{normalize_text(text)}"
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Disk-backed embedding store with size-bounded LRU eviction.
+    Methods are blocking; call them through run_io() from async code.
+    """
+
+    def __init__(self, path: str = EMBEDDING_CACHE_PATH, max_bytes: int = EMBEDDING_CACHE_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        # WAL lets several uvicorn workers read while one writes
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS embeddings (
+                key TEXT PRIMARY KEY,
+                vector BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                last_used REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+        self._total_bytes = self._stored_bytes()
+
+    def get_many(self, provider: str, model: str, texts: Sequence[str]) -> List[Optional[np.ndarray]]:
+        """Return cached vectors (or None) for each text, refreshing their LRU position"""
+        keys = [cache_key(provider, model, text) for text in texts]
+        found = {}
+        with self._lock:
+            for start in range(0, len(keys), _SQL_BATCH):
+                batch = keys[start:start + _SQL_BATCH]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                found.update(rows)
+                if rows:
+                    self._conn.execute(
+                        f"UPDATE embeddings SET last_used = ? WHERE key IN ({','.join('?' * len(rows))})",
+                        [time.time(), *(key for key, _ in rows)],
+                    )
+
+        results = [
+            np.frombuffer(found[key], dtype=np.float32) if key in found else None
+            for key in keys
+        ]
+        hits = sum(1 for r in results if r is not None)
+        self.hits += hits
+        self.misses += len(results) - hits
+        return results
+
+    def put_many(self, provider: str, model: str, texts: Sequence[str], vectors: Sequence) -> None:
+        """Store vectors for texts, evicting least-recently-used entries if over budget"""
+        now = time.time()
+        rows = []
+        for text, vector in zip(texts, vectors):
+            blob = np.asarray(vector, dtype=np.float32).tobytes()
+            rows.append((cache_key(provider, model, text), blob, len(blob), now))
+
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector, size, last_used) VALUES (?, ?, ?, ?)",
+                rows,
+            )
+            self._total_bytes += sum(row[2] for row in rows)
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "bytes": self._total_bytes}
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def _stored_bytes(self) -> int:
+        return self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM embeddings").fetchone()[0]
+
+    def _evict(self) -> None:
+        # Other workers write to the same file, so re-read the true size first
+        self._total_bytes = self._stored_bytes()
+        target = int(self.max_bytes * _EVICT_TARGET_RATIO)
+        while self._total_bytes > target:
+            excess = self._total_bytes - target
+            rows = self._conn.execute(
+                "SELECT key, size FROM embeddings ORDER BY last_used LIMIT ?", (_SQL_BATCH,)
+            ).fetchall()
+            if not rows:
+                break
+            evict_keys, freed = [], 0
+            for key, size in rows:
+                evict_keys.append(key)
+                freed += size
+                if freed >= excess:
+                    break
+            self._conn.execute(
+                f"DELETE FROM embeddings WHERE key IN ({','.join('?' * len(evict_keys))})", evict_keys
+            )
+            self._total_bytes -= freed
+
+
+# Process-wide cache (None when disabled)
+_embedding_cache: Optional[EmbeddingCache] = None
+
+def get_embedding_cache() -> Optional[EmbeddingCache]:
+    global _embedding_cache
+    if not EMBEDDING_CACHE_ENABLED:
+        return None
+    if _embedding_cache is None:
+        _embedding_cache = EmbeddingCache()
+    return _embedding_cache
@@ -0,0 +1,159 @@
+"""
+Embedding engine shared by ingestion and retrieval (one per worker):
+1. Provider selection: Pinecone integrated embeddings, local sentence-transformers, or OpenAI
+2. Clients and models load lazily, once; the local model also supplies the chunking tokenizer
+3. Dimensions come from the loaded model when there is one, else from known model sizes
+4. Local texts share one micro-batcher (queries ahead of chunks); OpenAI texts go out in one request per call
+5. Vectors come back as float32 rows, unit length (local models normalize, OpenAI vectors already are)
+Caching stays with the callers: the persistent cache for chunks, plus the query LRU for searches.
+"""
+import asyncio
+import os
+from typing import List, Optional
+
+import numpy as np
+
+from services.batching import EmbeddingBatcher
+from services.chunking import MODEL_MAX_TOKENS, HuggingFaceTokenizer, Tokenizer, get_tokenizer
+
+# Configuration
+EMBEDDING_PROVIDER = os.getenv("EMBEDDING_PROVIDER", "pinecone")  # "pinecone", "local", or "openai"
+PINECONE_EMBEDDING_MODEL = os.getenv("PINECONE_EMBEDDING_MODEL", "llama-text-embed-v2")
+LOCAL_EMBEDDING_MODEL = os.getenv("LOCAL_EMBEDDING_MODEL", "all-MiniLM-L6-v2")  # 384 dims
+LOCAL_EMBEDDING_ENCODING = "normalized"  # Tags cache keys; change with the encode() settings
+OPENAI_EMBEDDING_MODEL = os.getenv("OPENAI_EMBEDDING_MODEL", "text-embedding-3-small")  # 1536 dims
+
+# Dimensions of known models (used when no model is loaded in-process)
+MODEL_DIMENSIONS = {
+    "llama-text-embed-v2": 384,
+    "multilingual-e5-large": 1024,
+    "all-MiniLM-L6-v2": 384,
+    "all-MiniLM-L12-v2": 384,
+    "all-mpnet-base-v2": 768,
+    "text-embedding-3-small": 1536,
+    "text-embedding-3-large": 3072,
+    "text-embedding-ada-002": 1536,
+}
+
+# Lazy-load clients and models
+_openai_client = None
+_local_embedding_model = None
+_local_embedding_batcher = None
+_local_chunk_tokenizer = None
+
+
+def get_openai_client():
+    global _openai_client
+    if _openai_client is None:
+        api_key = os.getenv("OPENAI_API_KEY")
+        if not api_key:
+            raise ValueError("OPENAI_API_KEY is required when EMBEDDING_PROVIDER=openai")
+        from openai import AsyncOpenAI
+        _openai_client = AsyncOpenAI(api_key=api_key)
+    return _openai_client
+
+
+def get_local_embedding_model():
+    """Lazy-load sentence-transformers model"""
+    global _local_embedding_model
+    if _local_embedding_model is None:
+        from sentence_transformers import SentenceTransformer
+        _local_embedding_model = SentenceTransformer(LOCAL_EMBEDDING_MODEL)
+    return _local_embedding_model
+
+
+def _encode_local(texts: List[str]):
+    """Blocking batch encode with the local model (runs on the CPU executor)"""
+    model = get_local_embedding_model()
+    return model.encode(
+        texts,
+        convert_to_numpy=True,
+        show_progress_bar=False,
+        batch_size=len(texts),
+        normalize_embeddings=True,
+    )
+
+
+def get_local_embedding_batcher() -> EmbeddingBatcher:
+    """Shared micro-batcher in front of the local model (used by ingestion and retrieval)"""
+    global _local_embedding_batcher
+    if _local_embedding_batcher is None:
+        _local_embedding_batcher = EmbeddingBatcher(encode=_encode_local)
+    return _local_embedding_batcher
+
+
+def get_embedding_model_name(provider: Optional[str] = None) -> str:
+    """Model identifier for a provider"""
+    provider = provider or EMBEDDING_PROVIDER
+    if provider == "pinecone":
+        return PINECONE_EMBEDDING_MODEL
+    elif provider == "local":
+        return LOCAL_EMBEDDING_MODEL
+    else:
+        return OPENAI_EMBEDDING_MODEL
+
+
+def get_embedding_cache_model(provider: Optional[str] = None) -> str:
+    """Model part of the embedding cache key: the model plus encoding settings that change its vectors"""
+    provider = provider or EMBEDDING_PROVIDER
+    model_name = get_embedding_model_name(provider)
+    if provider == "local":
+        # Local vectors are unit-normalized; vectors cached before that must not be reused
+        return f"{model_name}+{LOCAL_EMBEDDING_ENCODING}"
+    return model_name
+
+
+def get_embedding_dimension() -> int:
+    """Vector dimension of the active provider's model"""
+    if EMBEDDING_PROVIDER == "local":
+        # The model knows its own size (loading it here is not wasted: ingestion needs it next)
+        dimension = get_local_embedding_model().get_sentence_embedding_dimension()
+        if dimension:
+            return dimension
+    return MODEL_DIMENSIONS.get(get_embedding_model_name(), 384)
+
+
+def get_chunk_tokenizer() -> Tokenizer:
+    """Tokenizer of the active embedding model, so chunks match its real token window"""
+    global _local_chunk_tokenizer
+    if EMBEDDING_PROVIDER == "local":
+        if _local_chunk_tokenizer is None:
+            model = get_local_embedding_model()
+            _local_chunk_tokenizer = HuggingFaceTokenizer(
+                model.tokenizer,
+                max_tokens=model.max_seq_length or MODEL_MAX_TOKENS.get(LOCAL_EMBEDDING_MODEL, 256),
+                name=LOCAL_EMBEDDING_MODEL,
+            )
+        return _local_chunk_tokenizer
+    return get_tokenizer(get_embedding_model_name())
+
+
+async def encode_documents(texts: List[str]) -> np.ndarray:
+    """Embed document chunks with the local or OpenAI provider as a float32 (len(texts), dim) array"""
+    if EMBEDDING_PROVIDER == "local":
+        # Use local sentence-transformers model (free, runs on your GPU/CPU)
+        # Chunks share batches with concurrent queries via the micro-batcher
+        return (await get_local_embedding_batcher().embed(texts)).astype(np.float32, copy=False)
+    return await _encode_openai(texts)
+
+
+async def encode_queries(queries: List[str]) -> np.ndarray:
+    """Embed search queries as a float32 (len(queries), dim) array"""
+    if EMBEDDING_PROVIDER == "local":
+        # Queries take the batcher's priority lane, where concurrent queries
+        # (including these) are coalesced into one model batch
+        batcher = get_local_embedding_batcher()
+        vectors = await asyncio.gather(*(batcher.embed_one(query) for query in queries))
+        return np.array(vectors, dtype=np.float32).reshape(len(queries), -1)
+    return await _encode_openai(queries)
+
+
+async def _encode_openai(texts: List[str]) -> np.ndarray:
+    # Use OpenAI API (following OpenAI cookbook pattern), one request for all texts
+    # Reference: https://cookbook.openai.com/examples/vector_databases/pinecone/using_pinecone_for_embeddings_search
+    openai = get_openai_client()
+    embeddings_response = await openai.embeddings.create(
+        model=OPENAI_EMBEDDING_MODEL,
+        input=texts
+    )
+    return np.array([item.embedding for item in embeddings_response.data], dtype=np.float32).reshape(len(texts), -1)
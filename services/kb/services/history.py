@@ -0,0 +1,148 @@
+"""
+Token-aware conversation history for chat prompts:
+1. The newest turns are kept verbatim while they fit CHAT_HISTORY_TOKEN_BUDGET (LLM tokenizer)
+2. Older turns are rolled into a running summary, sent as one system message ahead of them
+3. Summaries are cached per assistant under a hash chain over the turns they cover, so the next
+   request only summarizes the turns that aged out since (previous summary + those turns)
+4. Each request makes at most one summarize call over about one budget of (clipped) turns;
+   uncovered turns beyond that are dropped, and so are all older turns if summarizing fails
+Clients keep sending the full history; the service decides what reaches the model.
+"""
+import hashlib
+import json
+import logging
+import os
+from typing import Dict, List, Optional, Tuple
+
+from services.context import get_llm_tokenizer
+from services.llm import generate_chat_response, get_model_name
+from services.memory_cache import LRUCache
+
+logger = logging.getLogger("resonance.kb.history")
+
+# Configuration
+CHAT_HISTORY_TOKEN_BUDGET = int(os.getenv("CHAT_HISTORY_TOKEN_BUDGET", "1500"))  # Verbatim recent turns
+CHAT_HISTORY_SUMMARY_TOKENS = int(os.getenv("CHAT_HISTORY_SUMMARY_TOKENS", "300"))  # Cap on the running summary
+CHAT_SUMMARY_CACHE_MAX_BYTES = int(os.getenv("CHAT_SUMMARY_CACHE_MAX_BYTES", str(8 * 1024 * 1024)))  # 0 disables
+CHAT_SUMMARY_CACHE_TTL_SECONDS = float(os.getenv("CHAT_SUMMARY_CACHE_TTL_SECONDS", "86400"))
+
+# Role and separators the chat template adds to each message
+_MESSAGE_OVERHEAD_TOKENS = 4
+_SUMMARY_CACHE_ENTRY_OVERHEAD = 256
+
+SUMMARY_PROMPT = """You maintain a running summary of a customer support conversation.
+Update the summary with the new messages. Keep facts, names, numbers, what the user wants
+and anything still unresolved; drop greetings and repetition.
+Reply with the summary only, in at most {words} words."""
+
+# Lazy-load cache
+_summary_cache = None
+
+
+def get_summary_cache() -> Optional[LRUCache]:
+    """Running summaries by conversation prefix, or None when disabled"""
+    global _summary_cache
+    if CHAT_SUMMARY_CACHE_MAX_BYTES <= 0:
+        return None
+    if _summary_cache is None:
+        _summary_cache = LRUCache(max_bytes=CHAT_SUMMARY_CACHE_MAX_BYTES, ttl_seconds=CHAT_SUMMARY_CACHE_TTL_SECONDS)
+    return _summary_cache
+
+
+def prefix_keys(assistant_id: str, messages: List[Dict[str, str]]) -> List[str]:
+    """Cache key of every prefix of messages (keys[i] covers messages[:i + 1])"""
+    keys = []
+    digest = hashlib.sha256(assistant_id.encode("utf-8")).hexdigest()
+    for message in messages:
+        payload = json.dumps([digest, message.get("role"), message.get("content")])
+        digest = hashlib.sha256(payload.encode("utf-8")).hexdigest()
+        keys.append(f"summary:{digest}")
+    return keys
+
+
+def split_history(
+    history: List[Dict[str, str]],
+    token_budget: int,
+) -> Tuple[List[Dict[str, str]], List[Dict[str, str]]]:
+    """Split into (older turns, newest turns fitting the budget)"""
+    tokenizer = get_llm_tokenizer(get_model_name())
+    used = 0
+    cut = len(history)
+    for message in reversed(history):
+        used += tokenizer.count(message.get("content") or "") + _MESSAGE_OVERHEAD_TOKENS
+        if used > token_budget:
+            break
+        cut -= 1
+    return history[:cut], history[cut:]
+
+
+def clip(text: str, max_tokens: int) -> str:
+    """First max_tokens tokens of text"""
+    _, ends = get_llm_tokenizer(get_model_name()).token_spans(text)
+    if len(ends) <= max_tokens:
+        return text
+    return text[:int(ends[max_tokens - 1])] if max_tokens > 0 else ""
+
+
+async def summarize(previous: Optional[str], messages: List[Dict[str, str]]) -> str:
+    """Fold messages into the previous summary with one LLM call"""
+    transcript = "\n".join(
+        # A single huge message cannot blow up the summarization prompt either
+        f"{message.get('role', 'user')}: {clip(message.get('content') or '', CHAT_HISTORY_TOKEN_BUDGET)}"
+        for message in messages
+    )
+    prompt = f"Current summary:\n{previous}\n\nNew messages:\n{transcript}" if previous else f"Messages:\n{transcript}"
+    summary = await generate_chat_response(
+        [{"role": "user", "content": prompt}],
+        system_prompt=SUMMARY_PROMPT.format(words=max(1, CHAT_HISTORY_SUMMARY_TOKENS * 3 // 4)),
+        temperature=0.2,
+    )
+    return clip((summary or "").strip(), CHAT_HISTORY_SUMMARY_TOKENS)
+
+
+async def compact_history(
+    history: List[Dict[str, str]],
+    assistant_id: str,
+    token_budget: Optional[int] = None,
+) -> List[Dict[str, str]]:
+    """
+    History to send with a chat turn: a summary of older turns (if any) plus the newest turns verbatim
+    The result costs at most token_budget + CHAT_HISTORY_SUMMARY_TOKENS tokens
+    """
+    budget = CHAT_HISTORY_TOKEN_BUDGET if token_budget is None else token_budget
+    older, recent = split_history(history, budget)
+    if not older:
+        return recent
+
+    cache = get_summary_cache()
+    keys = prefix_keys(assistant_id, older)
+    summary, covered = None, 0
+    if cache is not None:
+        # Longest already-summarized prefix; only the turns after it need the LLM
+        for covered in range(len(older), 0, -1):
+            summary = cache.get(keys[covered - 1])
+            if summary is not None:
+                break
+        else:
+            covered = 0
+    # One summarize call per request at most, over about one budget of turns: the newest turns
+    # not yet in the summary. Older uncovered turns (a cold cache on a long chat) are dropped.
+    tokenizer = get_llm_tokenizer(get_model_name())
+    if covered < len(older):
+        start, used = len(older), 0
+        while start > covered:
+            cost = tokenizer.count(older[start - 1].get("content") or "") + _MESSAGE_OVERHEAD_TOKENS
+            if start < len(older) and used + cost > budget:
+                break
+            used += cost
+            start -= 1
+        try:
+            summary = await summarize(summary, older[start:])
+        except Exception:
+            logger.warning("Conversation summary failed; dropping %d older turns", len(older), exc_info=True)
+            return recent
+        if cache is not None:
+            cache.put(keys[-1], summary, size=len(summary.encode("utf-8")) + len(keys[-1]) + _SUMMARY_CACHE_ENTRY_OVERHEAD)
+    if not summary:
+        return recent
+    return [{"role": "system", "content": f"Summary of the earlier conversation:\n{summary}"}] + recent
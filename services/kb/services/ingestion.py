@@ -3,227 +3,363 @@ Document ingestion pipeline:
 1. Extract text from PDF/document
 2. Chunk text into smaller pieces
 3. Generate embeddings (local or OpenAI)
-4. Store in Pinecone vector database
+4. Store in the vector store (Pinecone, or in-process with VECTOR_STORE=local)
+Steps 3 and 4 stream chunks in batches, so a document's vectors are never all in memory.
 """
+import itertools
 import os
-from typing import Dict, List
-import PyPDF2
-from io import BytesIO
-from pinecone import Pinecone, ServerlessSpec, CloudProvider, AwsRegion, Metric, VectorType
+from bisect import bisect_right
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+import numpy as np
+from pinecone import ServerlessSpec, CloudProvider, AwsRegion, Metric, VectorType
 import hashlib
 import uuid
 
-# Lazy-load clients
-_pinecone_client = None
-_openai_client = None
-_local_embedding_model = None
+from services.aio import run_cpu, run_io
+from services import embeddings
+from services.chunking import Tokenizer, get_tokenizer, iter_chunk_spans
+from services.embedding_cache import get_embedding_cache, normalize_text
+from services.embeddings import encode_documents, get_chunk_tokenizer, get_embedding_cache_model, get_embedding_dimension
+from services.lexical import get_lexical_index
+from services.pdf_extraction import extract_page_range, extract_pdf_pages, join_pages
+from services.pipeline import iterate_blocking, run_pipeline
+from services.answer_cache import invalidate_answers
+from services.result_cache import invalidate_search_results
+from services.spool import DocumentSource, read_text
+from services.upsert import UpsertReport, upsert_batched
+from services.vector_store import get_pinecone_client, get_vector_store
 
 # Configuration
-EMBEDDING_PROVIDER = os.getenv("EMBEDDING_PROVIDER", "pinecone")  # "pinecone", "local", or "openai"
-PINECONE_INDEX_NAME = os.getenv("PINECONE_INDEX_NAME", "sterling-willow")
-PINECONE_EMBEDDING_MODEL = os.getenv("PINECONE_EMBEDDING_MODEL", "llama-text-embed-v2")
-LOCAL_EMBEDDING_MODEL = os.getenv("LOCAL_EMBEDDING_MODEL", "all-MiniLM-L6-v2")  # 384 dims
-
-def get_pinecone_client():
-    global _pinecone_client
-    if _pinecone_client is None:
-        api_key = os.getenv("PINECONE_API_KEY")
-        if not api_key:
-            raise ValueError("PINECONE_API_KEY environment variable is required")
-        _pinecone_client = Pinecone(api_key=api_key)
-    return _pinecone_client
-
-def get_openai_client():
-    global _openai_client
-    if _openai_client is None:
-        api_key = os.getenv("OPENAI_API_KEY")
-        if not api_key:
-            raise ValueError("OPENAI_API_KEY is required when EMBEDDING_PROVIDER=openai")
-        from openai import OpenAI
-        _openai_client = OpenAI(api_key=api_key)
-    return _openai_client
-
-def get_local_embedding_model():
-    """Lazy-load sentence-transformers model"""
-    global _local_embedding_model
-    if _local_embedding_model is None:
-        from sentence_transformers import SentenceTransformer
-        model_name = os.getenv("LOCAL_EMBEDDING_MODEL", "all-MiniLM-L6-v2")
-        _local_embedding_model = SentenceTransformer(model_name)
-    return _local_embedding_model
-
-def get_embedding_dimension():
-    """Get embedding dimension based on provider"""
-    if EMBEDDING_PROVIDER == "pinecone":
-        # Pinecone integrated embeddings
-        model_dims = {
-            "llama-text-embed-v2": 384,
-            "multilingual-e5-large": 1024,
-        }
-        return model_dims.get(PINECONE_EMBEDDING_MODEL, 384)
-    elif EMBEDDING_PROVIDER == "local":
-        model_name = os.getenv("LOCAL_EMBEDDING_MODEL", "all-MiniLM-L6-v2")
-        dimensions = {
-            "all-MiniLM-L6-v2": 384,
-            "all-mpnet-base-v2": 768,
-            "all-MiniLM-L12-v2": 384,
-        }
-        return dimensions.get(model_name, 384)
-    else:
-        return 1536  # OpenAI text-embedding-3-small
-
+CHUNK_SIZE_TOKENS = int(os.getenv("CHUNK_SIZE_TOKENS", "512"))  # Capped at the model's window
+CHUNK_OVERLAP = float(os.getenv("CHUNK_OVERLAP", "0.2"))
+INGEST_PIPELINE_BATCH_SIZE = int(os.getenv("INGEST_PIPELINE_BATCH_SIZE", "128"))  # Chunks embedded per batch
+LEXICAL_REBUILD_BATCH_SIZE = 500  # Records fetched from the vector store per call
 
 async def ingest_document(
-    content: bytes,
+    content: DocumentSource,
     filename: str,
     assistant_id: str,
     content_type: str = "application/pdf",
+    document_id: Optional[str] = None,
+    progress: Optional[Callable[..., None]] = None,
+    document_key: Optional[str] = None,
 ) -> Dict:
     """
     Process a document: extract, chunk, embed, store
+    content: raw bytes or a spooled upload (read in place, never copied into the heap)
+    document_id: pre-assigned ID (e.g. by the job queue); generated if omitted
+    progress: optional callback(stage, **counts) invoked as each stage starts
+    document_key: stable identity for updates; only changed chunks are embedded
+        and upserted, and chunks no longer present are deleted
     """
+    report = progress or (lambda stage, **counts: None)
+
     # Step 1: Extract text
-    text = extract_text(content, content_type)
+    report("extracting")
+    text, page_offsets = await extract_document(content, content_type)
     
-    # Step 2: Chunk text (512 tokens per chunk, 20% overlap)
-    chunks = chunk_text(text, chunk_size=512, overlap=0.2)
+    # Step 2: Find chunk boundaries on real token boundaries (512 tokens or the model window, 20% overlap)
+    # Only (start, end, tokens) offsets are kept; chunk text is sliced one batch at a time
+    report("chunking")
+    spans = await run_cpu(chunk_spans, text)
     
-    # Step 3: Prepare data based on embedding provider
-    chunk_texts = [chunk["text"] for chunk in chunks]
+    store = get_vector_store()
+    namespace = get_namespace(assistant_id)
+    lexical = get_lexical_index()
     
-    if EMBEDDING_PROVIDER == "pinecone":
-        # Pinecone integrated embeddings - just prepare text, no embedding generation needed
-        embedding_list = None  # Will use text directly
-    elif EMBEDDING_PROVIDER == "local":
-        # Use local sentence-transformers model (free, runs on your GPU/CPU)
-        model = get_local_embedding_model()
-        embeddings = model.encode(chunk_texts, convert_to_numpy=True, show_progress_bar=False)
-        # Convert to list format compatible with OpenAI response structure
-        embedding_list = [{"embedding": emb.tolist()} for emb in embeddings]
+    if document_key is not None:
+        # Keyed document: record IDs are content hashes, so unchanged chunks keep their IDs
+        document_id = stable_document_id(assistant_id, document_key)
+        existing_ids = await run_io(store.list_ids, namespace, f"{document_id}#")
     else:
-        # Use OpenAI API (following OpenAI cookbook pattern)
-        # Reference: https://cookbook.openai.com/examples/vector_databases/pinecone/using_pinecone_for_embeddings_search
-        openai = get_openai_client()
-        embeddings_response = openai.embeddings.create(
-            model="text-embedding-3-small",
-            input=chunk_texts
-        )
-        embedding_list = embeddings_response.data
+        document_id = document_id or str(uuid.uuid4())
+        existing_ids = set()
     
-    # Step 4: Store in Pinecone
-    pc = get_pinecone_client()
-    document_id = str(uuid.uuid4())
-    index_name = PINECONE_INDEX_NAME  # Use configured index name
+    # Steps 3-4: Embed and store in streaming batches; embedding batch N overlaps upserting batch N-1
+    report("embedding", chunks_total=len(spans))
+    current_ids = set()  # Every record ID in the new version (for stale-chunk deletion)
+    batches = iter_pending_batches(
+        text, spans, page_offsets, document_id, document_key is not None, existing_ids, current_ids
+    )
+    upsert_report = UpsertReport()
     
-    # Get index (no need to create, it already exists)
-    index = pc.Index(index_name)
+    async def embed_stage():
+        async for batch in iterate_blocking(batches):
+            if embeddings.EMBEDDING_PROVIDER == "pinecone":
+                # Pinecone integrated embeddings - just prepare text, no embedding generation needed
+                yield batch, None
+            else:
+                # Local or OpenAI embeddings; chunks seen before come from the embedding cache
+                yield batch, await embed_matrix([chunk["text"] for _, chunk, _ in batch])
     
-    if EMBEDDING_PROVIDER == "pinecone":
-        # Pinecone integrated embeddings - use upsert_records()
-        records = []
-        for i, chunk in enumerate(chunks):
-            record_id = f"{document_id}-chunk-{i}"
-            records.append({
-                "_id": record_id,
-                "text": chunk["text"],  # Pinecone will embed this automatically
-                "document_id": document_id,
-                "filename": filename,
-                "chunk_index": i,
-                "assistant_id": assistant_id,
-            })
-        
-        # Upsert with text (Pinecone handles embedding using llama-text-embed-v2)
-        index.upsert_records(
-            namespace=assistant_id,  # Use assistant_id as namespace
-            records=records
-        )
-    else:
-        # Standard approach: upsert pre-computed vectors
-        vectors = []
-        for i, (chunk, embedding_data) in enumerate(zip(chunks, embedding_list)):
-            record_id = f"{document_id}-chunk-{i}"
-            # Handle both dict format (OpenAI) and direct embedding (local)
-            embedding_vector = embedding_data.get("embedding") if isinstance(embedding_data, dict) else embedding_data
-            vectors.append((
-                record_id,
-                embedding_vector,  # Vector values (local or OpenAI)
+    async def upsert_stage(item):
+        batch, batch_vectors = item
+        if embeddings.EMBEDDING_PROVIDER == "pinecone":
+            # Pinecone integrated embeddings - use upsert_records()
+            items = [
                 {
-                    "document_id": document_id,
-                    "filename": filename,
-                    "chunk_index": i,
-                    "text": chunk["text"],
-                    "assistant_id": assistant_id,
+                    "_id": record_id,
+                    "text": chunk["text"],  # Pinecone will embed this automatically
+                    **chunk_metadata(chunk, i, document_id, filename, assistant_id),
                 }
-            ))
+                for i, chunk, record_id in batch
+            ]
+            # Upsert with text (Pinecone handles embedding using llama-text-embed-v2)
+        else:
+            # Standard approach: upsert pre-computed vectors (float lists built per batch only)
+            items = [
+                (
+                    record_id,
+                    embedding_vector.tolist(),  # Vector values (local or OpenAI)
+                    {
+                        **chunk_metadata(chunk, i, document_id, filename, assistant_id),
+                        "text": chunk["text"],
+                    },
+                )
+                for (i, chunk, record_id), embedding_vector in zip(batch, batch_vectors)
+            ]
         
-        # Upsert vectors
-        index.upsert(vectors=vectors)
+        done_before = upsert_report.upserted
+        batch_report = await upsert_batched(
+            lambda b: store.upsert(namespace, b),
+            items,
+            on_batch_done=lambda done: report("upserting", chunks_processed=done_before + done),
+        )
+        upsert_report.merge(batch_report)
+        if lexical is not None:
+            # Keyword postings for the chunks that reached the vector store (text is kept for lexical-only hits)
+            failed_ids = set(batch_report.failed_ids)
+            await run_io(lexical.add, assistant_id, [
+                (record_id, chunk["text"], {**chunk_metadata(chunk, i, document_id, filename, assistant_id), "text": chunk["text"]})
+                for i, chunk, record_id in batch
+                if record_id not in failed_ids
+            ])
     
+    try:
+        await run_pipeline(embed_stage(), upsert_stage)
+        
+        # Step 5: Remove chunks that are no longer in the document (after upsert, so it is never empty).
+        # If some new chunks failed, the old ones stay: the previous version is not lost, and a retry finishes the update
+        stale_ids = existing_ids - current_ids if upsert_report.ok else set()
+        if stale_ids:
+            report("deleting")
+            await run_io(store.delete, namespace, sorted(stale_ids))
+            if lexical is not None:
+                await run_io(lexical.delete, assistant_id, sorted(stale_ids))
+    finally:
+        # Cached search results and answers for this assistant may now be stale (also after a failed, partial write)
+        await invalidate_search_results(assistant_id)
+        invalidate_answers(assistant_id)
     return {
         "document_id": document_id,
-        "chunks": len(chunks),
-        "status": "processed",
+        "chunks": len(spans),
+        "chunks_added": upsert_report.upserted,
+        "chunks_removed": len(stale_ids),
+        "chunks_failed": len(upsert_report.failed_ids),
+        # Partial: some batches kept failing; the rest of the document is searchable
+        "status": "processed" if upsert_report.ok else "partial",
+    }
+
+
+async def rebuild_lexical_index(assistant_id: str) -> int:
+    """
+    Re-index an assistant's chunks for BM25 from the text stored in the vector store
+    Backfills chunks ingested before lexical search was enabled (or on another replica) and
+    drops indexed chunks the vector store no longer has; returns the number of chunks indexed
+    """
+    lexical = get_lexical_index()
+    if lexical is None:
+        raise ValueError("Lexical search is disabled (set LEXICAL_SEARCH_ENABLED=true)")
+    store = get_vector_store()
+    namespace = get_namespace(assistant_id)
+    ids = sorted(await run_io(store.list_ids, namespace, ""))
+
+    indexed = set()
+    for start in range(0, len(ids), LEXICAL_REBUILD_BATCH_SIZE):
+        records = await run_io(store.fetch, namespace, ids[start:start + LEXICAL_REBUILD_BATCH_SIZE])
+        documents = [
+            (record_id, metadata["text"], metadata)
+            for record_id, metadata in records.items()
+            # Pinecone's default namespace holds every assistant's pre-computed vectors
+            if metadata.get("assistant_id") == assistant_id and metadata.get("text")
+        ]
+        await run_io(lexical.add, assistant_id, documents)
+        indexed.update(record_id for record_id, _, _ in documents)
+
+    stale_ids = await run_io(lexical.list_ids, assistant_id) - indexed
+    if stale_ids:
+        await run_io(lexical.delete, assistant_id, sorted(stale_ids))
+    await invalidate_search_results(assistant_id)
+    return len(indexed)
+
+
+def iter_pending_batches(
+    text: str,
+    spans: np.ndarray,
+    page_offsets: Optional[List[Tuple[int, int]]],
+    document_id: str,
+    keyed: bool,
+    existing_ids: set,
+    current_ids: set,
+    batch_size: Optional[int] = None,
+) -> Iterator[List[Tuple[int, Dict, str]]]:
+    """
+    Yield batches of (chunk_index, chunk, record_id) that still need upserting.
+    Chunk text is sliced lazily, so only one batch of chunk strings exists at a time.
+    Adds every record ID of the document to current_ids as it goes.
+    """
+    batch_size = batch_size or INGEST_PIPELINE_BATCH_SIZE
+    batch = []
+    for i in range(len(spans)):
+        start, end, tokens = (int(value) for value in spans[i])
+        chunk = {"text": text[start:end], "start": start, "end": end, "tokens": tokens}
+        if page_offsets:
+            # Page metadata lets answers cite "handbook.pdf, p. 12"
+            chunk["page"] = page_for_offset(page_offsets, start)
+        record_id = f"{document_id}#{chunk_hash(chunk['text'])}" if keyed else f"{document_id}-chunk-{i}"
+        # Only chunks not already stored (or repeated within the document) need embedding and upserting
+        if record_id in current_ids or record_id in existing_ids:
+            current_ids.add(record_id)
+            continue
+        current_ids.add(record_id)
+        batch.append((i, chunk, record_id))
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def chunk_metadata(chunk: Dict, chunk_index: int, document_id: str, filename: str, assistant_id: str) -> Dict:
+    """Metadata stored with each chunk (Pinecone rejects null values, so optional keys are omitted)"""
+    metadata = {
+        "document_id": document_id,
+        "filename": filename,
+        "chunk_index": chunk_index,
+        "assistant_id": assistant_id,
     }
+    # Character offsets let prompts drop the text adjacent chunks share
+    if chunk.get("start") is not None:
+        metadata["start"] = chunk["start"]
+        metadata["end"] = chunk["end"]
+    if chunk.get("page") is not None:
+        metadata["page"] = chunk["page"]
+    return metadata
+
+
+def get_namespace(assistant_id: str) -> Optional[str]:
+    """Vector store namespace holding an assistant's records"""
+    return get_vector_store().namespace_for(assistant_id, integrated=embeddings.EMBEDDING_PROVIDER == "pinecone")
+
+
+def stable_document_id(assistant_id: str, document_key: str) -> str:
+    """Deterministic document ID for (assistant, key), so re-uploads address the same records"""
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"resonance-kb:{assistant_id}:{document_key}"))
+
+
+def chunk_hash(text: str) -> str:
+    """Short content hash of a chunk (whitespace-insensitive)"""
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()[:32]
 
 
-def extract_text(content: bytes, content_type: str) -> str:
+async def embed_texts(texts: List[str]) -> List[List[float]]:
+    """Embed texts with the local or OpenAI provider, as float lists"""
+    return (await embed_matrix(texts)).tolist()
+
+
+async def embed_matrix(texts: List[str]) -> np.ndarray:
+    """
+    Embed texts with the local or OpenAI provider as a float32 (len(texts), dim) array.
+    Cached vectors are reused; only unseen texts (deduplicated) are sent to the model.
+    """
+    if not texts:
+        return np.zeros((0, 0), dtype=np.float32)
+    cache = get_embedding_cache()
+    model_name = get_embedding_cache_model()
+    if cache is not None:
+        vectors = await run_io(cache.get_many, embeddings.EMBEDDING_PROVIDER, model_name, texts)
+    else:
+        vectors = [None] * len(texts)
+
+    # Identical chunks (headers, boilerplate) are embedded once
+    missing = list(dict.fromkeys(text for text, vector in zip(texts, vectors) if vector is None))
+    if missing:
+        fresh = list(await encode_documents(missing))
+
+        if cache is not None:
+            await run_io(cache.put_many, embeddings.EMBEDDING_PROVIDER, model_name, missing, fresh)
+        by_text = dict(zip(missing, fresh))
+        vectors = [by_text[text] if vector is None else vector for text, vector in zip(texts, vectors)]
+
+    # ~4 bytes per value, versus ~32 for a list of Python floats
+    return np.array(vectors, dtype=np.float32).reshape(len(texts), -1)
+
+
+def extract_text(content: DocumentSource, content_type: str) -> str:
     """Extract text from document based on content type"""
     if content_type == "application/pdf":
         return extract_text_from_pdf(content)
     elif content_type.startswith("text/"):
-        return content.decode("utf-8")
+        return read_text(content)
     else:
         raise ValueError(f"Unsupported content type: {content_type}")
 
 
-def extract_text_from_pdf(content: bytes) -> str:
-    """Extract text from PDF file"""
-    pdf_file = BytesIO(content)
-    pdf_reader = PyPDF2.PdfReader(pdf_file)
-    
-    text = ""
-    for page in pdf_reader.pages:
-        text += page.extract_text() + "\n"
-    
+def extract_text_from_pdf(content: DocumentSource) -> str:
+    """Extract text from PDF file (in-process; ingestion uses the parallel path)"""
+    text, _ = join_pages(extract_page_range(content))
     return text
 
 
-def chunk_text(text: str, chunk_size: int = 512, overlap: float = 0.2) -> List[Dict]:
+async def extract_document(content: DocumentSource, content_type: str) -> Tuple[str, Optional[List[Tuple[int, int]]]]:
+    """
+    Extract text for ingestion.
+    PDFs are extracted page-parallel across the process pool and also return
+    (start_offset, page_number) per page; other types return None for pages.
+    """
+    if content_type == "application/pdf":
+        return join_pages(await extract_pdf_pages(content))
+    return await run_cpu(extract_text, content, content_type), None
+
+
+def page_for_offset(page_offsets: List[Tuple[int, int]], offset: int) -> int:
+    """Page number containing a character offset of the joined text"""
+    index = bisect_right(page_offsets, (offset, float("inf"))) - 1
+    return page_offsets[max(0, index)][1]
+
+
+def chunk_text(
+    text: str,
+    chunk_size: int = 512,
+    overlap: float = 0.2,
+    tokenizer: Optional[Tokenizer] = None,
+) -> List[Dict]:
     """
     Split text into chunks with overlap
-    chunk_size: approximate tokens per chunk
+    chunk_size: tokens per chunk (capped at the embedding model's window)
     overlap: percentage of overlap between chunks
+    tokenizer: model tokenizer (approximate subword counts if omitted)
     """
-    # Simple token approximation: ~4 chars per token
-    chars_per_chunk = chunk_size * 4
-    overlap_chars = int(chars_per_chunk * overlap)
-    
-    chunks = []
-    start = 0
-    
-    while start < len(text):
-        end = start + chars_per_chunk
-        chunk_text = text[start:end]
-        
-        # Try to break at sentence boundary
-        if end < len(text):
-            last_period = chunk_text.rfind(".")
-            last_newline = chunk_text.rfind("\n")
-            break_point = max(last_period, last_newline)
-            
-            if break_point > chars_per_chunk * 0.5:  # Only break if reasonable
-                chunk_text = chunk_text[:break_point + 1]
-                end = start + break_point + 1
-        
-        chunks.append({
-            "text": chunk_text.strip(),
+    tokenizer = tokenizer or get_tokenizer("approximate")
+    return [
+        {
+            "text": text[start:end],
             "start": start,
             "end": end,
-        })
-        
-        start = end - overlap_chars
-    
-    return chunks
+            "tokens": tokens,
+        }
+        for start, end, tokens in iter_chunk_spans(text, tokenizer, chunk_size, overlap)
+    ]
+
+
+def chunk_spans(text: str) -> np.ndarray:
+    """
+    Chunk boundaries for the active embedding model as an (n, 3) array of
+    (start, end, tokens) (blocking; runs on the CPU executor)
+    """
+    tokenizer = get_chunk_tokenizer() or get_tokenizer("approximate")
+    spans = iter_chunk_spans(text, tokenizer, CHUNK_SIZE_TOKENS, CHUNK_OVERLAP)
+    return np.fromiter(itertools.chain.from_iterable(spans), dtype=np.int64).reshape(-1, 3)
 
 
 # Note: Embeddings are generated directly in ingest_document() using OpenAI API
@@ -234,9 +370,8 @@ def chunk_text(text: str, chunk_size: int = 512, overlap: float = 0.2) -> List[D
 def ensure_index_exists(index_name: str):
     """Create Pinecone index if it doesn't exist"""
     pc = get_pinecone_client()
-    existing_indexes = [idx.name for idx in pc.list_indexes()]
-    
-    if index_name not in existing_indexes:
+    # One describe call, instead of listing every index in the project
+    if not pc.has_index(index_name):
         dimension = get_embedding_dimension()
         pc.create_index(
             name=index_name,
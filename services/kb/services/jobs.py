@@ -0,0 +1,358 @@
+"""
+Background ingestion jobs:
+1. Uploads are queued and get a job ID straight away (202 Accepted)
+2. A bounded pool of workers runs ingest_document() for each job
+   (bulk jobs run many documents through run_bulk_ingest())
+3. Failed jobs are retried with backoff, then moved to the dead-letter state
+4. On shutdown the queue is drained before workers are stopped
+"""
+import asyncio
+import logging
+import os
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from services.bulk import BulkCheckpoint, BulkDocument, BulkStats, checkpoint_path, run_bulk_ingest
+from services.ingestion import ingest_document, stable_document_id
+from services.spool import DocumentSource, release_source
+
+logger = logging.getLogger("resonance.kb.jobs")
+
+# Configuration
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "2"))  # Concurrent ingests per process
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", "100"))
+INGEST_MAX_ATTEMPTS = int(os.getenv("INGEST_MAX_ATTEMPTS", "3"))
+INGEST_RETRY_BACKOFF_SECONDS = float(os.getenv("INGEST_RETRY_BACKOFF_SECONDS", "2.0"))
+INGEST_DRAIN_TIMEOUT_SECONDS = float(os.getenv("INGEST_DRAIN_TIMEOUT_SECONDS", "30"))
+INGEST_JOB_TTL_SECONDS = float(os.getenv("INGEST_JOB_TTL_SECONDS", "3600"))  # Keep finished jobs visible for 1h
+
+# Job states
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_RETRYING = "retrying"
+JOB_COMPLETED = "completed"
+JOB_PARTIAL = "partial"  # Finished, but some chunks could not be upserted
+JOB_DEAD_LETTER = "dead_letter"
+
+FINISHED_STATES = (JOB_COMPLETED, JOB_PARTIAL, JOB_DEAD_LETTER)
+
+
+class QueueFullError(Exception):
+    """Raised when the ingestion queue cannot accept more jobs"""
+
+
+@dataclass
+class IngestionJob:
+    job_id: str
+    document_id: Optional[str]  # None for bulk jobs (one ID per document)
+    filename: str
+    assistant_id: str
+    content_type: str
+    content: Optional[DocumentSource] = None  # Released (spool file deleted) once the job finishes
+    document_key: Optional[str] = None  # Set for incremental document updates
+    documents: Optional[List[BulkDocument]] = None  # Set for bulk jobs; released once the job finishes
+    checkpoint_id: Optional[str] = None  # Bulk jobs: run checkpoint (this job's ID, or the resumed job's)
+    resume: bool = False  # Bulk jobs: skip documents the checkpoint records as finished unchanged
+    bulk: Optional[BulkStats] = None
+    status: str = JOB_QUEUED
+    stage: str = "queued"
+    attempts: int = 0
+    chunks_total: int = 0
+    chunks_processed: int = 0
+    chunks_failed: int = 0
+    chunks_added: int = 0
+    chunks_removed: int = 0
+    error: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    updated_at: float = field(default_factory=time.time)
+
+    def to_dict(self) -> Dict:
+        data = {
+            "job_id": self.job_id,
+            "document_id": self.document_id,
+            "filename": self.filename,
+            "assistant_id": self.assistant_id,
+            "status": self.status,
+            "stage": self.stage,
+            "attempts": self.attempts,
+            "chunks_total": self.chunks_total,
+            "chunks_processed": self.chunks_processed,
+            "chunks_failed": self.chunks_failed,
+            "chunks_added": self.chunks_added,
+            "chunks_removed": self.chunks_removed,
+            "error": self.error,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
+        }
+        if self.bulk is not None:
+            data["bulk"] = self.bulk.to_dict()
+            data["resume_token"] = self.checkpoint_id
+        return data
+
+
+class IngestionJobQueue:
+    """
+    In-process job queue with a fixed number of ingest workers.
+    Caps concurrent ingests per process so uploads never wait on embedding or upserts.
+    """
+
+    def __init__(
+        self,
+        workers: int = INGEST_WORKERS,
+        max_queue_size: int = INGEST_QUEUE_SIZE,
+        max_attempts: int = INGEST_MAX_ATTEMPTS,
+        retry_backoff: float = INGEST_RETRY_BACKOFF_SECONDS,
+        job_ttl: float = INGEST_JOB_TTL_SECONDS,
+    ):
+        self.workers = max(1, workers)
+        self.max_queue_size = max_queue_size
+        self.max_attempts = max(1, max_attempts)
+        self.retry_backoff = retry_backoff
+        self.job_ttl = job_ttl
+        self._jobs: Dict[str, IngestionJob] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._tasks: List[asyncio.Task] = []
+        self._accepting = True
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    def start(self) -> None:
+        """Start worker tasks on the running event loop (idempotent)"""
+        loop = asyncio.get_running_loop()
+        if self._tasks and self._loop is loop:
+            return
+        self._loop = loop
+        self._queue = asyncio.Queue(maxsize=self.max_queue_size)
+        self._accepting = True
+        self._tasks = [
+            asyncio.create_task(self._worker(), name=f"ingest-worker-{i}")
+            for i in range(self.workers)
+        ]
+
+    def submit(
+        self,
+        content: DocumentSource,
+        filename: str,
+        assistant_id: str,
+        content_type: str,
+        document_key: Optional[str] = None,
+    ) -> IngestionJob:
+        """
+        Queue a document for ingestion and return its job.
+        With a document_key the job updates that document in place.
+        Once accepted, the job owns content; a spooled upload is deleted when the job finishes.
+        """
+        # Workers are started lazily when the app lifespan did not run (e.g. tests)
+        self.start()
+        if not self._accepting:
+            raise QueueFullError("Ingestion queue is shutting down")
+        self._prune_finished()
+
+        if document_key is not None:
+            document_id = stable_document_id(assistant_id, document_key)
+        else:
+            document_id = str(uuid.uuid4())
+        job = IngestionJob(
+            job_id=str(uuid.uuid4()),
+            document_id=document_id,
+            filename=filename,
+            assistant_id=assistant_id,
+            content_type=content_type,
+            content=content,
+            document_key=document_key,
+        )
+        return self._enqueue(job)
+
+    def submit_bulk(
+        self,
+        documents: List[BulkDocument],
+        assistant_id: str,
+        resume_token: Optional[str] = None,
+    ) -> IngestionJob:
+        """
+        Queue many documents as one job; they are ingested concurrently as keyed documents.
+        Progress is checkpointed per run: resume_token (an earlier bulk job's ID) continues
+        that run, skipping documents it finished; otherwise the job starts a fresh checkpoint.
+        Once accepted, the job owns the documents' spool files.
+        """
+        self.start()
+        if not self._accepting:
+            raise QueueFullError("Ingestion queue is shutting down")
+        self._prune_finished()
+
+        job_id = str(uuid.uuid4())
+        job = IngestionJob(
+            job_id=job_id,
+            document_id=None,
+            filename=f"{len(documents)} documents",
+            assistant_id=assistant_id,
+            content_type="bulk",
+            documents=documents,
+            checkpoint_id=resume_token or job_id,
+            resume=resume_token is not None,
+            bulk=BulkStats(documents_total=len(documents)),
+        )
+        return self._enqueue(job)
+
+    def _enqueue(self, job: IngestionJob) -> IngestionJob:
+        try:
+            self._queue.put_nowait(job.job_id)
+        except asyncio.QueueFull:
+            raise QueueFullError("Ingestion queue is full")
+
+        self._jobs[job.job_id] = job
+        return job
+
+    def get(self, job_id: str) -> Optional[IngestionJob]:
+        return self._jobs.get(job_id)
+
+    async def shutdown(self, timeout: float = INGEST_DRAIN_TIMEOUT_SECONDS) -> None:
+        """
+        Stop accepting jobs, let workers finish what is queued, then stop them.
+        Jobs still queued when the timeout expires are dead-lettered.
+        """
+        self._accepting = False
+        if not self._tasks:
+            return
+
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Ingestion queue did not drain within %.0fs", timeout)
+
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+        for job in self._jobs.values():
+            if job.status not in FINISHED_STATES:
+                self._finish(job, JOB_DEAD_LETTER, error="Shutdown before completion")
+
+    async def _worker(self) -> None:
+        while True:
+            job_id = await self._queue.get()
+            try:
+                job = self._jobs.get(job_id)
+                if job is not None:
+                    await self._run(job)
+            except Exception:
+                logger.exception("Ingestion worker error")
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job: IngestionJob) -> None:
+        while True:
+            job.attempts += 1
+            self._update(job, status=JOB_RUNNING)
+            try:
+                if job.documents is not None:
+                    result = await self._run_bulk(job)
+                else:
+                    result = await ingest_document(
+                        content=job.content,
+                        filename=job.filename,
+                        assistant_id=job.assistant_id,
+                        content_type=job.content_type,
+                        document_id=job.document_id,
+                        document_key=job.document_key,
+                        progress=lambda stage, **counts: self._update(job, stage=stage, **counts),
+                    )
+            except ValueError as e:
+                # Bad input or configuration - retrying will not help
+                logger.warning("Ingestion job %s rejected: %s", job.job_id, e)
+                self._finish(job, JOB_DEAD_LETTER, error=type(e).__name__)
+                return
+            except Exception as e:
+                logger.exception("Ingestion job %s failed (attempt %d)", job.job_id, job.attempts)
+                if job.attempts >= self.max_attempts:
+                    self._finish(job, JOB_DEAD_LETTER, error=type(e).__name__)
+                    return
+                self._update(job, status=JOB_RETRYING, error=type(e).__name__)
+                await asyncio.sleep(self.retry_backoff * (2 ** (job.attempts - 1)))
+                continue
+
+            chunks_failed = result.get("chunks_failed", 0)
+            self._update(
+                job,
+                chunks_total=result["chunks"],
+                chunks_processed=result["chunks"] - chunks_failed,
+                chunks_failed=chunks_failed,
+                chunks_added=result.get("chunks_added", result["chunks"]),
+                chunks_removed=result.get("chunks_removed", 0),
+            )
+            if chunks_failed:
+                self._finish(job, JOB_PARTIAL, error="Some chunks failed to upsert")
+            elif result.get("documents_failed"):
+                self._finish(job, JOB_PARTIAL, error="Some documents failed to ingest")
+            else:
+                self._finish(job, JOB_COMPLETED, error=None)
+            return
+
+    async def _run_bulk(self, job: IngestionJob) -> Dict:
+        """
+        Ingest a bulk job's documents. Finished documents are checkpointed and dropped
+        from the job, so a retry only processes what is left.
+        """
+        # Retries of this job always resume its own checkpoint
+        checkpoint = BulkCheckpoint(checkpoint_path(job.assistant_id, job.checkpoint_id), resume=job.resume or job.attempts > 1)
+        stats = job.bulk
+        if job.attempts == 1:
+            stats.started_at = time.time()  # Throughput excludes time spent queued
+        self._update(job, stage="ingesting")
+
+        def on_document_done(document: BulkDocument, stats: BulkStats) -> None:
+            job.documents.remove(document)
+            self._update(job, chunks_total=stats.chunks, chunks_processed=stats.chunks - stats.chunks_failed)
+
+        await run_bulk_ingest(
+            list(job.documents),
+            job.assistant_id,
+            checkpoint=checkpoint,
+            stats=stats,
+            on_document_done=on_document_done,
+        )
+        return {
+            "chunks": stats.chunks,
+            "chunks_added": stats.chunks_added,
+            "chunks_removed": stats.chunks_removed,
+            "chunks_failed": stats.chunks_failed,
+            "documents_failed": stats.documents_failed,
+        }
+
+    def _update(self, job: IngestionJob, **changes) -> None:
+        for key, value in changes.items():
+            setattr(job, key, value)
+        job.updated_at = time.time()
+
+    def _finish(self, job: IngestionJob, status: str, error: Optional[str]) -> None:
+        self._update(job, status=status, stage="done" if status != JOB_DEAD_LETTER else job.stage, error=error)
+        release_source(job.content)  # Free the upload buffer / delete the spool file
+        job.content = None
+        for document in job.documents or ():
+            release_source(document.content)
+        job.documents = None
+
+    def _prune_finished(self) -> None:
+        cutoff = time.time() - self.job_ttl
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job.status in FINISHED_STATES and job.updated_at < cutoff
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+
+# Process-wide queue used by the API
+_job_queue: Optional[IngestionJobQueue] = None
+
+def get_job_queue() -> IngestionJobQueue:
+    global _job_queue
+    if _job_queue is None:
+        _job_queue = IngestionJobQueue()
+    return _job_queue
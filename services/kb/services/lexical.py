@@ -0,0 +1,475 @@
+"""
+BM25 lexical index per assistant (the keyword half of hybrid retrieval):
+1. Chunks are tokenized at ingest; SKUs, prices and error codes stay whole ("$299", "e-1042")
+   and are also indexed by their parts ("299", "1042")
+2. Postings are array-backed: a CSR snapshot (term offsets, doc rows, term frequencies)
+   memory-mapped from disk, plus a small array delta for chunks added since
+3. Changes are appended to a JSON-lines log; once the log outgrows LEXICAL_SNAPSHOT_LOG_BYTES
+   it is folded into a new snapshot (dropping deleted chunks) on a background thread; writers
+   wait for the fold, searches keep running until the new snapshot is swapped in
+4. Other processes replay the log tail on their next query, so workers stay in sync
+Chunk text and metadata are stored with the postings, so lexical-only hits can be returned
+whatever the vector store.
+"""
+import fcntl
+import json
+import logging
+import math
+import os
+import re
+import shutil
+import threading
+from array import array
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+from urllib.parse import quote
+
+import numpy as np
+
+from services.local_vector_store import top_k_indices
+
+logger = logging.getLogger("resonance.kb.lexical")
+
+# Configuration
+# Off by default with Pinecone: the index lives on each replica's local disk and would diverge
+# across pods (backfill one with rebuild_lexical.py)
+LEXICAL_SEARCH_ENABLED = os.getenv(
+    "LEXICAL_SEARCH_ENABLED", str(os.getenv("VECTOR_STORE", "pinecone") == "local"),
+).lower() == "true"
+# Empty keeps the index in memory only (tests, single-process experiments)
+LEXICAL_INDEX_DIR = os.path.expanduser(os.getenv("LEXICAL_INDEX_DIR", "~/.cache/resonance-kb/lexical"))
+LEXICAL_SNAPSHOT_LOG_BYTES = int(os.getenv("LEXICAL_SNAPSHOT_LOG_BYTES", str(16 * 1024 * 1024)))
+LEXICAL_MAX_OPEN = int(os.getenv("LEXICAL_MAX_OPEN", "256"))  # Namespaces kept loaded
+BM25_K1 = float(os.getenv("BM25_K1", "1.2"))
+BM25_B = float(os.getenv("BM25_B", "0.75"))
+
+_TOKEN_PATTERN = re.compile(r"[$€£]?\w+(?:[-./:]\w+)*")
+_WORD_PATTERN = re.compile(r"\w+")
+
+# Lazy-load index
+_lexical_index = None
+
+
+def tokenize(text: str) -> List[str]:
+    """Case-folded terms; compound tokens are kept whole and also split into their words"""
+    tokens = []
+    for match in _TOKEN_PATTERN.finditer(text.casefold()):
+        token = match.group()
+        tokens.append(token)
+        parts = _WORD_PATTERN.findall(token)
+        if len(parts) > 1 or parts[0] != token:
+            tokens.extend(parts)
+    return tokens
+
+
+class NamespaceIndex:
+    """
+    BM25 postings for one namespace.
+    Rows [0, snapshot_rows) live in the memory-mapped snapshot; later rows in the delta arrays.
+    Lock order: the file lock (writers, folds), then self.lock (also taken by searches).
+    """
+
+    def __init__(self, path: Optional[str], schedule: Optional[Callable[["NamespaceIndex"], None]] = None):
+        self.path = path
+        self.lock = threading.Lock()
+        self.fold_pending = False
+        self._schedule = schedule
+        self._current_key = None
+        self._log_offset = 0
+        self._load()
+
+    # Loading and refresh
+
+    def _load(self) -> None:
+        self.terms: Dict[str, int] = {}
+        self.term_offsets = np.zeros(1, dtype=np.int64)
+        self.post_rows = np.zeros(0, dtype=np.int32)
+        self.post_tf = np.zeros(0, dtype=np.uint16)
+        self.snapshot_lengths = np.zeros(0, dtype=np.int32)
+        self.snapshot_doc_offsets = np.zeros(0, dtype=np.int64)
+        self.snapshot_docs = np.zeros(0, dtype=np.uint8)
+        self.snapshot = None
+        self.log_name = "log-000001.jsonl"
+        self.delta: Dict[str, Tuple[array, array]] = {}
+        self.delta_lengths = array("i")
+        self.delta_docs: List[Dict[str, Any]] = []
+        self.dead = bytearray()
+        self.rows: Dict[str, int] = {}
+        self.live_docs = 0
+        self.live_length = 0
+        self._log_offset = 0
+        if self.path is None or not os.path.exists(self._file("CURRENT")):
+            self._current_key = None
+            return
+
+        current_key = _file_key(self._file("CURRENT"))
+        with open(self._file("CURRENT"), "r", encoding="utf-8") as f:
+            current = json.load(f)
+        self.log_name = current["log"]
+        self.snapshot = current.get("snapshot")
+        if self.snapshot:
+            base = self._file(self.snapshot)
+            with open(os.path.join(base, "terms.txt"), "r", encoding="utf-8") as f:
+                self.terms = {term: i for i, term in enumerate(f.read().splitlines())}
+            self.term_offsets = np.load(os.path.join(base, "term_offsets.npy"), mmap_mode="r")
+            self.post_rows = np.load(os.path.join(base, "post_rows.npy"), mmap_mode="r")
+            self.post_tf = np.load(os.path.join(base, "post_tf.npy"), mmap_mode="r")
+            self.snapshot_lengths = np.load(os.path.join(base, "doc_lengths.npy"), mmap_mode="r")
+            self.snapshot_doc_offsets = np.load(os.path.join(base, "doc_offsets.npy"), mmap_mode="r")
+            if os.path.getsize(os.path.join(base, "docs.jsonl")):
+                self.snapshot_docs = np.memmap(os.path.join(base, "docs.jsonl"), dtype=np.uint8, mode="r")
+            with open(os.path.join(base, "ids.txt"), "r", encoding="utf-8") as f:
+                self.rows = {record_id: row for row, record_id in enumerate(f.read().splitlines())}
+            self.dead = bytearray(len(self.snapshot_lengths))
+            self.live_docs = len(self.snapshot_lengths)
+            self.live_length = int(np.sum(self.snapshot_lengths, dtype=np.int64))
+        self._current_key = current_key
+        self._replay()
+
+    def refresh(self) -> None:
+        """Pick up other processes' changes: replay new log lines, or reload after a snapshot"""
+        if self.path is None:
+            return
+        if _file_key(self._file("CURRENT")) != self._current_key:
+            self._load()
+        elif _file_size(self._file(self.log_name)) != self._log_offset:
+            self._replay()
+
+    def _replay(self) -> None:
+        try:
+            with open(self._file(self.log_name), "rb") as f:
+                f.seek(self._log_offset)
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break  # Torn last line (a writer is mid-append or was interrupted)
+                    self._apply(json.loads(line))
+                    self._log_offset += len(line)
+        except FileNotFoundError:
+            pass
+
+    def _apply(self, entry: Dict[str, Any]) -> None:
+        if entry["op"] == "add":
+            self._apply_delete(self.rows.get(entry["id"]))
+            row = self.total_rows
+            for term, tf in entry["terms"].items():
+                rows, tfs = self.delta.setdefault(term, (array("i"), array("i")))
+                rows.append(row)
+                tfs.append(tf)
+            self.delta_lengths.append(entry["length"])
+            self.delta_docs.append({"id": entry["id"], "metadata": entry["metadata"]})
+            self.dead.append(0)
+            self.rows[entry["id"]] = row
+            self.live_docs += 1
+            self.live_length += entry["length"]
+        else:
+            for record_id in entry["ids"]:
+                self._apply_delete(self.rows.get(record_id))
+
+    def _apply_delete(self, row: Optional[int]) -> None:
+        if row is None or self.dead[row]:
+            return
+        self.dead[row] = 1
+        self.rows.pop(self.record(row)["id"], None)
+        self.live_docs -= 1
+        self.live_length -= self.length(row)
+
+    # Reads
+
+    @property
+    def snapshot_rows(self) -> int:
+        return len(self.snapshot_lengths)
+
+    @property
+    def total_rows(self) -> int:
+        return self.snapshot_rows + len(self.delta_lengths)
+
+    def length(self, row: int) -> int:
+        if row < self.snapshot_rows:
+            return int(self.snapshot_lengths[row])
+        return self.delta_lengths[row - self.snapshot_rows]
+
+    def record(self, row: int) -> Dict[str, Any]:
+        """{"id", "metadata"} of a row"""
+        if row >= self.snapshot_rows:
+            return self.delta_docs[row - self.snapshot_rows]
+        # Sliced from the memory map (no shared file position), so a background fold can read concurrently
+        start = int(self.snapshot_doc_offsets[row])
+        end = int(self.snapshot_doc_offsets[row + 1]) if row + 1 < self.snapshot_rows else len(self.snapshot_docs)
+        return json.loads(bytes(self.snapshot_docs[start:end]).split(b"\n", 1)[0])
+
+    def lengths(self, rows: np.ndarray) -> np.ndarray:
+        """Token lengths of the given rows"""
+        lengths = np.empty(len(rows), dtype=np.float32)
+        in_snapshot = rows < self.snapshot_rows
+        lengths[in_snapshot] = self.snapshot_lengths[rows[in_snapshot]]
+        if not in_snapshot.all():
+            # Zero-copy view; only used while self.lock keeps writers from resizing the array
+            delta_lengths = np.frombuffer(self.delta_lengths, dtype=np.int32)
+            lengths[~in_snapshot] = delta_lengths[rows[~in_snapshot] - self.snapshot_rows]
+        return lengths
+
+    def postings(self, term: str) -> Tuple[np.ndarray, np.ndarray]:
+        """(rows, term frequencies) of a term across the snapshot and the delta"""
+        parts_rows, parts_tf = [], []
+        term_id = self.terms.get(term)
+        if term_id is not None:
+            start, end = int(self.term_offsets[term_id]), int(self.term_offsets[term_id + 1])
+            parts_rows.append(np.asarray(self.post_rows[start:end], dtype=np.int64))
+            parts_tf.append(np.asarray(self.post_tf[start:end], dtype=np.float32))
+        if term in self.delta:
+            rows, tfs = self.delta[term]
+            parts_rows.append(np.frombuffer(rows, dtype=np.int32).astype(np.int64))
+            parts_tf.append(np.frombuffer(tfs, dtype=np.int32).astype(np.float32))
+        if not parts_rows:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        return np.concatenate(parts_rows), np.concatenate(parts_tf)
+
+    def search(self, query: str, top_k: int) -> List[Tuple[Dict[str, Any], float]]:
+        """Top-k (record, BM25 score) for a query, best first"""
+        if not self.live_docs:
+            return []
+        # Liveness and lengths are looked up for matched rows only (zero-copy view, see lengths())
+        dead = np.frombuffer(self.dead, dtype=np.uint8)
+        average_length = self.live_length / self.live_docs
+        matched_rows, matched_scores = [], []
+        for term in set(tokenize(query)):
+            rows, tfs = self.postings(term)
+            live = dead[rows] == 0
+            rows, tfs = rows[live], tfs[live]
+            if not len(rows):
+                continue
+            idf = math.log(1 + (self.live_docs - len(rows) + 0.5) / (len(rows) + 0.5))
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * self.lengths(rows) / average_length)
+            matched_rows.append(rows)
+            matched_scores.append(idf * tfs * (BM25_K1 + 1) / (tfs + norm))
+        if not matched_rows:
+            return []
+        rows, inverse = np.unique(np.concatenate(matched_rows), return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(matched_scores)).astype(np.float32)
+        return [(self.record(int(rows[i])), float(scores[i])) for i in top_k_indices(scores, top_k)]
+
+    # Writes
+
+    def add(self, documents: Iterable[Tuple[str, str, Dict[str, Any]]]) -> None:
+        """Index (record_id, text, metadata) chunks; an existing record_id is replaced"""
+        entries = []
+        for record_id, text, metadata in documents:
+            tokens = tokenize(text)
+            entries.append({
+                "op": "add",
+                "id": record_id,
+                "terms": dict(Counter(tokens)),
+                "length": len(tokens),
+                "metadata": metadata,
+            })
+        self._write(entries)
+
+    def delete(self, ids: Iterable[str]) -> None:
+        ids = [record_id for record_id in ids]
+        if ids:
+            self._write([{"op": "delete", "ids": ids}])
+
+    def _write(self, entries: List[Dict[str, Any]]) -> None:
+        if not entries:
+            return
+        with self._file_lock(), self.lock:
+            self.refresh()
+            if self.path is not None:
+                lines = b"".join(json.dumps(entry).encode("utf-8") + b"\n" for entry in entries)
+                log_path = self._file(self.log_name)
+                if _file_size(log_path) != self._log_offset:
+                    os.truncate(log_path, self._log_offset)  # Drop a torn line from an interrupted write
+                with open(log_path, "ab") as f:
+                    f.write(lines)
+                self._log_offset += len(lines)
+                if not os.path.exists(self._file("CURRENT")):
+                    self._switch(None, self.log_name)
+                    self._current_key = _file_key(self._file("CURRENT"))
+            for entry in entries:
+                self._apply(entry)
+            fold = self.path is not None and self._log_offset > LEXICAL_SNAPSHOT_LOG_BYTES and not self.fold_pending
+            if fold:
+                self.fold_pending = True
+        if fold:
+            if self._schedule is not None:
+                self._schedule(self)
+            else:
+                self.fold()
+
+    def fold(self) -> None:
+        """
+        Write live rows as a new CSR snapshot with an empty log
+        Holds the file lock throughout, so no writer changes the rows being read; self.lock
+        (and with it searches) is only taken to check the log and to swap the snapshot in.
+        """
+        try:
+            with self._file_lock():
+                with self.lock:
+                    self.refresh()
+                    if self._log_offset <= LEXICAL_SNAPSHOT_LOG_BYTES:
+                        return  # Another process folded first
+                self._fold()
+        finally:
+            self.fold_pending = False
+
+    def _fold(self) -> None:
+        generation = int(self.log_name.split("-")[1].split(".")[0]) + 1
+        snapshot = f"snap-{generation:06d}"
+        base = self._file(snapshot)
+        shutil.rmtree(base, ignore_errors=True)
+        os.makedirs(base)
+
+        live = [row for row in range(self.total_rows) if not self.dead[row]]
+        new_row = {row: i for i, row in enumerate(live)}
+        postings: Dict[str, List[Tuple[int, int]]] = {}
+        for term in list(self.terms) + [term for term in self.delta if term not in self.terms]:
+            rows, tfs = self.postings(term)
+            kept = [(new_row[row], int(tf)) for row, tf in zip(rows.tolist(), tfs.tolist()) if row in new_row]
+            if kept:
+                postings[term] = kept
+        terms = sorted(postings)
+        counts = np.array([len(postings[term]) for term in terms], dtype=np.int64)
+        np.save(os.path.join(base, "term_offsets.npy"), np.concatenate([[0], np.cumsum(counts)]).astype(np.int64))
+        np.save(os.path.join(base, "post_rows.npy"), np.array([r for t in terms for r, _ in postings[t]], dtype=np.int32))
+        np.save(os.path.join(base, "post_tf.npy"), np.array([min(tf, 65535) for t in terms for _, tf in postings[t]], dtype=np.uint16))
+        np.save(os.path.join(base, "doc_lengths.npy"), np.array([self.length(row) for row in live], dtype=np.int32))
+        offsets = []
+        with open(os.path.join(base, "docs.jsonl"), "wb") as docs, \
+                open(os.path.join(base, "ids.txt"), "w", encoding="utf-8") as ids:
+            for row in live:
+                record = self.record(row)
+                offsets.append(docs.tell())
+                docs.write(json.dumps(record).encode("utf-8") + b"\n")
+                ids.write(record["id"] + "\n")
+        np.save(os.path.join(base, "doc_offsets.npy"), np.array(offsets, dtype=np.int64))
+        with open(os.path.join(base, "terms.txt"), "w", encoding="utf-8") as f:
+            f.writelines(term + "\n" for term in terms)
+
+        old_snapshot, old_log = self.snapshot, self.log_name
+        log_name = f"log-{generation:06d}.jsonl"
+        open(self._file(log_name), "wb").close()
+        with self.lock:
+            self._switch(snapshot, log_name)
+            self._load()
+        if old_snapshot:
+            shutil.rmtree(self._file(old_snapshot), ignore_errors=True)
+        os.remove(self._file(old_log))
+        logger.info("Folded lexical log for %s into %s (%d chunks)", self.path, snapshot, len(live))
+
+    def _switch(self, snapshot: Optional[str], log_name: str) -> None:
+        tmp = self._file("CURRENT.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"snapshot": snapshot, "log": log_name}, f)
+        os.replace(tmp, self._file("CURRENT"))
+
+    @contextmanager
+    def _file_lock(self):
+        if self.path is None:
+            yield
+            return
+        os.makedirs(self.path, exist_ok=True)
+        fd = os.open(self._file("LOCK"), os.O_CREAT | os.O_RDWR, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            os.close(fd)
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+
+class LexicalIndex:
+    """Per-namespace BM25 indexes; least recently used namespaces are unloaded"""
+
+    def __init__(self, root: Optional[str] = None, max_open: int = LEXICAL_MAX_OPEN):
+        self.root = root or None
+        self.max_open = max_open
+        self._namespaces: "OrderedDict[str, NamespaceIndex]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._maintenance: Optional[ThreadPoolExecutor] = None
+
+    def namespace(self, namespace: str) -> NamespaceIndex:
+        with self._lock:
+            index = self._namespaces.get(namespace)
+            if index is None:
+                path = os.path.join(self.root, "ns-" + quote(namespace, safe="")) if self.root else None
+                index = self._namespaces[namespace] = NamespaceIndex(path, self._schedule)
+                # In-memory indexes cannot be reloaded, so they are never evicted
+                while self.root and len(self._namespaces) > self.max_open:
+                    self._namespaces.popitem(last=False)
+            self._namespaces.move_to_end(namespace)
+            return index
+
+    def add(self, namespace: str, documents: Iterable[Tuple[str, str, Dict[str, Any]]]) -> None:
+        self.namespace(namespace).add(documents)
+
+    def delete(self, namespace: str, ids: Iterable[str]) -> None:
+        self.namespace(namespace).delete(ids)
+
+    def list_ids(self, namespace: str) -> Set[str]:
+        """IDs of the chunks indexed for a namespace"""
+        index = self.namespace(namespace)
+        with index.lock:
+            index.refresh()
+            return set(index.rows)
+
+    def search(self, namespace: str, query: str, top_k: int) -> List[Tuple[Dict[str, Any], float]]:
+        index = self.namespace(namespace)
+        with index.lock:
+            index.refresh()
+            return index.search(query, top_k)
+
+
+    def close(self) -> None:
+        """Wait for running folds"""
+        if self._maintenance is not None:
+            self._maintenance.shutdown(wait=True)
+            self._maintenance = None
+
+    def _schedule(self, index: NamespaceIndex) -> None:
+        with self._lock:
+            if self._maintenance is None:
+                self._maintenance = ThreadPoolExecutor(max_workers=1, thread_name_prefix="kb-lexical")
+            maintenance = self._maintenance
+        maintenance.submit(self._run, index)
+
+    @staticmethod
+    def _run(index: NamespaceIndex) -> None:
+        try:
+            index.fold()
+        except Exception:
+            logger.exception("Lexical fold of %s failed", index.path)
+
+
+def _file_key(path: str) -> Optional[Tuple[int, int]]:
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns
+
+
+def _file_size(path: str) -> int:
+    try:
+        return os.path.getsize(path)
+    except FileNotFoundError:
+        return 0
+
+
+def get_lexical_index() -> Optional[LexicalIndex]:
+    """Shared BM25 index, or None when lexical search is disabled"""
+    global _lexical_index
+    if not LEXICAL_SEARCH_ENABLED:
+        return None
+    if _lexical_index is None:
+        _lexical_index = LexicalIndex(LEXICAL_INDEX_DIR)
+    return _lexical_index
+
+
+def close_lexical_index() -> None:
+    """Finish background folds (called on app shutdown)"""
+    if _lexical_index is not None:
+        _lexical_index.close()
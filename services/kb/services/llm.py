@@ -1,38 +1,94 @@
 """
 LLM Service - Supports both local (Ollama) and OpenAI
 Automatically switches based on environment configuration
+One async client per provider lives for the whole process (created at startup, closed on shutdown),
+so chat turns reuse pooled keep-alive connections instead of opening new ones
 """
+import logging
 import os
-from typing import List, Dict, Optional, AsyncIterator
-from openai import OpenAI
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+from openai import AsyncOpenAI
+try:
+    # Newer SDKs run on httpx2; pool settings must come from the same package as the client
+    import httpx2 as httpx
+    from openai import DefaultAsyncHttpx2Client as DefaultAsyncHttpxClient
+except ImportError:
+    import httpx
+    from openai import DefaultAsyncHttpxClient
 from dotenv import load_dotenv
 
+from services.context import get_llm_tokenizer, pack_context, source_header
+
 load_dotenv()
 
+logger = logging.getLogger("resonance.kb.llm")
+
 # Configuration
 LLM_PROVIDER = os.getenv("LLM_PROVIDER", "local")  # "local" or "openai"
 OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434/v1")
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "")
 OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-3.5-turbo")
 OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "llama3")  # or mistral, phi3, etc.
+# Connection pool shared by all chat turns in a worker
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "100"))
+LLM_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", "20"))
+LLM_KEEPALIVE_EXPIRY_SECONDS = float(os.getenv("LLM_KEEPALIVE_EXPIRY_SECONDS", "60"))
+LLM_CONNECT_TIMEOUT_SECONDS = float(os.getenv("LLM_CONNECT_TIMEOUT_SECONDS", "5"))
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "120"))  # Read timeout; local models can be slow
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_HTTP2 = os.getenv("LLM_HTTP2", "false").lower() == "true"  # Needs the h2 package (httpx[http2])
+
+# Long-lived clients, one per provider
+_llm_clients: Dict[str, AsyncOpenAI] = {}
 
 
-def get_llm_client() -> OpenAI:
+def get_llm_client() -> AsyncOpenAI:
     """
     Get LLM client based on configuration
-    Returns OpenAI-compatible client (works with both Ollama and OpenAI)
+    Returns OpenAI-compatible client (works with both Ollama and OpenAI), created once per provider
     """
-    if LLM_PROVIDER == "local":
-        # Ollama uses OpenAI-compatible API
-        return OpenAI(
-            base_url=OLLAMA_BASE_URL,
-            api_key="ollama",  # Not needed, but required by library
+    client = _llm_clients.get(LLM_PROVIDER)
+    if client is None:
+        if LLM_PROVIDER == "local":
+            # Ollama uses OpenAI-compatible API
+            base_url, api_key = OLLAMA_BASE_URL, "ollama"  # Key not needed, but required by library
+        else:
+            # OpenAI
+            if not OPENAI_API_KEY:
+                raise ValueError("OPENAI_API_KEY is required when LLM_PROVIDER=openai")
+            base_url, api_key = None, OPENAI_API_KEY
+        client = AsyncOpenAI(
+            base_url=base_url,
+            api_key=api_key,
+            max_retries=LLM_MAX_RETRIES,
+            http_client=DefaultAsyncHttpxClient(
+                limits=httpx.Limits(
+                    max_connections=LLM_MAX_CONNECTIONS,
+                    max_keepalive_connections=LLM_MAX_KEEPALIVE_CONNECTIONS,
+                    keepalive_expiry=LLM_KEEPALIVE_EXPIRY_SECONDS,
+                ),
+                timeout=httpx.Timeout(LLM_TIMEOUT_SECONDS, connect=LLM_CONNECT_TIMEOUT_SECONDS),
+                http2=LLM_HTTP2,
+            ),
         )
-    else:
-        # OpenAI
-        if not OPENAI_API_KEY:
-            raise ValueError("OPENAI_API_KEY is required when LLM_PROVIDER=openai")
-        return OpenAI(api_key=OPENAI_API_KEY)
+        _llm_clients[LLM_PROVIDER] = client
+    return client
+
+
+def start_llm_client() -> None:
+    """Create the client at startup; a misconfiguration is logged here and raised on first use"""
+    try:
+        get_llm_client()
+    except Exception:
+        logger.warning("LLM client could not be created", exc_info=True)
+
+
+async def close_llm_clients() -> None:
+    """Close every client and its connection pool (called on shutdown)"""
+    clients = list(_llm_clients.values())
+    _llm_clients.clear()
+    for client in clients:
+        await client.close()
 
 
 def get_model_name() -> str:
@@ -56,15 +112,76 @@ async def generate_chat_response(
         messages: List of message dicts with 'role' and 'content'
         system_prompt: Optional system prompt
         temperature: Sampling temperature (0-1)
-        stream: Whether to stream response (not implemented yet)
+        stream: Stream the completion and join the deltas (see stream_chat_response to forward them)
     
     Returns:
         Generated response text
     """
+    if stream:
+        parts = []
+        async for event in stream_chat_response(messages, system_prompt, temperature):
+            if event["type"] == "delta":
+                parts.append(event["content"])
+        return "".join(parts)
+
+    client = get_llm_client()
+    model = get_model_name()
+    
+    # Generate response
+    response = await client.chat.completions.create(
+        model=model,
+        messages=build_chat_messages(messages, system_prompt),
+        temperature=temperature,
+    )
+    return response.choices[0].message.content
+
+
+async def stream_chat_response(
+    messages: List[Dict[str, str]],
+    system_prompt: Optional[str] = None,
+    temperature: float = 0.7,
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Stream a chat completion as it is generated
+    Yields {"type": "delta", "content": ...} per token delta, then one
+    {"type": "done", "model": ..., "finish_reason": ..., "usage": {...} or None}
+    The upstream stream is closed if the consumer stops early (e.g. the client disconnects)
+    """
     client = get_llm_client()
     model = get_model_name()
+    response = await client.chat.completions.create(
+        model=model,
+        messages=build_chat_messages(messages, system_prompt),
+        temperature=temperature,
+        stream=True,
+        stream_options={"include_usage": True},  # The last chunk reports token usage
+    )
     
-    # Prepare messages
+    usage = None
+    finish_reason = None
+    try:
+        async for chunk in response:
+            if getattr(chunk, "usage", None):
+                usage = {
+                    "prompt_tokens": chunk.usage.prompt_tokens,
+                    "completion_tokens": chunk.usage.completion_tokens,
+                    "total_tokens": chunk.usage.total_tokens,
+                }
+            if not chunk.choices:
+                continue
+            choice = chunk.choices[0]
+            if choice.delta.content:
+                yield {"type": "delta", "content": choice.delta.content}
+            if choice.finish_reason:
+                finish_reason = choice.finish_reason
+    finally:
+        # Releases the pooled connection (and stops generation if the consumer left early)
+        await response.close()
+    yield {"type": "done", "model": model, "finish_reason": finish_reason, "usage": usage}
+
+
+def build_chat_messages(messages: List[Dict[str, str]], system_prompt: Optional[str] = None) -> List[Dict[str, str]]:
+    """Prepend the system prompt (if any) to the conversation"""
     chat_messages = []
     if system_prompt:
         chat_messages.append({
@@ -72,24 +189,7 @@ async def generate_chat_response(
             "content": system_prompt,
         })
     chat_messages.extend(messages)
-    
-    # Generate response
-    response = client.chat.completions.create(
-        model=model,
-        messages=chat_messages,
-        temperature=temperature,
-        stream=stream,
-    )
-    
-    if stream:
-        # Handle streaming (for future implementation)
-        full_response = ""
-        for chunk in response:
-            if chunk.choices[0].delta.content:
-                full_response += chunk.choices[0].delta.content
-        return full_response
-    else:
-        return response.choices[0].message.content
+    return chat_messages
 
 
 async def generate_rag_response(
@@ -110,6 +210,36 @@ async def generate_rag_response(
     Returns:
         Generated response with context
     """
+    messages, system_prompt = build_rag_messages(user_query, context_chunks, conversation_history, system_prompt)
+    
+    # Generate response
+    response = await generate_chat_response(
+        messages=messages,
+        system_prompt=system_prompt,
+        temperature=0.7,
+    )
+    
+    return response
+
+
+def stream_rag_response(
+    user_query: str,
+    context_chunks: List[Dict[str, str]],
+    conversation_history: Optional[List[Dict[str, str]]] = None,
+    system_prompt: Optional[str] = None,
+) -> AsyncIterator[Dict[str, Any]]:
+    """Stream a RAG response as delta/done events (see stream_chat_response)"""
+    messages, system_prompt = build_rag_messages(user_query, context_chunks, conversation_history, system_prompt)
+    return stream_chat_response(messages=messages, system_prompt=system_prompt, temperature=0.7)
+
+
+def build_rag_messages(
+    user_query: str,
+    context_chunks: List[Dict[str, str]],
+    conversation_history: Optional[List[Dict[str, str]]] = None,
+    system_prompt: Optional[str] = None,
+) -> Tuple[List[Dict[str, str]], str]:
+    """Conversation messages and system prompt for a RAG answer"""
     # Build system prompt
     if not system_prompt:
         system_prompt = """You are a helpful AI assistant for customer support. 
@@ -117,10 +247,11 @@ Answer questions based on the provided context from the knowledge base.
 If the answer is not in the context, say so politely.
 Be concise, helpful, and professional."""
 
-    # Format context
+    # Format context: overlapping chunks are merged and the total kept within the token budget
+    passages = pack_context(context_chunks, tokenizer=get_llm_tokenizer(get_model_name()))
     context_text = "\n\n".join([
-        f"[Source: {chunk.get('source', 'unknown')}]\n{chunk.get('content', '')}"
-        for chunk in context_chunks
+        f"{source_header(passage)}{passage['content']}"
+        for passage in passages
     ])
     
     # Build messages
@@ -142,12 +273,4 @@ Please answer the user's question based on the context above."""
         "role": "user",
         "content": user_message,
     })
-    
-    # Generate response
-    response = await generate_chat_response(
-        messages=messages,
-        system_prompt=system_prompt,
-        temperature=0.7,
-    )
-    
-    return response
+    return messages, system_prompt
@@ -0,0 +1,213 @@
+"""
+In-process vector store (VECTOR_STORE=local):
+1. Each namespace keeps its vectors as rows of one float32 matrix, L2-normalized on insert
+2. Queries are exact: cosine similarity is one matrix-vector product, top-k via argpartition
+3. Deletes move the last row into the freed slot, so the matrix stays dense
+Needs pre-computed vectors (EMBEDDING_PROVIDER=local or openai); nothing leaves the process.
+"""
+import threading
+from typing import Any, Callable, Dict, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+from services.upsert import UpsertItem
+from services.vector_store import Match, VectorStore
+
+_INITIAL_CAPACITY = 1024
+# Candidates scored per requested result before metadata filters are applied
+_FILTER_OVERSAMPLE = 4
+
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    """L2-normalize each row (zero rows stay zero), so a dot product is cosine similarity"""
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def split_items(items: Sequence[UpsertItem]) -> Tuple[List[str], np.ndarray, List[Dict[str, Any]]]:
+    """(ids, float32 vectors, metadata) of (id, values, metadata) tuples"""
+    if isinstance(items[0], dict):
+        raise ValueError("The local vector store needs pre-computed vectors (EMBEDDING_PROVIDER=local or openai)")
+    ids = [record_id for record_id, _, _ in items]
+    vectors = np.asarray([values for _, values, _ in items], dtype=np.float32)
+    return ids, vectors, [dict(meta) for _, _, meta in items]
+
+
+def prepare_query(vector: Optional[List[float]], dimension: int) -> np.ndarray:
+    """Query as a unit float32 vector of the namespace's dimension"""
+    if vector is None:
+        raise ValueError("The local vector store needs a query vector")
+    query_vector = np.asarray(vector, dtype=np.float32)
+    if query_vector.shape != (dimension,):
+        raise ValueError(f"Query dimension {query_vector.shape[-1]} does not match namespace dimension {dimension}")
+    norm = np.linalg.norm(query_vector)
+    return query_vector / norm if norm else query_vector
+
+
+def top_k_indices(scores: np.ndarray, top_k: int) -> np.ndarray:
+    """Indices of the top_k highest scores, best first (O(n) selection, then a sort of k)"""
+    if top_k <= 0 or len(scores) == 0:
+        return np.zeros(0, dtype=np.int64)
+    if top_k >= len(scores):
+        return np.argsort(-scores, kind="stable")
+    candidates = np.argpartition(-scores, top_k - 1)[:top_k]
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+
+def rank_rows(
+    scores: np.ndarray,
+    top_k: int,
+    filter: Optional[Dict[str, Any]],
+    metadata_at: Callable[[int], Dict[str, Any]],
+) -> List[int]:
+    """
+    Rows of the top_k scores that pass the filter, best first (rows scored -inf are excluded).
+    The best few candidates are filtered first; everything is scanned only if too few pass.
+    """
+    candidates = top_k_indices(scores, top_k * _FILTER_OVERSAMPLE if filter else top_k)
+    rows = [row for row in candidates if scores[row] > -np.inf and matches_filter(metadata_at(row), filter)]
+    if filter and len(rows) < top_k and len(candidates) < len(scores):
+        rows = [
+            row for row in top_k_indices(scores, len(scores))
+            if scores[row] > -np.inf and matches_filter(metadata_at(row), filter)
+        ]
+    return [int(row) for row in rows[:top_k]]
+
+
+def matches_filter(metadata: Dict[str, Any], filter: Optional[Dict[str, Any]]) -> bool:
+    """Subset of Pinecone's metadata filter language: equality, $eq, $ne and $in"""
+    if not filter:
+        return True
+    for key, condition in filter.items():
+        value = metadata.get(key)
+        if isinstance(condition, dict):
+            for op, operand in condition.items():
+                if op == "$eq" and value != operand:
+                    return False
+                elif op == "$ne" and value == operand:
+                    return False
+                elif op == "$in" and value not in operand:
+                    return False
+                elif op not in ("$eq", "$ne", "$in"):
+                    raise ValueError(f"Unsupported filter operator: {op}")
+        elif value != condition:
+            return False
+    return True
+
+
+class NamespaceMatrix:
+    """One namespace: a capacity-doubling float32 matrix plus its ids and metadata"""
+
+    def __init__(self, dimension: int):
+        self.dimension = dimension
+        self.vectors = np.zeros((_INITIAL_CAPACITY, dimension), dtype=np.float32)
+        self.ids: List[str] = []
+        self.metadata: List[Dict[str, Any]] = []
+        self.rows: Dict[str, int] = {}
+        self.lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def upsert(self, ids: List[str], vectors: np.ndarray, metadata: List[Dict[str, Any]]) -> None:
+        vectors = normalize_rows(vectors)
+        for record_id, vector, meta in zip(ids, vectors, metadata):
+            row = self.rows.get(record_id)
+            if row is None:
+                row = len(self.ids)
+                if row == len(self.vectors):
+                    grown = np.zeros((2 * len(self.vectors), self.dimension), dtype=np.float32)
+                    grown[:row] = self.vectors[:row]
+                    self.vectors = grown
+                self.ids.append(record_id)
+                self.metadata.append(meta)
+                self.rows[record_id] = row
+            else:
+                self.metadata[row] = meta
+            self.vectors[row] = vector
+
+    def delete(self, ids: Sequence[str]) -> None:
+        for record_id in ids:
+            row = self.rows.pop(record_id, None)
+            if row is None:
+                continue
+            last = len(self.ids) - 1
+            if row != last:
+                # Fill the hole with the last row instead of shifting everything after it
+                self.vectors[row] = self.vectors[last]
+                self.ids[row] = self.ids[last]
+                self.metadata[row] = self.metadata[last]
+                self.rows[self.ids[row]] = row
+            self.ids.pop()
+            self.metadata.pop()
+
+    def query(self, vector: np.ndarray, top_k: int, filter: Optional[Dict[str, Any]]) -> List[Match]:
+        scores = self.vectors[:len(self.ids)] @ vector
+        return [
+            Match(id=self.ids[row], score=float(scores[row]), metadata=dict(self.metadata[row]))
+            for row in rank_rows(scores, top_k, filter, self.metadata.__getitem__)
+        ]
+
+
+class NumpyVectorStore(VectorStore):
+    """Exact cosine search over per-namespace matrices held in memory"""
+
+    def __init__(self):
+        self._namespaces: Dict[str, NamespaceMatrix] = {}
+        self._lock = threading.Lock()
+
+    def _namespace(self, namespace: Optional[str], dimension: Optional[int] = None) -> Optional[NamespaceMatrix]:
+        with self._lock:
+            matrix = self._namespaces.get(namespace or "")
+            if matrix is None and dimension is not None:
+                matrix = self._namespaces[namespace or ""] = NamespaceMatrix(dimension)
+            return matrix
+
+    def upsert(self, namespace: Optional[str], items: Sequence[UpsertItem]) -> None:
+        items = list(items)
+        if not items:
+            return
+        ids, vectors, metadata = split_items(items)
+        matrix = self._namespace(namespace, dimension=vectors.shape[1])
+        if vectors.shape[1] != matrix.dimension:
+            raise ValueError(f"Vector dimension {vectors.shape[1]} does not match namespace dimension {matrix.dimension}")
+        with matrix.lock:
+            matrix.upsert(ids, vectors, metadata)
+
+    def query(self, namespace, top_k, vector=None, text=None, filter=None) -> List[Match]:
+        if vector is None:
+            raise ValueError("The local vector store needs a query vector")
+        matrix = self._namespace(namespace)
+        if matrix is None:
+            return []
+        query_vector = prepare_query(vector, matrix.dimension)
+        with matrix.lock:
+            return matrix.query(query_vector, top_k, filter)
+
+    def delete(self, namespace: Optional[str], ids: Sequence[str]) -> None:
+        matrix = self._namespace(namespace)
+        if matrix is not None:
+            with matrix.lock:
+                matrix.delete(ids)
+
+    def list_ids(self, namespace: Optional[str], prefix: str) -> Set[str]:
+        matrix = self._namespace(namespace)
+        if matrix is None:
+            return set()
+        with matrix.lock:
+            return {record_id for record_id in matrix.ids if record_id.startswith(prefix)}
+
+    def fetch(self, namespace: Optional[str], ids: Sequence[str]) -> Dict[str, Dict[str, Any]]:
+        matrix = self._namespace(namespace)
+        if matrix is None:
+            return {}
+        with matrix.lock:
+            return {record_id: dict(matrix.metadata[matrix.rows[record_id]]) for record_id in ids if record_id in matrix.rows}
+
+    def list_namespaces(self) -> List[str]:
+        with self._lock:
+            return sorted(self._namespaces)
+
+    def delete_namespace(self, namespace: str) -> None:
+        with self._lock:
+            self._namespaces.pop(namespace or "", None)
@@ -0,0 +1,110 @@
+"""
+In-process LRU cache bounded by bytes, with per-entry TTL:
+1. Entries are evicted least-recently-used first once the byte budget is exceeded
+2. Expired entries are dropped when read
+3. Hit/miss/eviction counters are kept for monitoring
+Per process only; use it for small hot values (query vectors, search results).
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+
+class LRUCache:
+    """
+    Byte-bounded LRU with optional TTL.
+    Safe to call from the event loop and from executor threads.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int,
+        ttl_seconds: Optional[float] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds if ttl_seconds and ttl_seconds > 0 else None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._clock = clock
+        self._entries: "OrderedDict[Hashable, Tuple[Any, int, Optional[float]]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            value, _, expires_at = entry
+            if expires_at is not None and expires_at <= self._clock():
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def peek(self, key: Hashable, default: Any = None) -> Any:
+        """Read without counting a hit or refreshing recency (expired entries are still dropped)"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            value, _, expires_at = entry
+            if expires_at is not None and expires_at <= self._clock():
+                self._remove(key)
+                self.expirations += 1
+                return default
+            return value
+
+    def put(self, key: Hashable, value: Any, size: int) -> None:
+        """Store a value with its approximate size in bytes; values over the whole budget are not cached"""
+        if size > self.max_bytes:
+            return
+        expires_at = self._clock() + self.ttl_seconds if self.ttl_seconds else None
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, size, expires_at)
+            self._bytes += size
+            self._evict()
+
+    def delete(self, key: Hashable) -> None:
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+        }
+
+    def _remove(self, key: Hashable) -> None:
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def _evict(self) -> None:
+        # Stale entries are usually least recently used too, so plain LRU order reclaims them first
+        while self._bytes > self.max_bytes:
+            key = next(iter(self._entries))
+            self._remove(key)
+            self.evictions += 1
@@ -0,0 +1,131 @@
+"""
+Parallel PDF text extraction:
+1. Page ranges are split across the process pool (PyPDF2 is pure Python and GIL-bound)
+2. Each page has a timeout so one pathological page cannot stall a worker
+3. Results are joined in page order and keep their page numbers
+"""
+import asyncio
+import logging
+import math
+import os
+import signal
+import threading
+from contextlib import contextmanager
+from typing import List, Optional, Tuple
+
+import PyPDF2
+
+from services.aio import PROCESS_EXECUTOR_WORKERS, run_cpu, run_process
+from services.spool import DocumentSource, open_source
+
+logger = logging.getLogger("resonance.kb.pdf")
+
+# Configuration
+PDF_PAGE_TIMEOUT_SECONDS = float(os.getenv("PDF_PAGE_TIMEOUT_SECONDS", "10"))
+PDF_MIN_PAGES_PER_TASK = int(os.getenv("PDF_MIN_PAGES_PER_TASK", "8"))  # Below this, fan-out costs more than it saves
+
+# (page_number starting at 1, page text)
+Page = Tuple[int, str]
+
+
+class PageTimeoutError(Exception):
+    """Raised inside a worker when a single page takes too long to extract"""
+
+
+class InvalidPdfError(ValueError):
+    """Raised when a PDF cannot be parsed (a ValueError, so ingestion jobs do not retry it)"""
+
+
+@contextmanager
+def _parse_errors():
+    """Re-raise PyPDF2's errors for corrupt or truncated files as InvalidPdfError"""
+    try:
+        yield
+    except PyPDF2.errors.PyPdfError as e:
+        raise InvalidPdfError(f"Unreadable PDF: {e}") from None
+
+
+@contextmanager
+def _time_limit(seconds: float):
+    """SIGALRM-based limit; only effective in a process's main thread (pool workers run tasks there)"""
+    if seconds <= 0 or not hasattr(signal, "setitimer") or threading.current_thread() is not threading.main_thread():
+        yield
+        return
+
+    def on_alarm(signum, frame):
+        raise PageTimeoutError()
+
+    previous = signal.signal(signal.SIGALRM, on_alarm)
+    signal.setitimer(signal.ITIMER_REAL, seconds)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+
+def count_pages(content: DocumentSource) -> int:
+    with open_source(content) as stream, _parse_errors():
+        return len(PyPDF2.PdfReader(stream).pages)
+
+
+def extract_page_range(
+    content: DocumentSource,
+    first: int = 0,
+    last: Optional[int] = None,
+    page_timeout: float = PDF_PAGE_TIMEOUT_SECONDS,
+) -> List[Page]:
+    """
+    Extract pages [first, last) (0-based, all by default); timed-out pages come back empty.
+    A spooled upload is memory-mapped, so each worker process reads the same file pages.
+    """
+    with open_source(content) as stream, _parse_errors():
+        reader = PyPDF2.PdfReader(stream)
+        last = len(reader.pages) if last is None else min(last, len(reader.pages))
+        pages = []
+        for index in range(first, last):
+            try:
+                with _time_limit(page_timeout):
+                    text = reader.pages[index].extract_text() or ""
+            except PageTimeoutError:
+                logger.warning("PDF page %d exceeded %.0fs extraction timeout; skipped", index + 1, page_timeout)
+                text = ""
+            pages.append((index + 1, text))
+    return pages
+
+
+def split_page_ranges(page_count: int, workers: int, min_pages: int = PDF_MIN_PAGES_PER_TASK) -> List[Tuple[int, int]]:
+    """Contiguous, near-equal page ranges: at most one per worker, at least min_pages each"""
+    tasks = max(1, min(workers, math.ceil(page_count / max(1, min_pages))))
+    size = math.ceil(page_count / tasks) if page_count else 0
+    return [(start, min(start + size, page_count)) for start in range(0, page_count, size or 1)]
+
+
+async def extract_pdf_pages(content: DocumentSource) -> List[Page]:
+    """
+    Extract all pages in parallel across the process pool, in page order.
+    Spooled uploads are sent to workers as a file path; bytes are pickled per task.
+    """
+    page_count = await run_cpu(count_pages, content)
+    ranges = split_page_ranges(page_count, PROCESS_EXECUTOR_WORKERS)
+    parts = await asyncio.gather(*(
+        run_process(extract_page_range, content, first, last, PDF_PAGE_TIMEOUT_SECONDS)
+        for first, last in ranges
+    ))
+    return [page for part in parts for page in part]
+
+
+def join_pages(pages: List[Page]) -> Tuple[str, List[Tuple[int, int]]]:
+    """
+    Join page texts with newlines in one pass.
+    Returns the text and (start_offset, page_number) for each page.
+    """
+    parts = []
+    offsets = []
+    position = 0
+    for number, text in pages:
+        offsets.append((position, number))
+        parts.append(text)
+        parts.append("\n")
+        position += len(text) + 1
+    return "".join(parts), offsets
@@ -0,0 +1,73 @@
+"""
+Streaming stages for ingestion:
+1. Blocking generators (chunking, hashing) are advanced on the CPU executor
+2. A producer stage (embedding) and a consumer stage (upsert) run concurrently
+3. A bounded queue between them caps how many batches are held in memory
+So embedding batch N overlaps with upserting batch N-1, and peak memory depends
+on the batch size and queue depth rather than on the document size.
+"""
+import asyncio
+import os
+from typing import AsyncIterator, Awaitable, Callable, Iterator, TypeVar
+
+from services.aio import run_cpu
+
+T = TypeVar("T")
+
+# Configuration
+INGEST_PIPELINE_DEPTH = int(os.getenv("INGEST_PIPELINE_DEPTH", "2"))  # Batches buffered between stages
+
+_DONE = object()
+
+
+class _Failure:
+    """Carries a producer exception through the queue to the consumer"""
+
+    def __init__(self, error: Exception):
+        self.error = error
+
+
+async def iterate_blocking(iterator: Iterator[T]) -> AsyncIterator[T]:
+    """Advance a blocking iterator on the CPU executor, one item per call"""
+    while True:
+        item = await run_cpu(next, iterator, _DONE)
+        if item is _DONE:
+            return
+        yield item
+
+
+async def run_pipeline(
+    source: AsyncIterator[T],
+    sink: Callable[[T], Awaitable[None]],
+    depth: int = INGEST_PIPELINE_DEPTH,
+) -> None:
+    """
+    Feed items from source to sink while source produces the next ones.
+    At most depth items wait between the stages; the producer pauses when the queue is full.
+    An exception in either stage stops both and is raised.
+    """
+    queue: asyncio.Queue = asyncio.Queue(maxsize=max(1, depth))
+
+    async def produce() -> None:
+        try:
+            async for item in source:
+                await queue.put(item)
+        except Exception as e:
+            await queue.put(_Failure(e))
+        else:
+            await queue.put(_DONE)
+
+    producer = asyncio.create_task(produce())
+    try:
+        while True:
+            item = await queue.get()
+            if item is _DONE:
+                break
+            if isinstance(item, _Failure):
+                raise item.error
+            await sink(item)
+            del item  # Release the batch before waiting for the next one
+    finally:
+        if not producer.done():
+            producer.cancel()
+        await asyncio.gather(producer, return_exceptions=True)
@@ -0,0 +1,119 @@
+"""
+Search result cache:
+1. Formatted search results are cached per (assistant_id, normalized query, top_k)
+2. Each assistant has a generation number that is part of every key
+3. Ingesting into an assistant bumps its generation, so older entries are never read again
+4. Storage is a pluggable backend: in-process LRU by default; a shared cache
+   (e.g. Redis) can implement the same four methods
+A search that races with an ingest stores its result under the generation it
+started with, so a stale result cannot outlive the invalidation.
+"""
+import hashlib
+import os
+from typing import Dict, List, Optional, Tuple
+
+from services.embedding_cache import normalize_text
+from services.memory_cache import LRUCache
+
+# Configuration
+SEARCH_RESULT_CACHE_MAX_BYTES = int(os.getenv("SEARCH_RESULT_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))  # 0 disables
+# Bounds staleness for other processes, which do not see this process's invalidations
+SEARCH_RESULT_CACHE_TTL_SECONDS = float(os.getenv("SEARCH_RESULT_CACHE_TTL_SECONDS", "300"))
+
+# Approximate per-result overhead on top of its text (dict, keys, scores)
+_RESULT_OVERHEAD_BYTES = 400
+
+Results = List[Dict]
+
+
+class ResultCacheBackend:
+    """Storage for cached results and per-assistant generations"""
+
+    async def get(self, key: str) -> Optional[Results]:
+        raise NotImplementedError
+
+    async def set(self, key: str, results: Results) -> None:
+        raise NotImplementedError
+
+    async def generation(self, assistant_id: str) -> int:
+        raise NotImplementedError
+
+    async def bump_generation(self, assistant_id: str) -> int:
+        raise NotImplementedError
+
+
+class InMemoryResultCacheBackend(ResultCacheBackend):
+    """Per-process LRU (bounded by bytes, with TTL); invalidations are not seen by other processes"""
+
+    def __init__(self, max_bytes: Optional[int] = None, ttl_seconds: Optional[float] = None):
+        self.entries = LRUCache(
+            max_bytes=SEARCH_RESULT_CACHE_MAX_BYTES if max_bytes is None else max_bytes,
+            ttl_seconds=SEARCH_RESULT_CACHE_TTL_SECONDS if ttl_seconds is None else ttl_seconds,
+        )
+        self._generations: Dict[str, int] = {}
+
+    async def get(self, key: str) -> Optional[Results]:
+        results = self.entries.get(key)
+        # Copies, so callers cannot mutate what later hits will see
+        return [dict(result) for result in results] if results is not None else None
+
+    async def set(self, key: str, results: Results) -> None:
+        size = sum(len(result.get("content") or "") + _RESULT_OVERHEAD_BYTES for result in results) + len(key)
+        self.entries.put(key, [dict(result) for result in results], size=size)
+
+    async def generation(self, assistant_id: str) -> int:
+        return self._generations.get(assistant_id, 0)
+
+    async def bump_generation(self, assistant_id: str) -> int:
+        self._generations[assistant_id] = self._generations.get(assistant_id, 0) + 1
+        return self._generations[assistant_id]
+
+
+class SearchResultCache:
+    """Keys, generations and invalidation on top of a backend"""
+
+    def __init__(self, backend: ResultCacheBackend):
+        self.backend = backend
+
+    @staticmethod
+    def normalize_query(query: str) -> str:
+        # Case-insensitive: "Pricing" and "pricing" retrieve the same chunks in practice
+        return normalize_text(query).casefold()
+
+    async def lookup(self, assistant_id: str, query: str, top_k: int) -> Tuple[Optional[Results], str]:
+        """Return (cached results or None, key to store fresh results under)"""
+        generation = await self.backend.generation(assistant_id)
+        digest = hashlib.sha256(self.normalize_query(query).encode("utf-8")).hexdigest()
+        key = f"search:{assistant_id}:{generation}:{top_k}:{digest}"
+        return await self.backend.get(key), key
+
+    async def store(self, key: str, results: Results) -> None:
+        await self.backend.set(key, results)
+
+    async def invalidate(self, assistant_id: str) -> None:
+        await self.backend.bump_generation(assistant_id)
+
+
+# Process-wide cache used by retrieval and invalidated by ingestion
+_search_result_cache: Optional[SearchResultCache] = None
+
+
+def get_search_result_cache() -> Optional[SearchResultCache]:
+    """Shared result cache, or None when disabled (SEARCH_RESULT_CACHE_MAX_BYTES=0)"""
+    global _search_result_cache
+    if _search_result_cache is None and SEARCH_RESULT_CACHE_MAX_BYTES > 0:
+        _search_result_cache = SearchResultCache(InMemoryResultCacheBackend())
+    return _search_result_cache
+
+
+def set_search_result_backend(backend: ResultCacheBackend) -> None:
+    """Replace the storage backend (e.g. with a shared cache at startup)"""
+    global _search_result_cache
+    _search_result_cache = SearchResultCache(backend)
+
+
+async def invalidate_search_results(assistant_id: str) -> None:
+    """Drop cached results for an assistant after its records change"""
+    cache = get_search_result_cache()
+    if cache is not None:
+        await cache.invalidate(assistant_id)
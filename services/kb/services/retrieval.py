@@ -1,118 +1,247 @@
 """
 Retrieval pipeline for RAG:
 1. Generate query embedding (Pinecone integrated, local, or OpenAI)
-2. Search Pinecone vector database
-3. Return top-k relevant chunks with metadata
+2. Search the vector store (Pinecone, or in-process with VECTOR_STORE=local)
+   and the BM25 keyword index side by side
+3. Fuse both rankings with reciprocal-rank fusion (exact terms like SKUs and error codes
+   are found even when their embeddings are not close)
+4. Return top-k relevant chunks with metadata
 """
+import asyncio
 import os
-from typing import List, Dict
-from openai import OpenAI
-from pinecone import Pinecone
+from typing import List, Dict, Optional, Tuple
+import numpy as np
+
+from services import embeddings
+from services.aio import run_io
+from services.embedding_cache import cache_key, get_embedding_cache
+from services.embeddings import encode_queries, get_embedding_cache_model
+from services.lexical import get_lexical_index
+from services.memory_cache import LRUCache
+from services.result_cache import get_search_result_cache
+from services.vector_store import Match, get_vector_store
 
 # Configuration
-EMBEDDING_PROVIDER = os.getenv("EMBEDDING_PROVIDER", "pinecone")
-PINECONE_INDEX_NAME = os.getenv("PINECONE_INDEX_NAME", "sterling-willow")
-
-# Lazy-load clients
-_pinecone_client = None
-_openai_client = None
-_local_embedding_model = None
-
-def get_pinecone_client():
-    global _pinecone_client
-    if _pinecone_client is None:
-        api_key = os.getenv("PINECONE_API_KEY")
-        if not api_key:
-            raise ValueError("PINECONE_API_KEY environment variable is required")
-        _pinecone_client = Pinecone(api_key=api_key)
-    return _pinecone_client
-
-def get_openai_client():
-    global _openai_client
-    if _openai_client is None:
-        api_key = os.getenv("OPENAI_API_KEY")
-        if not api_key:
-            raise ValueError("OPENAI_API_KEY is required for embeddings")
-        _openai_client = OpenAI(api_key=api_key)
-    return _openai_client
+QUERY_EMBEDDING_CACHE_MAX_BYTES = int(os.getenv("QUERY_EMBEDDING_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))  # 0 disables
+QUERY_EMBEDDING_CACHE_TTL_SECONDS = float(os.getenv("QUERY_EMBEDDING_CACHE_TTL_SECONDS", "3600"))
+HYBRID_RRF_K = int(os.getenv("HYBRID_RRF_K", "60"))  # Damps the weight of top ranks in the fusion
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "4"))  # Each ranking fetches top_k x this many
+
+# Per-entry bookkeeping on top of the vector itself (key string, tuple, OrderedDict slot)
+_QUERY_CACHE_ENTRY_OVERHEAD = 256
+
+# Lazy-load caches
+_query_embedding_cache = None
+
+def get_query_embedding_cache() -> Optional[LRUCache]:
+    """
+    In-process cache of query vectors, shared by /search and /chat.
+    Sits in front of the persistent embedding cache, so repeated questions skip
+    both the SQLite lookup and the embedding call.
+    """
+    global _query_embedding_cache
+    if QUERY_EMBEDDING_CACHE_MAX_BYTES <= 0:
+        return None
+    if _query_embedding_cache is None:
+        _query_embedding_cache = LRUCache(
+            max_bytes=QUERY_EMBEDDING_CACHE_MAX_BYTES,
+            ttl_seconds=QUERY_EMBEDDING_CACHE_TTL_SECONDS,
+        )
+    return _query_embedding_cache
 
 
 async def search_knowledge_base(
     query: str,
     assistant_id: str,
     top_k: int = 5,
+    query_vector: Optional[List[float]] = None,
 ) -> List[Dict]:
     """
-    Search knowledge base using semantic similarity
+    Search knowledge base using semantic similarity fused with BM25 keyword matches
     Returns list of relevant document chunks with scores
+    Results are cached per assistant until its next ingest
+    query_vector skips embedding the query when the caller already has it (e.g. for the answer cache)
     """
-    # Search Pinecone
-    pc = get_pinecone_client()
-    index_name = PINECONE_INDEX_NAME  # Use configured index name
-    index = pc.Index(index_name)
+    result_cache = get_search_result_cache()
+    if result_cache is not None:
+        cached, result_key = await result_cache.lookup(assistant_id, query, top_k)
+        if cached is not None:
+            return cached
     
-    if EMBEDDING_PROVIDER == "pinecone":
-        # Pinecone integrated embeddings - use search_records()
-        from pinecone import SearchQuery
-        response = index.search_records(
-            namespace=assistant_id,  # Query within assistant's namespace
-            query=SearchQuery(
-                inputs={"text": query},  # Text query - Pinecone embeds it automatically
-                top_k=top_k
-            )
-        )
-        # Convert response format to match standard query results
-        class Match:
-            def __init__(self, hit):
-                self.id = hit['_id']
-                self.score = hit['_score']
-                self.metadata = hit.get('fields', {})
-        
-        class Results:
-            def __init__(self, hits):
-                self.matches = [Match(hit) for hit in hits]
-        
-        results = Results(response.result['hits'])
+    formatted_results = await run_search(query, assistant_id, top_k, query_vector=query_vector)
+    
+    if result_cache is not None:
+        await result_cache.store(result_key, formatted_results)
+    return formatted_results
+
+
+async def search_knowledge_base_batch(searches: List[Tuple[str, str, int]]) -> List[List[Dict]]:
+    """
+    Run many (query, assistant_id, top_k) searches at once, returning results in input order
+    Cached results are served first; the remaining queries are embedded in one batched call
+    and their index queries run concurrently
+    """
+    result_cache = get_search_result_cache()
+    results: List[Optional[List[Dict]]] = [None] * len(searches)
+    result_keys: Dict[int, str] = {}
+    if result_cache is not None:
+        for i, (query, assistant_id, top_k) in enumerate(searches):
+            results[i], result_keys[i] = await result_cache.lookup(assistant_id, query, top_k)
+    pending = [i for i, cached in enumerate(results) if cached is None]
+    
+    if embeddings.EMBEDDING_PROVIDER == "pinecone" or not pending:
+        # Pinecone integrated embeddings embed each text query server-side
+        query_vectors = [None] * len(pending)
     else:
-        # Generate query embedding (local or OpenAI)
-        if EMBEDDING_PROVIDER == "local":
-            # Use local sentence-transformers model (free, fast)
-            model = get_local_embedding_model()
-            query_vector = model.encode(query, convert_to_numpy=True).tolist()
-        else:
-            # Use OpenAI API (following OpenAI cookbook pattern)
-            # Reference: https://cookbook.openai.com/examples/vector_databases/pinecone/using_pinecone_for_embeddings_search
-            openai = get_openai_client()
-            embedding_response = openai.embeddings.create(
-                model="text-embedding-3-small",
-                input=query
-            )
-            query_vector = embedding_response.data[0].embedding
-        
-        # Query with pre-computed vector
-        results = index.query(
-            vector=query_vector,
-            top_k=top_k,
-            include_metadata=True,
+        query_vectors = await embed_queries([searches[i][0] for i in pending])
+    
+    found = await asyncio.gather(*(
+        run_search(*searches[i], query_vector=query_vector)
+        for i, query_vector in zip(pending, query_vectors)
+    ))
+    for i, formatted_results in zip(pending, found):
+        results[i] = formatted_results
+        if result_cache is not None:
+            await result_cache.store(result_keys[i], formatted_results)
+    return results
+
+
+async def run_search(
+    query: str,
+    assistant_id: str,
+    top_k: int,
+    query_vector: Optional[List[float]] = None,
+) -> List[Dict]:
+    """Dense and keyword search for one query, fused and formatted (no result cache)"""
+    store = get_vector_store()
+    namespace = store.namespace_for(assistant_id, integrated=embeddings.EMBEDDING_PROVIDER == "pinecone")
+    lexical = get_lexical_index()
+    candidates = top_k * HYBRID_CANDIDATES if lexical is not None else top_k
+    
+    async def dense_search() -> List[Match]:
+        if embeddings.EMBEDDING_PROVIDER == "pinecone":
+            # Pinecone integrated embeddings - text query within the assistant's namespace
+            return await run_io(store.query, namespace, candidates, text=query)
+        # Query with pre-computed vector (embedded here unless the caller batched it)
+        return await run_io(
+            store.query,
+            namespace,
+            candidates,
+            vector=query_vector if query_vector is not None else await embed_query(query),
             filter={
                 "assistant_id": assistant_id,
             },
         )
     
-    # Step 3: Format results
-    formatted_results = []
-    for match in results.matches:
-        formatted_results.append({
-            "content": match.metadata.get("text", ""),
-            "source": match.metadata.get("filename", "unknown"),
-            "score": match.score,
-            "document_id": match.metadata.get("document_id"),
-            "chunk_index": match.metadata.get("chunk_index"),
-        })
+    if lexical is None:
+        matches, keyword_hits = await dense_search(), []
+    else:
+        # Both searches run concurrently; the keyword index is keyed by assistant like the result cache
+        matches, keyword_hits = await asyncio.gather(
+            dense_search(),
+            run_io(lexical.search, assistant_id, query, candidates),
+        )
     
+    # Step 3-4: Fuse and format results
+    if keyword_hits:
+        formatted_results = fuse_rankings(matches, keyword_hits, top_k)
+    else:
+        formatted_results = [format_result(match.metadata, match.score) for match in matches[:top_k]]
     return formatted_results
 
 
+def fuse_rankings(
+    matches: List[Match],
+    keyword_hits: List[Tuple[Dict, float]],
+    top_k: int,
+) -> List[Dict]:
+    """
+    Reciprocal-rank fusion: each chunk scores sum(1 / (HYBRID_RRF_K + rank)) over the rankings it is in.
+    Results are ordered by that fused_score; "score" stays the vector similarity (0.0 for keyword-only hits)
+    and the per-ranking scores are kept as vector_score and lexical_score.
+    """
+    fused: Dict[str, Dict] = {}
+    rankings = (
+        ("vector_score", [(match.id, match.metadata, match.score) for match in matches]),
+        ("lexical_score", [(record["id"], record["metadata"], score) for record, score in keyword_hits]),
+    )
+    for field, ranking in rankings:
+        for rank, (record_id, metadata, score) in enumerate(ranking, start=1):
+            entry = fused.setdefault(record_id, {"metadata": metadata, "fused_score": 0.0, "vector_score": None, "lexical_score": None})
+            entry["fused_score"] += 1.0 / (HYBRID_RRF_K + rank)
+            entry[field] = score
+    ranked = sorted(fused.values(), key=lambda entry: entry["fused_score"], reverse=True)[:top_k]
+    return [
+        {
+            **format_result(entry["metadata"], entry["vector_score"] if entry["vector_score"] is not None else 0.0),
+            "fused_score": entry["fused_score"],
+            "vector_score": entry["vector_score"],
+            "lexical_score": entry["lexical_score"],
+        }
+        for entry in ranked
+    ]
+
+
+def format_result(metadata: Dict, score: float) -> Dict:
+    return {
+        "content": metadata.get("text", ""),
+        "source": metadata.get("filename", "unknown"),
+        "score": score,
+        "document_id": metadata.get("document_id"),
+        "chunk_index": metadata.get("chunk_index"),
+        "page": metadata.get("page"),
+        "start": metadata.get("start"),
+        "end": metadata.get("end"),
+    }
+
+
+async def embed_query(query: str) -> List[float]:
+    """Embed a search query with the local or OpenAI provider"""
+    (query_vector,) = await embed_queries([query])
+    return query_vector
+
+
+async def embed_queries(queries: List[str]) -> List[List[float]]:
+    """
+    Embed search queries with the local or OpenAI provider, one vector per query in order.
+    Checks the in-process query cache, then the persistent embedding cache;
+    the rest (deduplicated) are embedded in one batched call.
+    """
+    model_name = get_embedding_cache_model()
+    query_cache = get_query_embedding_cache()
+    # Keyed by provider, model and whitespace/unicode-normalized query (case is kept: it can change the vector)
+    keys = [cache_key(embeddings.EMBEDDING_PROVIDER, model_name, query) for query in queries]
+    vectors: Dict[str, List[float]] = {}
+    if query_cache is not None:
+        for key in dict.fromkeys(keys):
+            cached = query_cache.get(key)
+            if cached is not None:
+                vectors[key] = cached.tolist()
+
+    missing = {key: query for key, query in zip(keys, queries) if key not in vectors}
+    resolved = list(missing)  # Keys the query LRU does not hold yet
+    cache = get_embedding_cache()
+    if missing and cache is not None:
+        cached_vectors = await run_io(cache.get_many, embeddings.EMBEDDING_PROVIDER, model_name, list(missing.values()))
+        for key, cached in zip(list(missing), cached_vectors):
+            if cached is not None:
+                vectors[key] = cached.tolist()
+                del missing[key]
+    
+    if missing:
+        fresh = (await encode_queries(list(missing.values()))).tolist()
+        if cache is not None:
+            await run_io(cache.put_many, embeddings.EMBEDDING_PROVIDER, model_name, list(missing.values()), fresh)
+        vectors.update(zip(missing, fresh))
+
+    if query_cache is not None:
+        # Persistent-cache hits go into the LRU too, so repeats stop reaching SQLite
+        for key in resolved:
+            vector = np.asarray(vectors[key], dtype=np.float32)  # ~4 bytes per value instead of ~32 as floats
+            query_cache.put(key, vector, size=vector.nbytes + len(key) + _QUERY_CACHE_ENTRY_OVERHEAD)
+    return [vectors[key] for key in keys]
+
+
 # Note: Pinecone handles embedding generation automatically
 # when using integrated OpenAI embeddings, so we don't need
 # a separate generate_query_embedding function
@@ -0,0 +1,130 @@
+"""
+Upload spooling:
+1. Uploads are streamed to a temp file in fixed-size pieces; the size cap is enforced mid-stream
+2. Extractors read the file through a read-only mmap (PDF) or decode straight from it (text)
+3. Worker processes receive the file path, not the bytes
+So an in-flight upload costs a few MiB of heap regardless of its size, and the
+upload cap can be raised without raising pod memory.
+"""
+import mmap
+import os
+import tempfile
+from contextlib import contextmanager
+from dataclasses import dataclass
+from io import BytesIO
+from typing import BinaryIO, Iterator, Optional, Union
+
+from services.aio import run_io
+
+# Configuration
+UPLOAD_SPOOL_DIR = os.getenv("UPLOAD_SPOOL_DIR") or None  # None: system temp dir
+UPLOAD_SPOOL_CHUNK_BYTES = int(os.getenv("UPLOAD_SPOOL_CHUNK_BYTES", str(1024 * 1024)))
+
+
+class UploadTooLargeError(ValueError):
+    """Raised while spooling when an upload exceeds the size limit"""
+
+
+@dataclass
+class SpooledUpload:
+    """An upload stored in a temp file; picklable, so it can be handed to worker processes"""
+    path: str
+    size: int
+    temporary: bool = True  # False for files read in place (e.g. by the CLI); never deleted
+
+    def cleanup(self) -> None:
+        if not self.temporary:
+            return
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+
+# Raw bytes (tests, small internal callers) or a spooled upload
+DocumentSource = Union[bytes, SpooledUpload]
+
+
+async def spool_upload(
+    file,
+    max_bytes: int,
+    chunk_bytes: int = UPLOAD_SPOOL_CHUNK_BYTES,
+    spool_dir: Optional[str] = UPLOAD_SPOOL_DIR,
+) -> SpooledUpload:
+    """
+    Stream an UploadFile-like object (async read(n)) to a temp file.
+    Raises UploadTooLargeError as soon as more than max_bytes have been read.
+    """
+    fd, path = tempfile.mkstemp(prefix="kb-upload-", dir=spool_dir)
+    spooled = SpooledUpload(path=path, size=0)
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while True:
+                piece = await file.read(chunk_bytes)
+                if not piece:
+                    break
+                spooled.size += len(piece)
+                if spooled.size > max_bytes:
+                    raise UploadTooLargeError(f"Upload exceeds {max_bytes} bytes")
+                await run_io(out.write, piece)
+    except BaseException:
+        spooled.cleanup()
+        raise
+    return spooled
+
+
+def spool_file(
+    fileobj: BinaryIO,
+    max_bytes: int,
+    chunk_bytes: int = UPLOAD_SPOOL_CHUNK_BYTES,
+    spool_dir: Optional[str] = UPLOAD_SPOOL_DIR,
+) -> SpooledUpload:
+    """Blocking counterpart of spool_upload for file objects (e.g. archive members)"""
+    fd, path = tempfile.mkstemp(prefix="kb-upload-", dir=spool_dir)
+    spooled = SpooledUpload(path=path, size=0)
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while True:
+                piece = fileobj.read(chunk_bytes)
+                if not piece:
+                    break
+                spooled.size += len(piece)
+                # Archive headers can lie about member sizes, so count what is actually read
+                if spooled.size > max_bytes:
+                    raise UploadTooLargeError(f"Upload exceeds {max_bytes} bytes")
+                out.write(piece)
+    except BaseException:
+        spooled.cleanup()
+        raise
+    return spooled
+
+
+def release_source(source: Optional[DocumentSource]) -> None:
+    """Delete the spool file behind a source (no-op for bytes)"""
+    if isinstance(source, SpooledUpload):
+        source.cleanup()
+
+
+@contextmanager
+def open_source(source: DocumentSource) -> Iterator[BinaryIO]:
+    """Seekable read-only view of a source without copying it into the heap"""
+    if not isinstance(source, SpooledUpload):
+        yield BytesIO(source)  # Shares the bytes buffer until written to
+        return
+    with open(source.path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            yield BytesIO(b"")  # mmap cannot map an empty file
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            yield mapped
+
+
+def read_text(source: DocumentSource, encoding: str = "utf-8") -> str:
+    """Decode a source as text; the spool is decoded in place, only the str is allocated"""
+    if not isinstance(source, SpooledUpload):
+        return source.decode(encoding)
+    with open_source(source) as mapped:
+        if isinstance(mapped, BytesIO):
+            return ""
+        with memoryview(mapped) as view:
+            return str(view, encoding)
@@ -0,0 +1,147 @@
+"""
+Batched upsert pipeline for Pinecone:
+1. Split records into batches bounded by record count and request bytes
+2. Send batches concurrently with a bounded fan-out
+3. Retry each batch with exponential backoff
+4. Report failed record IDs instead of failing the whole document
+"""
+import asyncio
+import json
+import logging
+import os
+import random
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Sequence, Union
+
+from services.aio import run_io
+
+logger = logging.getLogger("resonance.kb.upsert")
+
+# Configuration
+# upsert_records() accepts at most 96 records per call; upsert() allows more,
+# but the 2 MB request cap is usually hit first with text metadata.
+PINECONE_UPSERT_BATCH_SIZE = int(os.getenv("PINECONE_UPSERT_BATCH_SIZE", "96"))
+PINECONE_UPSERT_MAX_BYTES = int(os.getenv("PINECONE_UPSERT_MAX_BYTES", str(2 * 1024 * 1024)))
+PINECONE_UPSERT_CONCURRENCY = int(os.getenv("PINECONE_UPSERT_CONCURRENCY", "4"))
+PINECONE_UPSERT_MAX_ATTEMPTS = int(os.getenv("PINECONE_UPSERT_MAX_ATTEMPTS", "3"))
+PINECONE_UPSERT_BACKOFF_SECONDS = float(os.getenv("PINECONE_UPSERT_BACKOFF_SECONDS", "0.5"))
+
+# Request overhead headroom and JSON size of one float (e.g. "-0.012345678901234567,")
+_REQUEST_OVERHEAD_BYTES = 1024
+_FLOAT_JSON_BYTES = 22
+
+# A vector tuple (id, values, metadata) or an integrated-embedding record dict
+UpsertItem = Union[tuple, Dict[str, Any]]
+
+
+@dataclass
+class UpsertReport:
+    upserted: int = 0
+    batches: int = 0
+    failed_batches: int = 0
+    failed_ids: List[str] = field(default_factory=list)
+
+    @property
+    def ok(self) -> bool:
+        return not self.failed_ids
+
+    def merge(self, other: "UpsertReport") -> None:
+        """Accumulate another report (e.g. one per streamed batch of a document)"""
+        self.upserted += other.upserted
+        self.batches += other.batches
+        self.failed_batches += other.failed_batches
+        self.failed_ids.extend(other.failed_ids)
+
+
+def item_id(item: UpsertItem) -> str:
+    return item["_id"] if isinstance(item, dict) else item[0]
+
+
+def estimate_item_bytes(item: UpsertItem) -> int:
+    """Approximate serialized size of one record in the upsert request"""
+    if isinstance(item, dict):
+        return len(json.dumps(item, default=str))
+    record_id, values, metadata = item
+    return len(record_id) + len(values) * _FLOAT_JSON_BYTES + len(json.dumps(metadata, default=str))
+
+
+def split_batches(
+    items: Sequence[UpsertItem],
+    max_records: int = PINECONE_UPSERT_BATCH_SIZE,
+    max_bytes: int = PINECONE_UPSERT_MAX_BYTES,
+) -> List[List[UpsertItem]]:
+    """Greedily pack items into batches under both the record and byte limits"""
+    budget = max(1, max_bytes - _REQUEST_OVERHEAD_BYTES)
+    batches: List[List[UpsertItem]] = []
+    current: List[UpsertItem] = []
+    current_bytes = 0
+
+    for item in items:
+        size = estimate_item_bytes(item)
+        if current and (len(current) >= max_records or current_bytes + size > budget):
+            batches.append(current)
+            current, current_bytes = [], 0
+        # An oversized single record still gets its own batch; Pinecone will reject it
+        current.append(item)
+        current_bytes += size
+
+    if current:
+        batches.append(current)
+    return batches
+
+
+def _is_retryable(error: Exception) -> bool:
+    status = getattr(error, "status", None)
+    # Client errors (bad dimension, payload too large) will fail again; 429 is rate limiting
+    return not (isinstance(status, int) and 400 <= status < 500 and status != 429)
+
+
+async def upsert_batched(
+    send: Callable[[List[UpsertItem]], Any],
+    items: Sequence[UpsertItem],
+    max_records: int = PINECONE_UPSERT_BATCH_SIZE,
+    max_bytes: int = PINECONE_UPSERT_MAX_BYTES,
+    concurrency: int = PINECONE_UPSERT_CONCURRENCY,
+    max_attempts: int = PINECONE_UPSERT_MAX_ATTEMPTS,
+    backoff: float = PINECONE_UPSERT_BACKOFF_SECONDS,
+    on_batch_done: Optional[Callable[[int], None]] = None,
+) -> UpsertReport:
+    """
+    Upsert items in concurrent batches.
+
+    Args:
+        send: blocking function that upserts one batch (runs on the I/O pool)
+        items: vector tuples or record dicts
+        on_batch_done: optional callback with the number of records upserted so far
+
+    Returns:
+        UpsertReport with counts and the IDs of records in batches that kept failing
+    """
+    batches = split_batches(items, max_records=max_records, max_bytes=max_bytes)
+    report = UpsertReport(batches=len(batches))
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def send_batch(batch: List[UpsertItem]) -> None:
+        async with semaphore:
+            for attempt in range(1, max_attempts + 1):
+                try:
+                    await run_io(send, batch)
+                    break
+                except Exception as e:
+                    if attempt >= max_attempts or not _is_retryable(e):
+                        logger.warning(
+                            "Upsert batch of %d records failed after %d attempt(s): %s",
+                            len(batch), attempt, type(e).__name__,
+                        )
+                        report.failed_batches += 1
+                        report.failed_ids.extend(item_id(item) for item in batch)
+                        return
+                    # Exponential backoff with jitter to avoid synchronized retries
+                    await asyncio.sleep(backoff * (2 ** (attempt - 1)) * (0.5 + random.random()))
+
+        report.upserted += len(batch)
+        if on_batch_done:
+            on_batch_done(report.upserted)
+
+    await asyncio.gather(*(send_batch(batch) for batch in batches))
+    return report
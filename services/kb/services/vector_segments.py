@@ -0,0 +1,555 @@
+"""
+On-disk vector store (VECTOR_STORE=local with LOCAL_VECTOR_STORE_DIR set):
+1. Each namespace is an append-only segment directory:
+   vectors.f32 (L2-normalized float32 rows), ids.txt (id table, one per row),
+   metadata.jsonl + metadata.idx (sidecar and its line offsets), deleted.i64 (dead rows)
+2. Segments are opened with np.memmap: loading copies nothing into the heap, and
+   uvicorn workers share the pages through the OS page cache
+3. Updates append a new row and mark the old one dead; deletes only mark rows dead
+4. Once enough rows are dead, a background thread rewrites the live rows into a new
+   segment and switches the namespace's CURRENT pointer atomically
+5. Namespaces above an ANN threshold are searched through an IVF index (services/ann.py)
+   kept in the segment, built in the background and extended as rows are appended
+Writers hold a per-namespace file lock, so several processes can ingest safely;
+readers notice other processes' writes by file size and remap.
+"""
+import fcntl
+import json
+import logging
+import os
+import shutil
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
+from urllib.parse import quote, unquote
+
+import numpy as np
+
+from services.ann import (
+    LOCAL_VECTOR_ANN_NLIST,
+    LOCAL_VECTOR_ANN_NPROBE,
+    LOCAL_VECTOR_ANN_REBUILD_RATIO,
+    LOCAL_VECTOR_ANN_THRESHOLD,
+    assign_lists,
+    default_nlist,
+    open_index,
+    train_centroids,
+    write_index,
+)
+from services.local_vector_store import normalize_rows, prepare_query, rank_rows, split_items
+from services.upsert import UpsertItem
+from services.vector_store import Match, VectorStore
+
+logger = logging.getLogger("resonance.kb.vectors")
+
+# Configuration
+LOCAL_VECTOR_STORE_MAX_OPEN = int(os.getenv("LOCAL_VECTOR_STORE_MAX_OPEN", "1024"))  # Namespaces kept mapped
+LOCAL_VECTOR_COMPACT_MIN_ROWS = int(os.getenv("LOCAL_VECTOR_COMPACT_MIN_ROWS", "1024"))
+LOCAL_VECTOR_COMPACT_RATIO = float(os.getenv("LOCAL_VECTOR_COMPACT_RATIO", "0.25"))  # Dead fraction that triggers compaction
+
+_NAMESPACE_PREFIX = "ns-"
+ANN_SETTINGS = ("threshold", "nprobe", "nlist")
+_COMPACT_BLOCK_ROWS = 65536
+
+
+class SegmentView:
+    """
+    Read-only snapshot of a namespace's current segment.
+    Queries use a view without locks; writers replace it after each append.
+    """
+
+    def __init__(self, namespace_dir: str):
+        current_path = os.path.join(namespace_dir, "CURRENT")
+        current = os.stat(current_path)
+        with open(current_path, "r", encoding="utf-8") as f:
+            self.segment = f.read().strip()
+        self.path = os.path.join(namespace_dir, self.segment)
+        with open(os.path.join(self.path, "segment.json"), "r", encoding="utf-8") as f:
+            self.dimension = json.load(f)["dimension"]
+        self.current_key = (current.st_ino, current.st_mtime_ns)
+        self.sizes = (os.path.getsize(self.file("vectors.f32")), os.path.getsize(self.file("deleted.i64")))
+
+        # Rows are complete once both their vector and their metadata offset are written
+        self.rows = min(self.sizes[0] // (4 * self.dimension), os.path.getsize(self.file("metadata.idx")) // 8)
+        if self.rows:
+            self.vectors = np.memmap(self.file("vectors.f32"), dtype=np.float32, mode="r", shape=(self.rows, self.dimension))
+            self.offsets = np.memmap(self.file("metadata.idx"), dtype=np.int64, mode="r", shape=(self.rows,))
+            self.metadata = np.memmap(self.file("metadata.jsonl"), dtype=np.uint8, mode="r")
+        else:
+            self.vectors = np.zeros((0, self.dimension), dtype=np.float32)
+            self.offsets = np.zeros(0, dtype=np.int64)
+            self.metadata = np.zeros(0, dtype=np.uint8)
+        dead = np.fromfile(self.file("deleted.i64"), dtype=np.int64, count=self.sizes[1] // 8)
+        self.dead = np.unique(dead[dead < self.rows])
+        self.index_key = _file_key(self.file("ivf/index.json"))
+        self.index = open_index(self.file("ivf")) if self.index_key else None
+        self.ann = read_ann_settings(namespace_dir)
+
+    @property
+    def signature(self) -> Tuple:
+        return self.current_key, self.sizes, self.index_key
+
+    def file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def is_current(self, namespace_dir: str) -> bool:
+        """False once this or another process has appended, deleted or compacted"""
+        try:
+            current = os.stat(os.path.join(namespace_dir, "CURRENT"))
+            sizes = (os.path.getsize(self.file("vectors.f32")), os.path.getsize(self.file("deleted.i64")))
+        except FileNotFoundError:
+            return False  # Compacted away
+        return (
+            (current.st_ino, current.st_mtime_ns) == self.current_key
+            and sizes == self.sizes
+            and _file_key(self.file("ivf/index.json")) == self.index_key
+        )
+
+    @property
+    def uses_index(self) -> bool:
+        return self.index is not None and self.rows >= self.ann["threshold"]
+
+    def record(self, row: int) -> Dict[str, Any]:
+        """{"id", "metadata"} of a row, parsed from its sidecar line"""
+        start = int(self.offsets[row])
+        end = int(self.offsets[row + 1]) if row + 1 < self.rows else len(self.metadata)
+        line = bytes(self.metadata[start:end]).split(b"\n", 1)[0]
+        return json.loads(line)
+
+    def scores(self, query_vector: np.ndarray) -> np.ndarray:
+        scores = np.asarray(self.vectors @ query_vector)
+        scores[self.dead] = -np.inf
+        return scores
+
+    def candidate_scores(self, query_vector: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """(rows, scores) of the rows in the index lists nearest the query"""
+        rows = self.index.candidates(query_vector, self.ann["nprobe"], self.rows)
+        rows.sort()  # Sequential page access through the memory map
+        scores = np.asarray(self.vectors[rows] @ query_vector)
+        scores[np.isin(rows, self.dead)] = -np.inf
+        return rows, scores
+
+
+def _file_key(path: str) -> Optional[Tuple[int, int]]:
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns
+
+
+def read_ann_settings(namespace_dir: str) -> Dict[str, int]:
+    """Per-namespace ANN settings (ann.json) over the LOCAL_VECTOR_ANN_* defaults"""
+    settings = {"threshold": LOCAL_VECTOR_ANN_THRESHOLD, "nprobe": LOCAL_VECTOR_ANN_NPROBE, "nlist": LOCAL_VECTOR_ANN_NLIST}
+    try:
+        with open(os.path.join(namespace_dir, "ann.json"), "r", encoding="utf-8") as f:
+            settings.update(json.load(f))
+    except (FileNotFoundError, ValueError):
+        pass
+    return settings
+
+
+class NamespaceSegments:
+    """One namespace directory: its current view plus the writer's id → row table"""
+
+    def __init__(self, path: str, compact_min_rows: int, compact_ratio: float, schedule):
+        self.path = path
+        self.compact_min_rows = compact_min_rows
+        self.compact_ratio = compact_ratio
+        self.lock = threading.Lock()
+        self.view: Optional[SegmentView] = None
+        self.pending: Set[str] = set()  # Background tasks queued for this namespace
+        self._schedule = schedule
+        self._rows: Optional[Dict[str, int]] = None
+        self._rows_signature = None
+
+    def exists(self) -> bool:
+        return os.path.exists(os.path.join(self.path, "CURRENT"))
+
+    def snapshot(self) -> SegmentView:
+        """Current view, remapped if the segment changed on disk"""
+        view = self.view
+        if view is None or not view.is_current(self.path):
+            try:
+                view = SegmentView(self.path)
+            except FileNotFoundError:
+                view = SegmentView(self.path)  # Compaction switched segments while opening; retry once
+            self.view = view
+        return view
+
+    @contextmanager
+    def file_lock(self):
+        """Exclusive across threads and processes (flock is per open file description)"""
+        fd = os.open(os.path.join(self.path, "LOCK"), os.O_CREAT | os.O_RDWR, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            os.close(fd)
+
+    def create(self, dimension: int) -> None:
+        os.makedirs(self.path, exist_ok=True)
+        with self.lock, self.file_lock():
+            if not self.exists():
+                self._write_segment("seg-000001", dimension)
+                self._switch("seg-000001")
+
+    def upsert(self, ids: List[str], vectors: np.ndarray, metadata: List[Dict[str, Any]]) -> None:
+        with self.lock, self.file_lock():
+            view = self._writer_view()
+            if vectors.shape[1] != view.dimension:
+                raise ValueError(f"Vector dimension {vectors.shape[1]} does not match namespace dimension {view.dimension}")
+            try:
+                dead, id_lines, meta_lines, offsets = [], [], [], []
+                position = os.path.getsize(view.file("metadata.jsonl"))
+                for i, (record_id, meta) in enumerate(zip(ids, metadata)):
+                    if "\n" in record_id:
+                        raise ValueError("Record IDs cannot contain newlines")
+                    # The previous version of a record (even earlier in this batch) becomes a dead row
+                    if record_id in self._rows:
+                        dead.append(self._rows[record_id])
+                    self._rows[record_id] = view.rows + i
+                    line = (json.dumps({"id": record_id, "metadata": meta}) + "\n").encode("utf-8")
+                    offsets.append(position)
+                    position += len(line)
+                    id_lines.append(record_id + "\n")
+                    meta_lines.append(line)
+
+                # Vectors last: a row is visible to readers only once it is complete
+                with open(view.file("ids.txt"), "a", encoding="utf-8") as f:
+                    f.writelines(id_lines)
+                with open(view.file("metadata.jsonl"), "ab") as f:
+                    f.writelines(meta_lines)
+                with open(view.file("metadata.idx"), "ab") as f:
+                    f.write(np.asarray(offsets, dtype=np.int64).tobytes())
+                vectors = np.ascontiguousarray(normalize_rows(vectors), dtype=np.float32)
+                with open(view.file("vectors.f32"), "ab") as f:
+                    f.write(vectors.tobytes())
+                # Incremental insertion: new rows join their nearest list (rows left uncovered are scanned exactly)
+                if view.index is not None and view.index.covered_rows == view.rows:
+                    view.index.append(assign_lists(view.index.centroids, vectors))
+                self._append_dead(view, dead)
+            except BaseException:
+                self._rows = None  # Rebuilt (and torn appends repaired) by the next writer
+                raise
+            self._after_write()
+
+    def delete(self, ids: Sequence[str]) -> None:
+        with self.lock, self.file_lock():
+            view = self._writer_view()
+            dead = [self._rows.pop(record_id) for record_id in ids if record_id in self._rows]
+            if dead:
+                try:
+                    self._append_dead(view, dead)
+                except BaseException:
+                    self._rows = None
+                    raise
+                self._after_write()
+
+    def list_ids(self, prefix: str) -> Set[str]:
+        with self.lock, self.file_lock():
+            self._writer_view()
+            return {record_id for record_id in self._rows if record_id.startswith(prefix)}
+
+    def fetch(self, ids: Sequence[str]) -> Dict[str, Dict[str, Any]]:
+        with self.lock, self.file_lock():
+            view = self._writer_view()
+            return {record_id: view.record(self._rows[record_id])["metadata"] for record_id in ids if record_id in self._rows}
+
+    def compact(self) -> None:
+        """Rewrite live rows into a new segment and switch to it; readers keep the old mapping until they remap"""
+        with self.lock, self.file_lock():
+            view = self._writer_view()
+            if not len(view.dead):
+                return
+            live = np.setdiff1d(np.arange(view.rows), view.dead)
+            ids = self._read_ids(view)
+            segment = f"seg-{int(view.segment.split('-')[1]) + 1:06d}"
+            self._write_segment(segment, view.dimension)
+            target = os.path.join(self.path, segment)
+            position = 0
+            with open(os.path.join(target, "vectors.f32"), "ab") as vectors_file, \
+                    open(os.path.join(target, "ids.txt"), "a", encoding="utf-8") as ids_file, \
+                    open(os.path.join(target, "metadata.jsonl"), "ab") as metadata_file, \
+                    open(os.path.join(target, "metadata.idx"), "ab") as offsets_file:
+                for start in range(0, len(live), _COMPACT_BLOCK_ROWS):
+                    block = live[start:start + _COMPACT_BLOCK_ROWS]
+                    vectors_file.write(np.ascontiguousarray(view.vectors[block]).tobytes())
+                    ids_file.writelines(ids[row] + "\n" for row in block)
+                    offsets = []
+                    for row in block:
+                        line = (json.dumps(view.record(row)) + "\n").encode("utf-8")
+                        offsets.append(position)
+                        position += len(line)
+                        metadata_file.write(line)
+                    offsets_file.write(np.asarray(offsets, dtype=np.int64).tobytes())
+            if view.index is not None:
+                # Live rows keep their lists, so the index survives compaction without retraining;
+                # rows the index did not cover yet get assigned now
+                row_lists = view.index.row_lists()
+                covered = live[live < len(row_lists)]
+                uncovered = live[live >= len(row_lists)]
+                lists = np.concatenate([row_lists[covered], assign_lists(view.index.centroids, view.vectors[uncovered])])
+                write_index(os.path.join(target, "ivf"), view.index.centroids, lists, tail=np.zeros(0, dtype=np.int32))
+            self._switch(segment)
+            shutil.rmtree(view.path, ignore_errors=True)
+            self._rows = None
+            self.maybe_build_index(self._writer_view())
+            logger.info("Compacted %s: %d rows -> %d", self.path, view.rows, len(live))
+
+    def build_index(self) -> None:
+        """
+        Train and write the namespace's IVF index. The heavy part runs on a snapshot
+        without locks; rows appended meanwhile are assigned under the writer lock.
+        """
+        view = self.snapshot()
+        live = np.setdiff1d(np.arange(view.rows), view.dead)
+        if not len(live):
+            return
+        nlist = view.ann["nlist"] or default_nlist(len(live))
+        centroids = train_centroids(view.vectors, live, nlist)
+        lists = assign_lists(centroids, view.vectors)
+        with self.lock, self.file_lock():
+            current = self._writer_view()
+            if current.segment != view.segment:
+                return  # Compacted meanwhile; the next write or query requests a new build
+            tail = assign_lists(centroids, current.vectors[view.rows:])
+            write_index(current.file("ivf"), centroids, lists, tail)
+            self.view = SegmentView(self.path)
+        logger.info("Built IVF index for %s: %d rows, %d lists", self.path, view.rows, len(centroids))
+
+    def maybe_build_index(self, view: SegmentView) -> None:
+        """Request a build once the namespace passes the ANN threshold or the tail outgrows the index"""
+        if view.rows < view.ann["threshold"]:
+            return
+        if view.index is None or view.rows - view.index.built_rows > LOCAL_VECTOR_ANN_REBUILD_RATIO * view.index.built_rows:
+            self.request("build_index")
+
+    def request(self, task: str) -> None:
+        """Queue a background task (compact, build_index) unless it is already queued"""
+        if task not in self.pending:
+            self.pending.add(task)
+            self._schedule(self, task)
+
+    def _writer_view(self) -> SegmentView:
+        """Fresh view plus an id → row table matching it (call with both locks held)"""
+        view = self.view = SegmentView(self.path)
+        if self._rows is None or self._rows_signature != view.signature:
+            view = self._repair(view)
+            ids = self._read_ids(view)
+            dead = set(view.dead.tolist())
+            self._rows = {record_id: row for row, record_id in enumerate(ids) if row not in dead}
+            self._rows_signature = view.signature
+        return view
+
+    def _repair(self, view: SegmentView) -> SegmentView:
+        """Truncate what an interrupted append left past the last complete row"""
+        rows = view.rows
+        if rows:
+            with open(view.file("metadata.jsonl"), "rb") as f:
+                f.seek(int(view.offsets[rows - 1]))
+                metadata_end = int(view.offsets[rows - 1]) + len(f.readline())
+        else:
+            metadata_end = 0
+        expected = {
+            "vectors.f32": rows * 4 * view.dimension,
+            "metadata.idx": rows * 8,
+            "metadata.jsonl": metadata_end,
+            "deleted.i64": view.sizes[1] // 8 * 8,
+        }
+        torn = False
+        for name, size in expected.items():
+            if os.path.getsize(view.file(name)) != size:
+                os.truncate(view.file(name), size)
+                torn = True
+        ids = self._read_ids(view)
+        if len(ids) > rows:
+            with open(view.file("ids.txt"), "w", encoding="utf-8") as f:
+                f.writelines(record_id + "\n" for record_id in ids[:rows])
+            torn = True
+        if torn:
+            logger.warning("Repaired torn append in %s (%d rows)", view.path, rows)
+            view = self.view = SegmentView(self.path)
+        return view
+
+    def _read_ids(self, view: SegmentView) -> List[str]:
+        with open(view.file("ids.txt"), "r", encoding="utf-8") as f:
+            return f.read().splitlines()
+
+    def _append_dead(self, view: SegmentView, rows: List[int]) -> None:
+        if rows:
+            with open(view.file("deleted.i64"), "ab") as f:
+                f.write(np.asarray(rows, dtype=np.int64).tobytes())
+
+    def _after_write(self) -> None:
+        view = self.view = SegmentView(self.path)
+        self._rows_signature = view.signature
+        dead = len(view.dead)
+        if dead >= self.compact_min_rows and dead >= self.compact_ratio * view.rows:
+            self.request("compact")
+        else:
+            self.maybe_build_index(view)
+
+    def _write_segment(self, segment: str, dimension: int) -> None:
+        path = os.path.join(self.path, segment)
+        shutil.rmtree(path, ignore_errors=True)  # Left over from an interrupted compaction
+        os.makedirs(path)
+        with open(os.path.join(path, "segment.json"), "w", encoding="utf-8") as f:
+            json.dump({"dimension": dimension}, f)
+        for name in ("vectors.f32", "ids.txt", "metadata.jsonl", "metadata.idx", "deleted.i64"):
+            open(os.path.join(path, name), "wb").close()
+
+    def _switch(self, segment: str) -> None:
+        tmp = os.path.join(self.path, "CURRENT.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(segment)
+        os.replace(tmp, os.path.join(self.path, "CURRENT"))
+
+
+class SegmentVectorStore(VectorStore):
+    """Exact cosine search over memory-mapped per-namespace segments"""
+
+    def __init__(
+        self,
+        root: str,
+        max_open: int = LOCAL_VECTOR_STORE_MAX_OPEN,
+        compact_min_rows: int = LOCAL_VECTOR_COMPACT_MIN_ROWS,
+        compact_ratio: float = LOCAL_VECTOR_COMPACT_RATIO,
+    ):
+        self.root = root
+        self.max_open = max_open
+        self.compact_min_rows = compact_min_rows
+        self.compact_ratio = compact_ratio
+        os.makedirs(root, exist_ok=True)
+        # Least recently used namespaces are unmapped; their pages stay in the OS cache
+        self._namespaces: "OrderedDict[str, NamespaceSegments]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._maintenance: Optional[ThreadPoolExecutor] = None
+
+    def _namespace(self, namespace: Optional[str]) -> NamespaceSegments:
+        key = namespace or ""
+        with self._lock:
+            segments = self._namespaces.get(key)
+            if segments is None:
+                path = os.path.join(self.root, _NAMESPACE_PREFIX + quote(key, safe=""))
+                segments = NamespaceSegments(path, self.compact_min_rows, self.compact_ratio, self._schedule)
+                self._namespaces[key] = segments
+                while len(self._namespaces) > self.max_open:
+                    self._namespaces.popitem(last=False)
+            self._namespaces.move_to_end(key)
+            return segments
+
+    def upsert(self, namespace: Optional[str], items: Sequence[UpsertItem]) -> None:
+        items = list(items)
+        if not items:
+            return
+        ids, vectors, metadata = split_items(items)
+        segments = self._namespace(namespace)
+        if not segments.exists():
+            segments.create(vectors.shape[1])
+        segments.upsert(ids, vectors, metadata)
+
+    def query(self, namespace, top_k, vector=None, text=None, filter=None) -> List[Match]:
+        if vector is None:
+            raise ValueError("The local vector store needs a query vector")
+        segments = self._namespace(namespace)
+        if not segments.exists():
+            return []
+        view = segments.snapshot()
+        query_vector = prepare_query(vector, view.dimension)
+        if view.uses_index:
+            rows, scores = view.candidate_scores(query_vector)
+        else:
+            segments.maybe_build_index(view)
+            rows, scores = None, view.scores(query_vector)
+        records = {}
+
+        def metadata_at(i: int) -> Dict[str, Any]:
+            records[i] = view.record(i if rows is None else int(rows[i]))
+            return records[i]["metadata"]
+
+        matches = []
+        for i in rank_rows(scores, top_k, filter, metadata_at):
+            record = records.get(i) or view.record(i if rows is None else int(rows[i]))
+            matches.append(Match(id=record["id"], score=float(scores[i]), metadata=record["metadata"]))
+        return matches
+
+    def delete(self, namespace: Optional[str], ids: Sequence[str]) -> None:
+        segments = self._namespace(namespace)
+        if segments.exists():
+            segments.delete(ids)
+
+    def list_ids(self, namespace: Optional[str], prefix: str) -> Set[str]:
+        segments = self._namespace(namespace)
+        return segments.list_ids(prefix) if segments.exists() else set()
+
+    def fetch(self, namespace: Optional[str], ids: Sequence[str]) -> Dict[str, Dict[str, Any]]:
+        segments = self._namespace(namespace)
+        return segments.fetch(ids) if segments.exists() else {}
+
+    def list_namespaces(self) -> List[str]:
+        return sorted(
+            unquote(name[len(_NAMESPACE_PREFIX):])
+            for name in os.listdir(self.root)
+            if name.startswith(_NAMESPACE_PREFIX) and os.path.exists(os.path.join(self.root, name, "CURRENT"))
+        )
+
+    def delete_namespace(self, namespace: str) -> None:
+        segments = self._namespace(namespace)
+        with self._lock:
+            self._namespaces.pop(namespace or "", None)
+        if segments.exists():
+            with segments.lock:
+                shutil.rmtree(segments.path, ignore_errors=True)
+
+    def configure_ann(self, namespace: Optional[str], **settings: int) -> Dict[str, int]:
+        """
+        Persist per-namespace ANN settings: threshold (rows before ANN is used),
+        nprobe (lists scanned per query: recall vs latency), nlist (lists at the next build; 0 = sqrt(rows))
+        """
+        unknown = set(settings) - set(ANN_SETTINGS)
+        if unknown:
+            raise ValueError(f"Unknown ANN settings: {sorted(unknown)}")
+        if any(not isinstance(value, int) or value < 0 for value in settings.values()) or settings.get("nprobe") == 0:
+            raise ValueError("ANN settings must be non-negative integers (nprobe at least 1)")
+        segments = self._namespace(namespace)
+        os.makedirs(segments.path, exist_ok=True)
+        with segments.lock, segments.file_lock():
+            path = os.path.join(segments.path, "ann.json")
+            current = {}
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    current = json.load(f)
+            except (FileNotFoundError, ValueError):
+                pass
+            current.update(settings)
+            with open(path + ".tmp", "w", encoding="utf-8") as f:
+                json.dump(current, f)
+            os.replace(path + ".tmp", path)
+            segments.view = None  # Next query reads the new settings
+        return read_ann_settings(segments.path)
+
+    def close(self) -> None:
+        """Wait for running compactions and index builds"""
+        if self._maintenance is not None:
+            self._maintenance.shutdown(wait=True)
+            self._maintenance = None
+
+    def _schedule(self, segments: NamespaceSegments, task: str) -> None:
+        with self._lock:
+            if self._maintenance is None:
+                # One thread: maintenance is disk- and BLAS-heavy and runs one namespace at a time
+                self._maintenance = ThreadPoolExecutor(max_workers=1, thread_name_prefix="kb-vectors")
+            maintenance = self._maintenance
+        maintenance.submit(self._run, segments, task)
+
+    @staticmethod
+    def _run(segments: NamespaceSegments, task: str) -> None:
+        try:
+            getattr(segments, task)()
+        except Exception:
+            logger.exception("Vector store %s of %s failed", task, segments.path)
+        finally:
+            segments.pending.discard(task)
@@ -0,0 +1,255 @@
+"""
+Vector store abstraction used by ingestion and retrieval:
+1. VectorStore covers upsert, query, delete, ID listing, metadata fetch and namespaces
+2. PineconeVectorStore wraps a Pinecone index (pre-computed vectors or integrated embeddings)
+3. The local backends run in-process without network access: memory-mapped segments
+   on disk (services/vector_segments.py) or plain heap matrices (services/local_vector_store.py)
+Methods are blocking, like the Pinecone SDK; call them through run_io() from async code.
+Pinecone index handles are kept per index and worker (get_index), so every request reuses
+one keep-alive connection pool; warm_up() opens it at startup.
+"""
+import logging
+import os
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Sequence, Set
+
+from pinecone import Pinecone
+
+from services import embeddings
+from services.upsert import UpsertItem
+
+# Configuration
+VECTOR_STORE = os.getenv("VECTOR_STORE", "pinecone")  # "pinecone" or "local"
+# Segment directory for VECTOR_STORE=local; empty keeps vectors in memory only (tests, benchmarks)
+LOCAL_VECTOR_STORE_DIR = os.path.expanduser(os.getenv("LOCAL_VECTOR_STORE_DIR", "~/.cache/resonance-kb/vectors"))
+PINECONE_INDEX_NAME = os.getenv("PINECONE_INDEX_NAME", "sterling-willow")
+PINECONE_INDEX_HOST = os.getenv("PINECONE_INDEX_HOST", "")  # Skips the describe call that resolves the host
+PINECONE_GRPC = os.getenv("PINECONE_GRPC", "false").lower() == "true"  # gRPC data plane (HTTP/2, multiplexed)
+PINECONE_POOL_MAXSIZE = int(os.getenv("PINECONE_POOL_MAXSIZE", "0"))  # Pooled keep-alive connections; 0: SDK default
+PINECONE_WARMUP = os.getenv("PINECONE_WARMUP", "true").lower() == "true"
+PINECONE_DELETE_BATCH_SIZE = 1000
+PINECONE_FETCH_BATCH_SIZE = 100  # IDs travel in the URL
+
+logger = logging.getLogger("resonance.kb.vector_store")
+
+# Lazy-load clients
+_pinecone_client = None
+_vector_store = None
+_index_handles: Dict[str, Any] = {}
+_index_handles_lock = threading.Lock()
+
+
+@dataclass
+class Match:
+    id: str
+    score: float
+    metadata: Dict[str, Any] = field(default_factory=dict)
+
+
+class VectorStore:
+    """Operations ingestion and retrieval need from a vector database"""
+
+    def namespace_for(self, assistant_id: str, integrated: bool) -> Optional[str]:
+        """Namespace holding an assistant's records (None: the default namespace)"""
+        return assistant_id
+
+    def upsert(self, namespace: Optional[str], items: Sequence[UpsertItem]) -> None:
+        """Insert or replace one batch of (id, values, metadata) tuples or integrated-embedding record dicts"""
+        raise NotImplementedError
+
+    def query(
+        self,
+        namespace: Optional[str],
+        top_k: int,
+        vector: Optional[List[float]] = None,
+        text: Optional[str] = None,
+        filter: Optional[Dict[str, Any]] = None,
+    ) -> List[Match]:
+        """Top-k matches by similarity to a vector (or text, for integrated embeddings), best first"""
+        raise NotImplementedError
+
+    def delete(self, namespace: Optional[str], ids: Sequence[str]) -> None:
+        raise NotImplementedError
+
+    def list_ids(self, namespace: Optional[str], prefix: str) -> Set[str]:
+        """All record IDs starting with prefix"""
+        raise NotImplementedError
+
+    def fetch(self, namespace: Optional[str], ids: Sequence[str]) -> Dict[str, Dict[str, Any]]:
+        """Metadata of the given records by ID (missing IDs are left out)"""
+        raise NotImplementedError
+
+    def list_namespaces(self) -> List[str]:
+        raise NotImplementedError
+
+    def delete_namespace(self, namespace: str) -> None:
+        raise NotImplementedError
+
+    def warm_up(self) -> None:
+        """Open connections and load state ahead of the first request (called on app startup)"""
+
+    def close(self) -> None:
+        """Finish background work (called on app shutdown)"""
+
+
+def get_pinecone_client():
+    global _pinecone_client
+    if _pinecone_client is None:
+        api_key = os.getenv("PINECONE_API_KEY")
+        if not api_key:
+            raise ValueError("PINECONE_API_KEY environment variable is required")
+        kwargs = {"connection_pool_maxsize": PINECONE_POOL_MAXSIZE} if PINECONE_POOL_MAXSIZE > 0 else {}
+        if PINECONE_GRPC:
+            # Needs the gRPC extra (pip install "pinecone[grpc]")
+            from pinecone.grpc import PineconeGRPC
+            _pinecone_client = PineconeGRPC(api_key=api_key, **kwargs)
+        else:
+            _pinecone_client = Pinecone(api_key=api_key, **kwargs)
+    return _pinecone_client
+
+
+def get_index(index_name: str = PINECONE_INDEX_NAME):
+    """
+    Long-lived data-plane handle for an index, shared by every request in this worker.
+    The handle owns the connection pool, so host lookup and TLS setup happen once.
+    """
+    handle = _index_handles.get(index_name)
+    if handle is None:
+        with _index_handles_lock:
+            handle = _index_handles.get(index_name)
+            if handle is None:
+                host = PINECONE_INDEX_HOST if index_name == PINECONE_INDEX_NAME else ""
+                handle = get_pinecone_client().Index(name=index_name, host=host)
+                _index_handles[index_name] = handle
+    return handle
+
+
+def close_indexes() -> None:
+    """Close every cached index handle (and its connections)"""
+    with _index_handles_lock:
+        handles = list(_index_handles.values())
+        _index_handles.clear()
+    for handle in handles:
+        close = getattr(handle, "close", None)
+        if close is not None:
+            close()
+
+
+class PineconeVectorStore(VectorStore):
+    """Pinecone serverless index; handles both integrated-embedding records and plain vectors"""
+
+    def __init__(self, index_name: str = PINECONE_INDEX_NAME):
+        self.index_name = index_name
+
+    @property
+    def index(self):
+        return get_index(self.index_name)
+
+    def namespace_for(self, assistant_id: str, integrated: bool) -> Optional[str]:
+        # Integrated embeddings use one namespace per assistant; pre-computed vectors
+        # live in the default namespace and are filtered by assistant_id metadata.
+        return assistant_id if integrated else None
+
+    def upsert(self, namespace: Optional[str], items: Sequence[UpsertItem]) -> None:
+        items = list(items)
+        if items and isinstance(items[0], dict):
+            # Integrated embeddings - Pinecone embeds each record's "text" field
+            self.index.upsert_records(namespace=namespace, records=items)
+        else:
+            self.index.upsert(vectors=items, **_namespace_kwargs(namespace))
+
+    def query(self, namespace, top_k, vector=None, text=None, filter=None) -> List[Match]:
+        if vector is None:
+            from pinecone import SearchQuery
+            response = self.index.search_records(
+                namespace=namespace,
+                query=SearchQuery(
+                    inputs={"text": text},  # Text query - Pinecone embeds it automatically
+                    top_k=top_k,
+                ),
+            )
+            return [
+                Match(id=hit["_id"], score=hit["_score"], metadata=hit.get("fields", {}))
+                for hit in response.result["hits"]
+            ]
+
+        kwargs = _namespace_kwargs(namespace)
+        if filter:
+            kwargs["filter"] = filter
+        results = self.index.query(vector=vector, top_k=top_k, include_metadata=True, **kwargs)
+        return [Match(id=match.id, score=match.score, metadata=match.metadata or {}) for match in results.matches]
+
+    def delete(self, namespace: Optional[str], ids: Sequence[str]) -> None:
+        # Pinecone accepts up to 1000 IDs per call
+        ids = list(ids)
+        for start in range(0, len(ids), PINECONE_DELETE_BATCH_SIZE):
+            self.index.delete(ids=ids[start:start + PINECONE_DELETE_BATCH_SIZE], **_namespace_kwargs(namespace))
+
+    def list_ids(self, namespace: Optional[str], prefix: str) -> Set[str]:
+        ids = set()
+        for page in self.index.list(prefix=prefix, **_namespace_kwargs(namespace)):
+            ids.update(page)
+        return ids
+
+    def fetch(self, namespace: Optional[str], ids: Sequence[str]) -> Dict[str, Dict[str, Any]]:
+        ids = list(ids)
+        metadata = {}
+        for start in range(0, len(ids), PINECONE_FETCH_BATCH_SIZE):
+            response = self.index.fetch(ids=ids[start:start + PINECONE_FETCH_BATCH_SIZE], **_namespace_kwargs(namespace))
+            metadata.update({record_id: vector.metadata or {} for record_id, vector in response.vectors.items()})
+        return metadata
+
+    def list_namespaces(self) -> List[str]:
+        return sorted(self.index.describe_index_stats().namespaces.keys())
+
+    def delete_namespace(self, namespace: str) -> None:
+        self.index.delete(delete_all=True, namespace=namespace)
+
+    def warm_up(self) -> None:
+        # A cheap data-plane call resolves the host and opens a pooled connection
+        self.index.describe_index_stats()
+
+    def close(self) -> None:
+        close_indexes()
+
+
+def _namespace_kwargs(namespace: Optional[str]) -> Dict[str, str]:
+    return {"namespace": namespace} if namespace else {}
+
+
+def get_vector_store() -> VectorStore:
+    """Process-wide vector store selected by VECTOR_STORE"""
+    global _vector_store
+    if _vector_store is None:
+        if VECTOR_STORE == "pinecone":
+            _vector_store = PineconeVectorStore()
+        elif VECTOR_STORE == "local":
+            if embeddings.EMBEDDING_PROVIDER == "pinecone":
+                raise ValueError("VECTOR_STORE=local needs EMBEDDING_PROVIDER=local or openai")
+            if LOCAL_VECTOR_STORE_DIR:
+                from services.vector_segments import SegmentVectorStore
+                _vector_store = SegmentVectorStore(LOCAL_VECTOR_STORE_DIR)
+            else:
+                from services.local_vector_store import NumpyVectorStore
+                _vector_store = NumpyVectorStore()
+        else:
+            raise ValueError(f"Unknown VECTOR_STORE: {VECTOR_STORE}")
+    return _vector_store
+
+
+def warm_up_vector_store() -> None:
+    """Warm the vector store up at startup; failures are logged, not raised (the first request retries)"""
+    if VECTOR_STORE == "pinecone" and not PINECONE_WARMUP:
+        return
+    try:
+        get_vector_store().warm_up()
+    except Exception:
+        logger.warning("Vector store warmup failed", exc_info=True)
+
+
+def close_vector_store() -> None:
+    global _vector_store
+    if _vector_store is not None:
+        _vector_store.close()
+        _vector_store = None
@@ -71,7 +71,7 @@ def test_ingestion_module():
     print("Testing Ingestion Module Integration")
     print("=" * 60)
     
-    from services.ingestion import get_local_embedding_model, get_embedding_dimension
+    from services.embeddings import get_local_embedding_model, get_embedding_dimension
     
     print("\n1. Getting embedding dimension:")
     dim = get_embedding_dimension()
@@ -10,9 +10,41 @@ import os
 # Add parent directory to path for imports
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+# Keep tests hermetic: no on-disk embedding cache unless a test creates one
+os.environ.setdefault("EMBEDDING_CACHE_ENABLED", "false")
+os.environ.setdefault("QUERY_EMBEDDING_CACHE_MAX_BYTES", "0")
+os.environ.setdefault("SEARCH_RESULT_CACHE_MAX_BYTES", "0")
+os.environ.setdefault("ANSWER_CACHE_MAX_BYTES", "0")
+os.environ.setdefault("LEXICAL_SEARCH_ENABLED", "false")
+os.environ.setdefault("LEXICAL_INDEX_DIR", "")
+os.environ.setdefault("PINECONE_WARMUP", "false")
+
 from main import app
 
 
+@pytest.fixture(autouse=True)
+def reset_vector_store():
+    """Each test resolves the vector store (and its index handle) from its own patches"""
+    import services.answer_cache
+    import services.history
+    import services.lexical
+    import services.llm
+    import services.vector_store
+    services.vector_store._vector_store = None
+    services.vector_store._index_handles.clear()
+    services.lexical._lexical_index = None
+    services.llm._llm_clients.clear()
+    services.answer_cache._answer_cache = None
+    services.history._summary_cache = None
+    yield
+    services.vector_store._vector_store = None
+    services.vector_store._index_handles.clear()
+    services.lexical._lexical_index = None
+    services.llm._llm_clients.clear()
+    services.answer_cache._answer_cache = None
+    services.history._summary_cache = None
+
+
 @pytest_asyncio.fixture(scope="function")
 async def client():
     """
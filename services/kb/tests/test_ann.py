@@ -0,0 +1,163 @@
+"""Tests for the IVF index and its use by the on-disk vector store."""
+import pytest
+from unittest.mock import patch
+import sys
+import os
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.ann import IVFIndex, assign_lists, train_centroids, write_index
+from services.local_vector_store import normalize_rows
+from services.vector_segments import SegmentVectorStore
+
+
+def clustered_vectors(rows=4000, dim=16, clusters=40, seed=0):
+    """Unit vectors around random cluster centres (like chunks of many documents)"""
+    rng = np.random.default_rng(seed)
+    centres = rng.standard_normal((clusters, dim))
+    labels = rng.integers(0, clusters, size=rows)
+    return normalize_rows(centres[labels] + 0.3 * rng.standard_normal((rows, dim))).astype(np.float32)
+
+
+def records(vectors, prefix="r"):
+    return [(f"{prefix}{i}", vector.tolist(), {"n": i}) for i, vector in enumerate(vectors)]
+
+
+def upsert_in_batches(store, namespace, items, batch_size=500):
+    for start in range(0, len(items), batch_size):
+        store.upsert(namespace, items[start:start + batch_size])
+
+
+class TestIVFIndex:
+    """Test training, assignment and candidate selection."""
+
+    def test_train_and_assign(self):
+        """Every row should be assigned to one of nlist unit centroids."""
+        vectors = clustered_vectors(rows=1000)
+        centroids = train_centroids(vectors, np.arange(1000), nlist=20)
+        lists = assign_lists(centroids, vectors)
+
+        assert centroids.shape == (20, 16)
+        assert np.allclose(np.linalg.norm(centroids, axis=1), 1.0, atol=1e-5)
+        assert lists.min() >= 0 and lists.max() < 20
+
+    def test_candidates_cover_probed_lists_tail_and_new_rows(self, tmp_path):
+        """Candidates are the probed lists, matching tail rows and rows not yet covered."""
+        centroids = np.eye(2, dtype=np.float32)
+        write_index(str(tmp_path / "ivf"), centroids, np.array([0, 1, 0, 1], dtype=np.int32), tail=np.array([1, 0]))
+        index = IVFIndex(str(tmp_path / "ivf"))
+
+        candidates = index.candidates(np.array([1.0, 0.0], dtype=np.float32), nprobe=1, rows=8)
+
+        assert sorted(candidates.tolist()) == [0, 2, 5, 6, 7]
+        assert index.row_lists().tolist() == [0, 1, 0, 1, 1, 0]
+
+
+class TestANNSearch:
+    """Test automatic ANN use, incremental insertion and persistence in the segment store."""
+
+    def make_store(self, tmp_path, rows=4000, threshold=1000):
+        store = SegmentVectorStore(str(tmp_path))
+        store.configure_ann("big", threshold=threshold, nprobe=8)
+        vectors = clustered_vectors(rows=rows)
+        upsert_in_batches(store, "big", records(vectors))
+        store.close()  # Waits for the background index build
+        return store, vectors
+
+    def test_index_is_built_above_threshold(self, tmp_path):
+        """Crossing the threshold should build an index in the background."""
+        store, _ = self.make_store(tmp_path)
+        view = store._namespace("big").snapshot()
+
+        assert view.index is not None
+        assert view.uses_index
+        assert view.index.covered_rows == 4000
+
+    def test_small_namespaces_stay_exact(self, tmp_path):
+        """Below the threshold no index is built."""
+        store, _ = self.make_store(tmp_path, rows=500)
+
+        assert store._namespace("big").snapshot().index is None
+
+    def test_recall_against_exact_search(self, tmp_path):
+        """ANN top-10 should mostly agree with exact search while scoring fewer rows."""
+        store, vectors = self.make_store(tmp_path)
+        view = store._namespace("big").snapshot()
+        queries = clustered_vectors(rows=50, seed=1)
+
+        recall = []
+        for query in queries:
+            exact = set(np.argsort(-(vectors @ query))[:10].tolist())
+            approx = {int(m.id[1:]) for m in store.query("big", top_k=10, vector=query.tolist())}
+            recall.append(len(exact & approx) / 10)
+
+        assert np.mean(recall) >= 0.9
+        assert len(view.index.candidates(queries[0], view.ann["nprobe"], view.rows)) < view.rows / 2
+
+    def test_nprobe_is_tunable_per_namespace(self, tmp_path):
+        """Probing every list should make ANN results exact."""
+        store, vectors = self.make_store(tmp_path)
+        nlist = store._namespace("big").snapshot().index.nlist
+        store.configure_ann("big", nprobe=nlist)
+        query = clustered_vectors(rows=1, seed=2)[0]
+
+        matches = store.query("big", top_k=10, vector=query.tolist())
+
+        assert [m.id for m in matches] == [f"r{i}" for i in np.argsort(-(vectors @ query))[:10]]
+
+    def test_new_rows_are_inserted_incrementally(self, tmp_path):
+        """Upserts after the build extend the index tail and are found immediately."""
+        store, _ = self.make_store(tmp_path)
+        new_vector = clustered_vectors(rows=1, seed=3)[0]
+
+        store.upsert("big", [("fresh", new_vector.tolist(), {})])
+
+        view = store._namespace("big").snapshot()
+        assert view.index.built_rows <= 4000  # Rows written during the background build join the tail
+        assert view.index.covered_rows == 4001
+        assert view.index.tail[-1] == assign_lists(view.index.centroids, new_vector[None, :])[0]
+        assert store.query("big", top_k=1, vector=new_vector.tolist())[0].id == "fresh"
+
+    def test_deleted_rows_are_not_returned(self, tmp_path):
+        """Dead rows inside probed lists should be skipped."""
+        store, vectors = self.make_store(tmp_path)
+
+        store.delete("big", ["r7"])
+
+        assert "r7" not in [m.id for m in store.query("big", top_k=5, vector=vectors[7].tolist())]
+
+    def test_index_persists_across_reopen(self, tmp_path):
+        """A reopened store should use the index on disk without rebuilding it."""
+        store, vectors = self.make_store(tmp_path)
+        reopened = SegmentVectorStore(str(tmp_path))
+
+        with patch('services.vector_segments.train_centroids') as mock_train:
+            assert reopened.query("big", top_k=1, vector=vectors[3].tolist())[0].id == "r3"
+            reopened.close()
+
+        mock_train.assert_not_called()
+        assert reopened._namespace("big").snapshot().uses_index
+
+    def test_compaction_keeps_index(self, tmp_path):
+        """Compaction carries list assignments over to the new segment."""
+        store, vectors = self.make_store(tmp_path)
+        store.delete("big", [f"r{i}" for i in range(0, 1000)])
+
+        store._namespace("big").compact()
+        store.close()
+
+        view = store._namespace("big").snapshot()
+        assert view.rows == 3000
+        assert view.index is not None and view.index.covered_rows == 3000
+        assert store.query("big", top_k=1, vector=vectors[1500].tolist())[0].id == "r1500"
+
+    def test_configure_ann_validates_settings(self, tmp_path):
+        store = SegmentVectorStore(str(tmp_path))
+
+        with pytest.raises(ValueError):
+            store.configure_ann("a1", nprobe=0)
+        with pytest.raises(ValueError):
+            store.configure_ann("a1", ef_search=10)
+        assert store.configure_ann("a1", nlist=64)["nlist"] == 64
@@ -0,0 +1,173 @@
+"""Tests for the semantic answer cache and its use by the chat endpoints."""
+import pytest
+from unittest.mock import patch, AsyncMock
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.answer_cache import AnswerCache
+
+CHUNKS = [{"content": "Starter is $299", "source": "pricing.pdf", "score": 0.9, "document_id": "d1", "chunk_index": 0}]
+SOURCES = [{"source": "pricing.pdf", "score": 0.9}]
+
+
+def make_cache(**kwargs):
+    return AnswerCache(max_bytes=kwargs.pop("max_bytes", 1024 * 1024), ttl_seconds=kwargs.pop("ttl_seconds", 0), **kwargs)
+
+
+class TestAnswerCache:
+    """Test similarity matching, context checks and invalidation."""
+
+    def test_paraphrase_hits_within_threshold(self):
+        """A nearby query vector with the same retrieved chunks reuses the answer."""
+        cache = make_cache(min_similarity=0.9)
+        cached, key = cache.lookup("a1", [1.0, 0.0], CHUNKS)
+        assert cached is None
+        cache.store(key, "It costs $299.", SOURCES)
+
+        cached, _ = cache.lookup("a1", [0.99, 0.1], CHUNKS)
+
+        assert cached.answer == "It costs $299."
+        assert cached.sources == SOURCES
+        assert cache.entries.stats()["hits"] == 1
+
+    def test_distant_query_misses(self):
+        cache = make_cache(min_similarity=0.9)
+        _, key = cache.lookup("a1", [1.0, 0.0], CHUNKS)
+        cache.store(key, "It costs $299.", SOURCES)
+
+        assert cache.lookup("a1", [0.5, 0.5], CHUNKS)[0] is None
+        assert cache.lookup("a2", [1.0, 0.0], CHUNKS)[0] is None
+
+    def test_different_context_or_system_prompt_misses(self):
+        """The answer is only reused when it rests on the same chunks and instructions."""
+        cache = make_cache()
+        _, key = cache.lookup("a1", [1.0, 0.0], CHUNKS, system_prompt="Be brief")
+        cache.store(key, "It costs $299.", SOURCES)
+        changed = [dict(CHUNKS[0], content="Starter is $399")]
+
+        assert cache.lookup("a1", [1.0, 0.0], changed, system_prompt="Be brief")[0] is None
+        assert cache.lookup("a1", [1.0, 0.0], CHUNKS)[0] is None
+        assert cache.lookup("a1", [1.0, 0.0], CHUNKS, system_prompt="Be brief")[0] is not None
+
+    def test_invalidate_drops_entries_and_stale_stores(self):
+        """An answer generated while the assistant ingested is not stored."""
+        cache = make_cache()
+        _, key = cache.lookup("a1", [1.0, 0.0], CHUNKS)
+        cache.store(key, "Old answer", SOURCES)
+        _, racing_key = cache.lookup("a1", [0.0, 1.0], CHUNKS)
+
+        cache.invalidate("a1")
+        cache.store(racing_key, "Racing answer", SOURCES)
+
+        assert cache.lookup("a1", [1.0, 0.0], CHUNKS)[0] is None
+        assert cache.lookup("a1", [0.0, 1.0], CHUNKS)[0] is None
+        assert len(cache.entries) == 0
+
+    def test_evicted_entries_leave_the_index(self):
+        """Entries evicted by the byte budget are also dropped from the assistant's key list."""
+        cache = make_cache(max_bytes=1000)  # Room for one entry
+        for i, vector in enumerate(([1.0, 0.0], [0.0, 1.0])):
+            _, key = cache.lookup("a1", vector, CHUNKS)
+            cache.store(key, f"Answer {i}", SOURCES)
+
+        assert cache.lookup("a1", [1.0, 0.0], CHUNKS)[0] is None
+        assert cache.lookup("a1", [0.0, 1.0], CHUNKS)[0].answer == "Answer 1"
+        assert len(cache._keys["a1"]) == 1
+
+
+class TestChatAnswerCache:
+    """Test the chat endpoints skipping the LLM on cache hits."""
+
+    @pytest.mark.asyncio
+    @patch('main.KB_SERVICE_API_KEY', 'test-kb-key')
+    @patch('services.answer_cache.ANSWER_CACHE_MAX_BYTES', 1024 * 1024)
+    @patch('services.embeddings.EMBEDDING_PROVIDER', 'openai')
+    @patch('main.generate_rag_response', new_callable=AsyncMock)
+    @patch('main.search_knowledge_base', new_callable=AsyncMock)
+    @patch('main.embed_query', new_callable=AsyncMock)
+    async def test_paraphrase_skips_generation(self, mock_embed, mock_search, mock_generate, client):
+        """The second phrasing is answered from cache; the query vector is passed on to retrieval."""
+        mock_embed.side_effect = [[1.0, 0.0], [0.99, 0.05]]
+        mock_search.return_value = CHUNKS
+        mock_generate.return_value = "It costs $299."
+        headers = {"Authorization": "Bearer test-kb-key"}
+
+        first = await client.post("/api/knowledge-base/chat", headers=headers, json={"query": "How much is Starter?", "assistant_id": "a1"})
+        second = await client.post("/api/knowledge-base/chat", headers=headers, json={"query": "Starter price?", "assistant_id": "a1"})
+
+        assert first.json()["cached"] is False
+        assert second.json() == {"response": "It costs $299.", "sources": SOURCES, "cached": True}
+        mock_generate.assert_awaited_once()
+        assert mock_search.call_args.kwargs["query_vector"] == [0.99, 0.05]
+
+    @pytest.mark.asyncio
+    @patch('main.KB_SERVICE_API_KEY', 'test-kb-key')
+    @patch('services.answer_cache.ANSWER_CACHE_MAX_BYTES', 1024 * 1024)
+    @patch('services.embeddings.EMBEDDING_PROVIDER', 'openai')
+    @patch('main.generate_rag_response', new_callable=AsyncMock)
+    @patch('main.search_knowledge_base', new_callable=AsyncMock)
+    @patch('main.embed_query', new_callable=AsyncMock)
+    async def test_follow_up_turns_are_not_cached(self, mock_embed, mock_search, mock_generate, client):
+        mock_search.return_value = CHUNKS
+        mock_generate.return_value = "It costs $299."
+        body = {
+            "query": "And Pro?",
+            "assistant_id": "a1",
+            "conversation_history": [{"role": "user", "content": "How much is Starter?"}],
+        }
+
+        for _ in range(2):
+            response = await client.post("/api/knowledge-base/chat", headers={"Authorization": "Bearer test-kb-key"}, json=body)
+            assert response.json()["cached"] is False
+
+        assert mock_generate.await_count == 2
+        mock_embed.assert_not_called()
+
+    @pytest.mark.asyncio
+    @patch('main.KB_SERVICE_API_KEY', 'test-kb-key')
+    @patch('services.answer_cache.ANSWER_CACHE_MAX_BYTES', 1024 * 1024)
+    @patch('services.embeddings.EMBEDDING_PROVIDER', 'openai')
+    @patch('main.stream_rag_response')
+    @patch('main.search_knowledge_base', new_callable=AsyncMock)
+    @patch('main.embed_query', new_callable=AsyncMock)
+    async def test_stream_serves_cached_answer(self, mock_embed, mock_search, mock_stream, client):
+        """A streamed answer that finished is cached and replayed as a single token event."""
+        async def streamed(**kwargs):
+            yield {"type": "delta", "content": "It costs "}
+            yield {"type": "delta", "content": "$299."}
+            yield {"type": "done", "model": "llama3", "finish_reason": "stop", "usage": None}
+
+        mock_embed.return_value = [1.0, 0.0]
+        mock_search.return_value = CHUNKS
+        mock_stream.side_effect = streamed
+        headers = {"Authorization": "Bearer test-kb-key"}
+        body = {"query": "How much is Starter?", "assistant_id": "a1"}
+
+        await client.post("/api/knowledge-base/chat/stream", headers=headers, json=body)
+        replay = await client.post("/api/knowledge-base/chat/stream", headers=headers, json=body)
+
+        assert mock_stream.call_count == 1
+        assert 'event: token\ndata: {"content": "It costs $299."}' in replay.text
+        assert '"cached": true' in replay.text
+
+    @pytest.mark.asyncio
+    @patch('services.answer_cache.ANSWER_CACHE_MAX_BYTES', 1024 * 1024)
+    @patch('services.embeddings.EMBEDDING_PROVIDER', 'openai')
+    @patch('services.ingestion.get_vector_store')
+    @patch('services.ingestion.embed_matrix', new_callable=AsyncMock)
+    async def test_ingest_invalidates_answers(self, mock_embed_matrix, mock_store):
+        import numpy as np
+        from services.answer_cache import get_answer_cache
+        from services.ingestion import ingest_document
+
+        mock_store.return_value.list_ids.return_value = set()
+        mock_embed_matrix.side_effect = lambda texts: np.ones((len(texts), 2), dtype=np.float32)
+        cache = get_answer_cache()
+        _, key = cache.lookup("a1", [1.0, 0.0], CHUNKS)
+        cache.store(key, "It costs $299.", SOURCES)
+
+        await ingest_document(b"Starter is now $399", "pricing.txt", "a1", "text/plain")
+
+        assert cache.lookup("a1", [1.0, 0.0], CHUNKS)[0] is None
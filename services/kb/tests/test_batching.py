@@ -0,0 +1,93 @@
+"""Tests for the micro-batching embedding engine."""
+import asyncio
+import pytest
+import numpy as np
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.batching import EmbeddingBatcher
+
+
+class RecordingEncoder:
+    """Fake encoder: embeds each text as [len(text)] and records batch contents."""
+
+    def __init__(self):
+        self.batches = []
+
+    def __call__(self, texts):
+        self.batches.append(list(texts))
+        return np.array([[float(len(t))] for t in texts], dtype=np.float32)
+
+
+class TestEmbeddingBatcher:
+    """Test batching, ordering and error propagation."""
+
+    @pytest.mark.asyncio
+    async def test_concurrent_queries_share_one_batch(self):
+        """Concurrent single-query calls should be encoded together."""
+        encoder = RecordingEncoder()
+        batcher = EmbeddingBatcher(encode=encoder, max_batch_size=16, max_wait_ms=20)
+
+        queries = ["a", "bb", "ccc", "dddd"]
+        vectors = await asyncio.gather(*(batcher.embed_one(q) for q in queries))
+
+        assert len(encoder.batches) == 1
+        assert [v[0] for v in vectors] == [1.0, 2.0, 3.0, 4.0]
+
+    @pytest.mark.asyncio
+    async def test_batches_respect_max_batch_size(self):
+        """Large inputs should be split into batches of at most max_batch_size."""
+        encoder = RecordingEncoder()
+        batcher = EmbeddingBatcher(encode=encoder, max_batch_size=4, max_wait_ms=1)
+
+        texts = ["x" * i for i in range(1, 11)]
+        vectors = await batcher.embed(texts)
+
+        assert vectors.shape == (10, 1)
+        assert vectors[:, 0].tolist() == [float(i) for i in range(1, 11)]
+        assert all(len(batch) <= 4 for batch in encoder.batches)
+        assert sum(len(batch) for batch in encoder.batches) == 10
+
+    @pytest.mark.asyncio
+    async def test_partial_batch_dispatched_after_max_wait(self):
+        """A lone query should not wait for a full batch."""
+        encoder = RecordingEncoder()
+        batcher = EmbeddingBatcher(encode=encoder, max_batch_size=64, max_wait_ms=5)
+
+        vector = await asyncio.wait_for(batcher.embed_one("hello"), timeout=1)
+
+        assert vector[0] == 5.0
+        assert encoder.batches == [["hello"]]
+
+    @pytest.mark.asyncio
+    async def test_queries_served_before_queued_chunks(self):
+        """Queries should be batched ahead of document chunks already waiting."""
+        encoder = RecordingEncoder()
+        batcher = EmbeddingBatcher(encode=encoder, max_batch_size=2, max_wait_ms=50)
+
+        chunk_task = asyncio.create_task(batcher.embed(["chunk-1", "chunk-2", "chunk-3"]))
+        query_task = asyncio.create_task(batcher.embed_one("query"))
+        await asyncio.gather(chunk_task, query_task)
+
+        # First batch was dispatched as soon as it filled; the query leads the next one
+        assert encoder.batches[1][0] == "query"
+
+    @pytest.mark.asyncio
+    async def test_encode_error_propagates_to_callers(self):
+        """Encoder failures should surface to every caller in the batch."""
+        def failing_encoder(texts):
+            raise RuntimeError("model crashed")
+
+        batcher = EmbeddingBatcher(encode=failing_encoder, max_batch_size=8, max_wait_ms=1)
+
+        results = await asyncio.gather(
+            batcher.embed_one("a"), batcher.embed_one("b"), return_exceptions=True
+        )
+
+        assert all(isinstance(r, RuntimeError) for r in results)
+
+        # Batcher keeps working after a failed batch
+        batcher.encode = RecordingEncoder()
+        assert (await batcher.embed_one("ok"))[0] == 2.0
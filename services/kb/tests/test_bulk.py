@@ -0,0 +1,297 @@
+"""Tests for bulk ingestion."""
+import asyncio
+import io
+import os
+import sys
+import tarfile
+import zipfile
+import pytest
+from unittest.mock import patch, AsyncMock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.bulk import (
+    BulkCheckpoint,
+    BulkDocument,
+    InvalidArchiveError,
+    expand_archive,
+    iter_directory,
+    run_bulk_ingest,
+)
+from services.spool import SpooledUpload, UploadTooLargeError, release_source
+
+
+def make_zip(files):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as zf:
+        for name, data in files.items():
+            zf.writestr(name, data)
+    return buffer.getvalue()
+
+
+def make_tar(files):
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w:gz") as tf:
+        for name, data in files.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tf.addfile(info, io.BytesIO(data))
+    return buffer.getvalue()
+
+
+def fake_result(**kwargs):
+    return {"document_id": kwargs["document_key"], "chunks": 2, "chunks_added": 2, "status": "processed"}
+
+
+class TestArchives:
+    """Test archive expansion into spooled documents."""
+
+    @pytest.mark.parametrize("make_archive,name", [(make_zip, "docs.zip"), (make_tar, "docs.tar.gz")])
+    def test_supported_members_are_spooled(self, make_archive, name, tmp_path):
+        """PDF/text members become documents keyed by archive path; others are skipped."""
+        archive = make_archive({"faq.txt": b"Refunds", "guides/setup.md": b"Install", "logo.png": b"\x89PNG"})
+        documents = expand_archive(archive, name, max_member_bytes=100, spool_dir=str(tmp_path))
+
+        assert sorted(d.document_key for d in documents) == [f"{name}/faq.txt", f"{name}/guides/setup.md"]
+        setup = next(d for d in documents if d.filename == "setup.md")
+        assert setup.content_type == "text/plain"
+        with open(setup.content.path, "rb") as f:
+            assert f.read() == b"Install"
+
+    def test_member_size_enforced(self, tmp_path):
+        """Members over the limit should fail the expansion and leave no spool files."""
+        archive = make_zip({"a.txt": b"small", "b.txt": b"x" * 500})
+
+        with pytest.raises(UploadTooLargeError):
+            expand_archive(archive, "docs.zip", max_member_bytes=100, spool_dir=str(tmp_path))
+        assert list(tmp_path.iterdir()) == []
+
+    def test_invalid_archive(self, tmp_path):
+        """Corrupt archives should raise InvalidArchiveError."""
+        with pytest.raises(InvalidArchiveError):
+            expand_archive(b"not a zip", "docs.zip", max_member_bytes=100, spool_dir=str(tmp_path))
+
+
+class TestCheckpoint:
+    """Test checkpoint persistence."""
+
+    def test_resume_skips_recorded_documents(self, tmp_path):
+        """A new checkpoint on the same file should remember finished documents."""
+        path = str(tmp_path / "acme.jsonl")
+        BulkCheckpoint(path).mark_done("faq.txt", "abc", "doc-1", 3)
+        with open(path, "a") as f:
+            f.write('{"key": "torn')  # Interrupted mid-write
+
+        checkpoint = BulkCheckpoint(path)
+        assert checkpoint.is_done("faq.txt", "abc")
+        assert not checkpoint.is_done("faq.txt", "changed")
+        assert not BulkCheckpoint(path, resume=False).is_done("faq.txt", "abc")
+
+
+class TestRunBulkIngest:
+    """Test concurrent bulk runs."""
+
+    @pytest.mark.asyncio
+    @patch('services.bulk.ingest_document', new_callable=AsyncMock)
+    async def test_documents_are_ingested_concurrently(self, mock_ingest):
+        """Several documents should be in flight at once, up to the concurrency limit."""
+        in_flight = 0
+        peak = 0
+
+        async def slow_ingest(**kwargs):
+            nonlocal in_flight, peak
+            in_flight += 1
+            peak = max(peak, in_flight)
+            await asyncio.sleep(0.02)
+            in_flight -= 1
+            return fake_result(**kwargs)
+        mock_ingest.side_effect = slow_ingest
+
+        documents = [BulkDocument(f"{i}.txt", f"{i}.txt", "text/plain", b"text %d" % i) for i in range(8)]
+        stats = await run_bulk_ingest(documents, "acme", concurrency=3)
+
+        assert peak == 3
+        assert stats.documents_done == 8
+        assert stats.chunks == 16
+        assert stats.docs_per_second > 0
+        assert mock_ingest.call_args.kwargs["document_key"] == "7.txt"
+
+    @pytest.mark.asyncio
+    @patch('services.bulk.ingest_document', new_callable=AsyncMock)
+    async def test_rerun_skips_unchanged_documents(self, mock_ingest, tmp_path):
+        """Resuming an incomplete run skips its finished documents; completing it removes the checkpoint."""
+        async def ingest_failing_b(**kwargs):
+            if kwargs["document_key"] == "b.txt":
+                raise RuntimeError("boom")
+            return fake_result(**kwargs)
+        mock_ingest.side_effect = ingest_failing_b
+        path = str(tmp_path / "acme.jsonl")
+        first = [BulkDocument("a.txt", "a.txt", "text/plain", b"A"), BulkDocument("b.txt", "b.txt", "text/plain", b"B")]
+        await run_bulk_ingest(first, "acme", checkpoint=BulkCheckpoint(path))
+        assert os.path.exists(path)
+        mock_ingest.reset_mock(side_effect=True)
+        mock_ingest.side_effect = fake_result
+
+        second = [BulkDocument("a.txt", "a.txt", "text/plain", b"A"), BulkDocument("b.txt", "b.txt", "text/plain", b"B2")]
+        stats = await run_bulk_ingest(second, "acme", checkpoint=BulkCheckpoint(path))
+
+        assert stats.documents_skipped == 1
+        assert [c.kwargs["document_key"] for c in mock_ingest.call_args_list] == ["b.txt"]
+        assert not os.path.exists(path)
+
+    @pytest.mark.asyncio
+    @patch('services.bulk.ingest_document', new_callable=AsyncMock)
+    async def test_failure_does_not_stop_the_run(self, mock_ingest, tmp_path):
+        """A failing document is recorded; the others are ingested and spool files released."""
+        async def ingest(**kwargs):
+            if kwargs["document_key"] == "bad.pdf":
+                raise ValueError("Unreadable PDF")
+            return fake_result(**kwargs)
+        mock_ingest.side_effect = ingest
+
+        spools = []
+        for name in ("good.txt", "bad.pdf"):
+            path = tmp_path / name
+            path.write_bytes(b"content")
+            spools.append(SpooledUpload(path=str(path), size=7))
+        documents = [BulkDocument("good.txt", "good.txt", "text/plain", spools[0]),
+                     BulkDocument("bad.pdf", "bad.pdf", "application/pdf", spools[1])]
+        stats = await run_bulk_ingest(documents, "acme")
+
+        assert stats.documents_done == 1
+        assert stats.failures == [{"document_key": "bad.pdf", "error": "ValueError"}]
+        assert not any(os.path.exists(s.path) for s in spools)
+
+    @pytest.mark.asyncio
+    @patch('services.bulk.ingest_document', new_callable=AsyncMock)
+    async def test_directory_files_are_read_in_place(self, mock_ingest, tmp_path):
+        """Directory ingestion should walk supported files and never delete them."""
+        mock_ingest.side_effect = fake_result
+        (tmp_path / "guides").mkdir()
+        (tmp_path / "guides" / "setup.md").write_text("Install")
+        (tmp_path / "faq.txt").write_text("Refunds")
+        (tmp_path / "bundle.zip").write_bytes(make_zip({"terms.txt": b"Terms"}))
+        (tmp_path / "image.png").write_bytes(b"\x89PNG")
+
+        stats = await run_bulk_ingest(iter_directory(str(tmp_path)), "acme")
+
+        keys = sorted(c.kwargs["document_key"] for c in mock_ingest.call_args_list)
+        assert keys == ["bundle.zip/terms.txt", "faq.txt", "guides/setup.md"]
+        assert stats.documents_total == 3
+        assert (tmp_path / "faq.txt").exists() and (tmp_path / "bundle.zip").exists()
+
+
+class TestBulkJobs:
+    """Test bulk jobs in the queue and the bulk endpoint."""
+
+    @pytest.mark.asyncio
+    @patch('services.jobs.checkpoint_path')
+    @patch('services.bulk.ingest_document', new_callable=AsyncMock)
+    async def test_bulk_job_reports_partial_on_document_failure(self, mock_ingest, mock_checkpoint_path, tmp_path):
+        """Bulk jobs should expose stats and finish partial when a document fails."""
+        from services.jobs import IngestionJobQueue, JOB_PARTIAL
+        from tests.test_jobs import wait_for_status
+
+        async def ingest(**kwargs):
+            if kwargs["document_key"] == "bad.txt":
+                raise RuntimeError("boom")
+            return fake_result(**kwargs)
+        mock_ingest.side_effect = ingest
+        mock_checkpoint_path.return_value = str(tmp_path / "acme.jsonl")
+
+        queue = IngestionJobQueue(workers=1, retry_backoff=0)
+        documents = [BulkDocument("good.txt", "good.txt", "text/plain", b"ok"),
+                     BulkDocument("bad.txt", "bad.txt", "text/plain", b"no")]
+        job = queue.submit_bulk(documents, "acme")
+        job = await wait_for_status(queue, job.job_id, [JOB_PARTIAL])
+
+        data = job.to_dict()
+        assert data["chunks_total"] == 2
+        assert data["bulk"]["documents_done"] == 1
+        assert data["bulk"]["documents_failed"] == 1
+        assert job.documents is None
+        await queue.shutdown()
+
+    @pytest.mark.asyncio
+    @patch('services.bulk.ingest_document', new_callable=AsyncMock)
+    async def test_checkpoints_are_scoped_to_a_job(self, mock_ingest, tmp_path):
+        """Only a resume_token continues an earlier job; a fresh job never skips documents."""
+        from services.jobs import IngestionJobQueue, JOB_COMPLETED, JOB_PARTIAL
+        from tests.test_jobs import wait_for_status
+
+        async def ingest(**kwargs):
+            if kwargs["document_key"] == "bad.txt":
+                raise RuntimeError("boom")
+            return fake_result(**kwargs)
+        mock_ingest.side_effect = ingest
+
+        def documents():
+            return [BulkDocument("good.txt", "good.txt", "text/plain", b"ok"),
+                    BulkDocument("bad.txt", "bad.txt", "text/plain", b"no")]
+
+        queue = IngestionJobQueue(workers=1, retry_backoff=0)
+        with patch('services.bulk.BULK_CHECKPOINT_DIR', str(tmp_path)):
+            first = await wait_for_status(queue, queue.submit_bulk(documents(), "acme").job_id, [JOB_PARTIAL])
+            fresh = await wait_for_status(queue, queue.submit_bulk(documents(), "acme").job_id, [JOB_PARTIAL])
+            assert fresh.bulk.documents_skipped == 0
+
+            mock_ingest.side_effect = fake_result
+            resumed = queue.submit_bulk(documents(), "acme", resume_token=first.job_id)
+            resumed = await wait_for_status(queue, resumed.job_id, [JOB_COMPLETED])
+
+        assert resumed.bulk.documents_skipped == 1
+        assert resumed.to_dict()["resume_token"] == first.job_id
+        assert not os.path.exists(tmp_path / "acme" / f"{first.job_id}.jsonl")
+        assert os.path.exists(tmp_path / "acme" / f"{fresh.job_id}.jsonl")
+        await queue.shutdown()
+
+    @pytest.mark.asyncio
+    @patch('main.KB_SERVICE_API_KEY', 'test-kb-key')
+    @patch('main.get_job_queue')
+    async def test_bulk_endpoint_accepts_files_and_archives(self, mock_get_queue, client):
+        """Files and archive members should be queued as one bulk job."""
+        from services.jobs import IngestionJobQueue
+
+        queue = IngestionJobQueue(workers=1)
+        queue.start = lambda: None  # Keep the job queued for inspection
+        queue._queue = asyncio.Queue()
+        mock_get_queue.return_value = queue
+
+        response = await client.post(
+            "/api/knowledge-base/bulk",
+            headers={"Authorization": "Bearer test-kb-key"},
+            params={"assistant_id": "test-assistant"},
+            files=[
+                ("files", ("faq.txt", b"Refunds", "text/plain")),
+                ("files", ("docs.zip", make_zip({"a.md": b"A", "b.txt": b"B"}), "application/zip")),
+            ],
+        )
+
+        assert response.status_code == 202
+        data = response.json()
+        assert data["documents"] == 3
+        assert data["resume_token"] == data["job_id"]  # Fresh checkpoint, not the assistant's earlier runs
+        job = queue.get(data["job_id"])
+        assert sorted(d.document_key for d in job.documents) == ["docs.zip/a.md", "docs.zip/b.txt", "faq.txt"]
+        queue._finish(job, "completed", error=None)  # Releases spool files
+
+    @pytest.mark.asyncio
+    @patch('main.KB_SERVICE_API_KEY', 'test-kb-key')
+    @patch('main.release_source', wraps=release_source)
+    @patch('main.get_job_queue')
+    async def test_bulk_endpoint_rejects_duplicate_keys(self, mock_get_queue, mock_release, client):
+        """Two files with the same name would ingest the same keyed document concurrently."""
+        response = await client.post(
+            "/api/knowledge-base/bulk",
+            headers={"Authorization": "Bearer test-kb-key"},
+            params={"assistant_id": "test-assistant"},
+            files=[
+                ("files", ("faq.txt", b"Refunds", "text/plain")),
+                ("files", ("faq.txt", b"Refunds v2", "text/plain")),
+            ],
+        )
+
+        assert response.status_code == 400
+        assert response.json()["detail"] == "Duplicate document: faq.txt"
+        mock_get_queue.return_value.submit_bulk.assert_not_called()
+        assert mock_release.call_count == 2
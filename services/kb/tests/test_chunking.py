@@ -0,0 +1,100 @@
+"""Tests for the token-accurate chunker."""
+import pytest
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.chunking import (
+    ApproximateTokenizer,
+    HuggingFaceTokenizer,
+    Tokenizer,
+    get_tokenizer,
+    iter_chunk_spans,
+)
+
+
+@pytest.fixture
+def tokenizer():
+    return ApproximateTokenizer("approximate", max_tokens=512)
+
+
+class FakeHFTokenizer:
+    """Whitespace tokenizer mimicking the transformers fast-tokenizer call signature."""
+
+    def num_special_tokens_to_add(self):
+        return 2
+
+    def __call__(self, text, **kwargs):
+        import re
+        return {"offset_mapping": [m.span() for m in re.finditer(r"\S+", text)]}
+
+
+class TestChunkSpans:
+    """Test token budgets, boundaries and offsets."""
+
+    def test_chunks_respect_token_budget(self, tokenizer):
+        """No chunk should exceed the requested token budget."""
+        text = "Pricing starts at $299/month for the Starter plan. " * 200
+        spans = list(iter_chunk_spans(text, tokenizer, chunk_tokens=64, overlap=0.2))
+
+        assert len(spans) > 1
+        for start, end, tokens in spans:
+            assert tokens <= 64
+            assert tokenizer.count(text[start:end]) == tokens
+
+    def test_budget_capped_at_model_window(self):
+        """Chunks should never be larger than the model's window."""
+        small_model = ApproximateTokenizer("tiny", max_tokens=32)
+        text = "word " * 500
+        spans = list(iter_chunk_spans(text, small_model, chunk_tokens=512, overlap=0))
+
+        assert max(tokens for _, _, tokens in spans) == 32
+
+    def test_prefers_paragraph_boundaries(self, tokenizer):
+        """Chunks should end at a paragraph break when one is in range."""
+        paragraph = "This sentence belongs to the paragraph. " * 5
+        text = "\n\n".join([paragraph.strip()] * 6)
+        spans = list(iter_chunk_spans(text, tokenizer, chunk_tokens=100, overlap=0))
+
+        for start, end, _ in spans[:-1]:
+            assert text[end:end + 2] == "\n\n"
+
+    def test_covers_all_tokens_with_overlap(self, tokenizer):
+        """Every token should land in a chunk and consecutive chunks should overlap."""
+        text = " ".join(f"token{i}" for i in range(2000))
+        spans = list(iter_chunk_spans(text, tokenizer, chunk_tokens=50, overlap=0.2))
+
+        assert spans[0][0] == 0
+        assert spans[-1][1] == len(text)
+        for (_, prev_end, _), (next_start, _, _) in zip(spans, spans[1:]):
+            assert next_start < prev_end
+
+    def test_empty_text(self, tokenizer):
+        """Empty or whitespace-only text yields no chunks."""
+        assert list(iter_chunk_spans("", tokenizer, chunk_tokens=10)) == []
+        assert list(iter_chunk_spans("   \n\n  ", tokenizer, chunk_tokens=10)) == []
+
+
+class TestTokenizers:
+    """Test tokenizer selection and wrappers."""
+
+    def test_hf_tokenizer_reserves_special_tokens(self):
+        """[CLS]/[SEP] should be subtracted from the model window."""
+        wrapped = HuggingFaceTokenizer(FakeHFTokenizer(), max_tokens=256)
+        assert wrapped.max_tokens == 254
+
+        starts, ends = wrapped.token_spans("hello big world")
+        assert starts.tolist() == [0, 6, 10]
+        assert ends.tolist() == [5, 9, 15]
+
+    def test_unknown_model_falls_back_to_approximate(self):
+        """Models without a local tokenizer use approximate counts with their window."""
+        tok = get_tokenizer("llama-text-embed-v2")
+        assert isinstance(tok, Tokenizer)
+        assert tok.max_tokens == 2048
+
+    def test_approximate_tokenizer_splits_long_words(self, tokenizer):
+        """Long words should count as several subword tokens."""
+        assert tokenizer.count("internationalization") == 5
+        assert tokenizer.count("Hi, you!") == 4
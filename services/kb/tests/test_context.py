@@ -0,0 +1,117 @@
+"""Tests for token-budgeted context packing."""
+from unittest.mock import patch
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.chunking import ApproximateTokenizer
+from services.context import pack_context, text_overlap
+from services.ingestion import chunk_text
+
+TEXT = " ".join(f"Sentence number {i} talks about topic {i % 7}." for i in range(300))
+TOKENIZER = ApproximateTokenizer("approximate", 512)
+
+
+def retrieved(indexes, document_id="d1", offsets=True, scores=None):
+    """Search results for chunks of TEXT, shaped like format_result output"""
+    chunks = chunk_text(TEXT, chunk_size=100)
+    results = []
+    for rank, i in enumerate(indexes):
+        result = {
+            "content": chunks[i]["text"],
+            "source": f"{document_id}.txt",
+            "score": scores[rank] if scores else 1.0 - rank * 0.1,
+            "document_id": document_id,
+            "chunk_index": i,
+        }
+        if offsets:
+            result.update(start=chunks[i]["start"], end=chunks[i]["end"])
+        results.append(result)
+    return results, chunks
+
+
+class TestPackContext:
+    """Test overlap removal, merging and the token budget."""
+
+    def test_adjacent_chunks_merge_without_repeated_text(self):
+        """Overlapping neighbours become one passage holding each character once."""
+        results, chunks = retrieved([2, 0, 1])
+
+        passages = pack_context(results, token_budget=10000, tokenizer=TOKENIZER)
+
+        assert len(passages) == 1
+        assert passages[0]["content"] == TEXT[chunks[0]["start"]:chunks[2]["end"]]
+        assert passages[0]["score"] == 1.0
+
+    def test_text_is_matched_without_offsets(self):
+        """Chunks stored before offsets were recorded are deduplicated by their text."""
+        results, chunks = retrieved([0, 1], offsets=False)
+
+        passages = pack_context(results, token_budget=10000, tokenizer=TOKENIZER)
+
+        assert [p["content"] for p in passages] == [TEXT[chunks[0]["start"]:chunks[1]["end"]]]
+
+    def test_stale_offsets_are_checked_against_text(self):
+        """Offsets that do not match the text (an edited keyed document) fall back to text matching."""
+        results, _ = retrieved([0, 1])
+        results[1]["start"] -= 5
+
+        overlap = text_overlap(results[0], results[1])
+
+        assert results[0]["content"].endswith(results[1]["content"][:overlap])
+        assert overlap > 0
+
+    def test_separate_documents_and_gaps_stay_apart(self):
+        """Chunks from other documents, or non-adjacent chunks, are separate passages in score order."""
+        first, _ = retrieved([0, 5], scores=[0.5, 0.7])
+        other, _ = retrieved([0], document_id="d2", scores=[0.9])
+
+        passages = pack_context(first + other, token_budget=10000, tokenizer=TOKENIZER)
+
+        assert [(p["document_id"], p["score"]) for p in passages] == [("d2", 0.9), ("d1", 0.7), ("d1", 0.5)]
+
+    def test_budget_is_filled_in_score_order(self):
+        """Lower-scored chunks that do not fit are skipped, while overlap costs nothing."""
+        results, chunks = retrieved([0, 1, 9])
+        one_chunk = TOKENIZER.count(results[0]["content"]) + TOKENIZER.count("[Source: d1.txt]\n")
+        budget = one_chunk + TOKENIZER.count(TEXT[chunks[0]["end"]:chunks[1]["end"]])
+
+        passages = pack_context(results, token_budget=budget, tokenizer=TOKENIZER)
+
+        assert [p["content"] for p in passages] == [TEXT[chunks[0]["start"]:chunks[1]["end"]]]
+
+    def test_hybrid_results_are_packed_by_fused_score(self):
+        """A keyword-only hit (similarity 0.0) that fusion ranked first is packed first."""
+        results, _ = retrieved([0, 5], scores=[0.9, 0.0])
+        results[0]["fused_score"], results[1]["fused_score"] = 0.016, 0.033
+        one_chunk = TOKENIZER.count(results[1]["content"]) + TOKENIZER.count("[Source: d1.txt]\n")
+
+        passages = pack_context(results, token_budget=one_chunk, tokenizer=TOKENIZER)
+
+        assert [(p["content"], p["score"]) for p in passages] == [(results[1]["content"], 0.0)]
+
+    def test_best_chunk_is_trimmed_to_budget(self):
+        results, _ = retrieved([0, 1])
+
+        passages = pack_context(results, token_budget=20, tokenizer=TOKENIZER)
+
+        assert len(passages) == 1
+        assert results[0]["content"].startswith(passages[0]["content"])
+        assert TOKENIZER.count(passages[0]["content"]) <= 20 - TOKENIZER.count("[Source: d1.txt]\n")
+
+
+class TestRAGPrompt:
+    """Test that the RAG prompt uses packed context."""
+
+    @patch('services.llm.get_model_name', return_value='llama3')
+    def test_prompt_sends_overlap_once(self, _):
+        from services.llm import build_rag_messages
+
+        results, chunks = retrieved([0, 1])
+        shared = TEXT[chunks[1]["start"]:chunks[0]["end"]]
+
+        messages, _ = build_rag_messages("What about topic 3?", results)
+
+        assert messages[-1]["content"].count(shared) == 1
+        assert messages[-1]["content"].count("[Source: d1.txt]") == 1
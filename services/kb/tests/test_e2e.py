@@ -108,6 +108,34 @@ class TestSearchEndpoint:
         # 422 = validation error, 401/500 = auth issues
         assert response.status_code in [422, 401, 500]
 
+    @pytest.mark.asyncio
+    async def test_batch_search_requires_assistant_id(self, client: AsyncClient):
+        """Batch search should reject queries without an assistant_id"""
+        response = await client.post(
+            "/api/knowledge-base/search/batch",
+            headers=AUTH_HEADERS,
+            json={
+                "queries": [{"query": "pricing", "assistant_id": "test-assistant"}, {"query": "refunds"}],
+            }
+        )
+        
+        # 422 = validation error, 401/500 = auth issues
+        assert response.status_code in [422, 401, 500]
+
+    @pytest.mark.asyncio
+    async def test_batch_search_rejects_too_many_queries(self, client: AsyncClient):
+        """Batch search should cap the number of queries"""
+        response = await client.post(
+            "/api/knowledge-base/search/batch",
+            headers=AUTH_HEADERS,
+            json={
+                "assistant_id": "test-assistant",
+                "queries": [{"query": f"q{i}"} for i in range(1000)],
+            }
+        )
+        
+        assert response.status_code in [422, 401, 500]
+
     @pytest.mark.asyncio
     async def test_search_custom_top_k(self, client: AsyncClient):
         """Search should respect custom top_k"""
@@ -252,9 +280,9 @@ class TestUploadEndpoint:
             # Missing assistant_id
         )
         
-        # Accept 200 if endpoint handles missing assistant_id gracefully
+        # Accept 202 if endpoint queues with the default assistant_id
         # or validation errors (422/400) or auth errors (401/500)
-        assert response.status_code in [200, 422, 400, 401, 500]
+        assert response.status_code in [202, 422, 400, 401, 500]
 
 
 class TestErrorHandling:
@@ -0,0 +1,102 @@
+"""Tests for the content-addressed embedding cache."""
+import pytest
+import numpy as np
+from unittest.mock import patch, MagicMock, AsyncMock
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.embedding_cache import EmbeddingCache, cache_key
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = EmbeddingCache(path=str(tmp_path / "embeddings.sqlite3"), max_bytes=10_000_000)
+    yield cache
+    cache.close()
+
+
+class TestCacheKeys:
+    """Test key normalization and separation."""
+
+    def test_whitespace_differences_share_key(self):
+        """Chunks differing only in whitespace should map to the same key."""
+        assert cache_key("local", "m", "Hello   world\n") == cache_key("local", "m", "Hello world")
+
+    def test_provider_and_model_are_part_of_key(self):
+        """Different providers/models must not share vectors."""
+        assert cache_key("local", "a", "text") != cache_key("local", "b", "text")
+        assert cache_key("local", "a", "text") != cache_key("openai", "a", "text")
+
+
+class TestEmbeddingCache:
+    """Test storage, LRU eviction and persistence."""
+
+    def test_roundtrip(self, cache):
+        """Stored vectors should be returned as float32 arrays."""
+        cache.put_many("local", "m", ["a", "b"], [[1.0, 2.0], [3.0, 4.0]])
+        results = cache.get_many("local", "m", ["b", "missing", "a"])
+
+        assert results[0].tolist() == [3.0, 4.0]
+        assert results[1] is None
+        assert results[2].dtype == np.float32
+        assert cache.stats()["hits"] == 2
+        assert cache.stats()["misses"] == 1
+
+    def test_evicts_least_recently_used(self, tmp_path):
+        """Exceeding the byte budget should evict the oldest-used entries first."""
+        cache = EmbeddingCache(path=str(tmp_path / "lru.sqlite3"), max_bytes=56)  # Room for 3 vectors of 4 floats
+        cache.put_many("local", "m", ["a"], [[0.0] * 4])
+        cache.put_many("local", "m", ["b"], [[0.0] * 4])
+        cache.get_many("local", "m", ["a"])  # "a" is now more recent than "b"
+        cache.put_many("local", "m", ["c", "d"], [[0.0] * 4, [0.0] * 4])
+
+        a, b, d = cache.get_many("local", "m", ["a", "b", "d"])
+        assert a is not None
+        assert b is None
+        assert d is not None
+        assert cache.stats()["bytes"] <= 56
+        cache.close()
+
+    def test_persists_across_instances(self, tmp_path):
+        """Entries should survive reopening the store (e.g. a restart)."""
+        path = str(tmp_path / "persist.sqlite3")
+        first = EmbeddingCache(path=path)
+        first.put_many("openai", "m", ["hello"], [[0.5, 0.25]])
+        first.close()
+
+        second = EmbeddingCache(path=path)
+        (vector,) = second.get_many("openai", "m", ["hello"])
+        assert vector.tolist() == [0.5, 0.25]
+        second.close()
+
+
+class TestIngestionUsesCache:
+    """Test that re-ingesting identical chunks skips the embedding call."""
+
+    @pytest.mark.asyncio
+    @patch('services.vector_store.get_pinecone_client')
+    @patch('services.embeddings.get_openai_client')
+    @patch('services.embeddings.EMBEDDING_PROVIDER', 'openai')
+    async def test_reupload_skips_embedding(self, mock_openai, mock_pinecone, cache):
+        """A second upload of the same document should not call the embedding API."""
+        from services.ingestion import ingest_document
+
+        mock_pinecone.return_value.Index.return_value = MagicMock()
+        mock_response = MagicMock()
+        mock_response.data = [MagicMock(embedding=[0.1] * 8)]
+        create = AsyncMock(return_value=mock_response)
+        mock_openai.return_value.embeddings.create = create
+
+        with patch('services.ingestion.get_embedding_cache', return_value=cache):
+            for _ in range(2):
+                result = await ingest_document(
+                    content=b"Refund policy: 30 days, no questions asked.",
+                    filename="refunds.txt",
+                    assistant_id="test-assistant",
+                    content_type="text/plain",
+                )
+                assert result["status"] == "processed"
+
+        assert create.await_count == 1
@@ -0,0 +1,90 @@
+"""Tests for the shared embedding engine."""
+import pytest
+from unittest.mock import patch, MagicMock, AsyncMock
+import sys
+import os
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class TestEmbeddingEngine:
+    """Test provider selection, model reuse and dimensions."""
+
+    @pytest.mark.asyncio
+    @patch('services.embeddings._local_embedding_batcher', None)
+    @patch('services.embeddings._local_embedding_model', None)
+    @patch('services.embeddings.EMBEDDING_PROVIDER', 'local')
+    async def test_ingestion_and_retrieval_share_one_model(self):
+        """Chunks and queries go through the same model instance, loaded once."""
+        from services.ingestion import embed_matrix
+        from services.retrieval import embed_query
+
+        model = MagicMock()
+        model.encode.side_effect = lambda texts, **kwargs: np.ones((len(texts), 4), dtype=np.float32) / 2
+        mock_cls = MagicMock(return_value=model)
+        with patch.dict(sys.modules, {"sentence_transformers": MagicMock(SentenceTransformer=mock_cls)}):
+            await embed_matrix(["chunk one", "chunk two"])
+            await embed_query("question")
+
+        mock_cls.assert_called_once()
+        assert model.encode.call_count == 2
+        assert model.encode.call_args.kwargs["normalize_embeddings"] is True
+
+    @pytest.mark.asyncio
+    @patch('services.embeddings._local_embedding_batcher', None)
+    @patch('services.embeddings._local_embedding_model', None)
+    @patch('services.embeddings.EMBEDDING_PROVIDER', 'local')
+    async def test_unnormalized_cached_vectors_are_not_reused(self, tmp_path):
+        """Local vectors cached under the bare model name (before normalization) are re-encoded."""
+        from services.embedding_cache import EmbeddingCache
+        from services.embeddings import LOCAL_EMBEDDING_MODEL
+        from services.ingestion import embed_matrix
+
+        cache = EmbeddingCache(path=str(tmp_path / "embeddings.sqlite3"), max_bytes=10_000_000)
+        cache.put_many("local", LOCAL_EMBEDDING_MODEL, ["chunk one"], [np.full(4, 3.0)])
+        model = MagicMock()
+        model.encode.side_effect = lambda texts, **kwargs: np.ones((len(texts), 4), dtype=np.float32) / 2
+        with patch.dict(sys.modules, {"sentence_transformers": MagicMock(SentenceTransformer=MagicMock(return_value=model))}), \
+                patch('services.ingestion.get_embedding_cache', return_value=cache):
+            first = await embed_matrix(["chunk one"])
+            second = await embed_matrix(["chunk one"])
+        cache.close()
+
+        np.testing.assert_allclose(first, second)
+        np.testing.assert_allclose(first, np.full((1, 4), 0.5))
+        model.encode.assert_called_once()
+
+    @pytest.mark.asyncio
+    @patch('services.embeddings.get_openai_client')
+    @patch('services.embeddings.EMBEDDING_PROVIDER', 'openai')
+    async def test_openai_texts_go_in_one_request(self, mock_openai):
+        from services.embeddings import OPENAI_EMBEDDING_MODEL, encode_queries
+
+        mock_openai.return_value.embeddings.create = AsyncMock(
+            return_value=MagicMock(data=[MagicMock(embedding=[1.0, 0.0]), MagicMock(embedding=[0.0, 1.0])])
+        )
+
+        vectors = await encode_queries(["a", "b"])
+
+        assert vectors.dtype == np.float32 and vectors.tolist() == [[1.0, 0.0], [0.0, 1.0]]
+        mock_openai.return_value.embeddings.create.assert_awaited_once_with(model=OPENAI_EMBEDDING_MODEL, input=["a", "b"])
+
+    @patch('services.embeddings.get_local_embedding_model')
+    @patch('services.embeddings.EMBEDDING_PROVIDER', 'local')
+    def test_local_dimension_comes_from_model(self, mock_model):
+        from services.embeddings import get_embedding_dimension
+
+        mock_model.return_value.get_sentence_embedding_dimension.return_value = 1024
+
+        assert get_embedding_dimension() == 1024
+
+    def test_api_dimensions_come_from_known_models(self):
+        from services.embeddings import get_embedding_dimension
+
+        with patch('services.embeddings.EMBEDDING_PROVIDER', 'openai'), \
+                patch('services.embeddings.OPENAI_EMBEDDING_MODEL', 'text-embedding-3-large'):
+            assert get_embedding_dimension() == 3072
+        with patch('services.embeddings.EMBEDDING_PROVIDER', 'pinecone'):
+            assert get_embedding_dimension() == 384
@@ -0,0 +1,177 @@
+"""Tests for token-aware conversation history compaction."""
+import pytest
+import asyncio
+from unittest.mock import patch, AsyncMock
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.history import compact_history, split_history
+
+
+def conversation(turns, words=20):
+    """Alternating user/assistant messages of about `words` words each"""
+    return [
+        {"role": "user" if i % 2 == 0 else "assistant", "content": f"turn {i} " + "word " * words}
+        for i in range(turns)
+    ]
+
+
+class TestSplitHistory:
+    """Test the token budget split."""
+
+    @patch('services.history.get_model_name', return_value='llama3')
+    def test_newest_turns_are_kept(self, _):
+        """Unlike a [:20] slice, the most recent turns survive."""
+        history = conversation(30)
+
+        older, recent = split_history(history, token_budget=100)
+
+        assert recent == history[-len(recent):]
+        assert older + recent == history
+        assert 0 < len(recent) < 30
+
+    @patch('services.history.get_model_name', return_value='llama3')
+    def test_short_history_is_untouched(self, _):
+        history = conversation(4)
+
+        assert split_history(history, token_budget=10000) == ([], history)
+
+
+class TestCompactHistory:
+    """Test running summaries and their cache."""
+
+    @pytest.mark.asyncio
+    @patch('services.history.get_model_name', return_value='llama3')
+    @patch('services.history.generate_chat_response', new_callable=AsyncMock)
+    async def test_older_turns_become_a_summary(self, mock_generate, _):
+        mock_generate.return_value = "User asked about pricing."
+        history = conversation(30)
+
+        compacted = await compact_history(history, "a1", token_budget=100)
+
+        assert compacted[0] == {"role": "system", "content": "Summary of the earlier conversation:\nUser asked about pricing."}
+        assert compacted[1:] == history[-(len(compacted) - 1):]
+        mock_generate.assert_awaited_once()
+
+    @pytest.mark.asyncio
+    @patch('services.history.get_model_name', return_value='llama3')
+    @patch('services.history.generate_chat_response', new_callable=AsyncMock)
+    async def test_cold_cache_makes_one_bounded_call(self, mock_generate, _):
+        """A long history with no cached summary costs one LLM call over about one budget of turns."""
+        mock_generate.return_value = "Summary."
+        history = conversation(50, words=200)
+        older, recent = split_history(history, token_budget=100)
+
+        await compact_history(history, "a1", token_budget=100)
+
+        prompt = mock_generate.call_args.args[0][0]["content"]
+        mock_generate.assert_awaited_once()
+        assert f"turn {len(older) - 1} " in prompt
+        assert "turn 0 " not in prompt
+        assert len(prompt) < len(older[-1]["content"]) + 200
+
+    @pytest.mark.asyncio
+    @patch('services.history.get_model_name', return_value='llama3')
+    @patch('services.history.generate_chat_response', new_callable=AsyncMock)
+    async def test_summary_is_extended_incrementally(self, mock_generate, _):
+        """The next turn reuses the cached summary and only sends the turns that aged out since."""
+        mock_generate.side_effect = ["Summary one.", "Summary two."]
+        history = conversation(30)
+        older, _ = split_history(history, token_budget=100)
+        await compact_history(history, "a1", token_budget=100)
+
+        compacted = await compact_history(history + conversation(32)[30:], "a1", token_budget=100)
+
+        prompt = mock_generate.call_args.args[0][0]["content"]
+        assert mock_generate.await_count == 2
+        assert prompt.startswith("Current summary:\nSummary one.")
+        assert f"turn {len(older) - 1} " not in prompt
+        assert f"turn {len(older)} " in prompt
+        assert compacted[0]["content"].endswith("Summary two.")
+
+    @pytest.mark.asyncio
+    @patch('services.history.get_model_name', return_value='llama3')
+    @patch('services.history.generate_chat_response', new_callable=AsyncMock)
+    async def test_cache_is_per_assistant(self, mock_generate, _):
+        mock_generate.return_value = "Summary."
+        history = conversation(30)
+
+        await compact_history(history, "a1", token_budget=100)
+        await compact_history(history, "a1", token_budget=100)
+        await compact_history(history, "a2", token_budget=100)
+
+        assert mock_generate.await_count == 2
+
+    @pytest.mark.asyncio
+    @patch('services.history.get_model_name', return_value='llama3')
+    @patch('services.history.generate_chat_response', new_callable=AsyncMock)
+    async def test_summary_failure_drops_older_turns(self, mock_generate, _):
+        mock_generate.side_effect = RuntimeError("LLM down")
+        history = conversation(30)
+
+        compacted = await compact_history(history, "a1", token_budget=100)
+
+        assert compacted == split_history(history, token_budget=100)[1]
+
+    @pytest.mark.asyncio
+    @patch('main.KB_SERVICE_API_KEY', 'test-kb-key')
+    @patch('services.history.CHAT_HISTORY_TOKEN_BUDGET', 100)
+    @patch('services.history.generate_chat_response', new_callable=AsyncMock)
+    @patch('main.generate_rag_response', new_callable=AsyncMock)
+    @patch('main.search_knowledge_base', new_callable=AsyncMock)
+    async def test_chat_sends_compacted_history(self, mock_search, mock_generate_rag, mock_summarize, client):
+        """The chat endpoint accepts long histories and forwards the summary plus the newest turns."""
+        mock_search.return_value = []
+        mock_generate_rag.return_value = "Answer"
+        mock_summarize.return_value = "Summary."
+        history = conversation(50)
+
+        response = await client.post(
+            "/api/knowledge-base/chat",
+            headers={"Authorization": "Bearer test-kb-key"},
+            json={"query": "And now?", "assistant_id": "a1", "conversation_history": history},
+        )
+
+        assert response.status_code == 200
+        sent = mock_generate_rag.call_args.kwargs["conversation_history"]
+        assert sent[0]["role"] == "system"
+        assert sent[-1] == history[-1]
+        assert len(sent) < 20
+
+    @pytest.mark.asyncio
+    @patch('services.history.CHAT_HISTORY_TOKEN_BUDGET', 100)
+    @patch('services.history.generate_chat_response', new_callable=AsyncMock)
+    @patch('main.stream_rag_response')
+    @patch('main.search_knowledge_base', new_callable=AsyncMock)
+    async def test_stream_sends_sources_before_summary(self, mock_search, mock_stream, mock_summarize):
+        """The "sources" event does not wait for the history summary; only the LLM call does."""
+        from main import ChatRequest, chat_with_rag_stream
+
+        summary_gate = asyncio.Event()
+
+        async def summarize(*args, **kwargs):
+            await summary_gate.wait()
+            return "Summary."
+
+        async def streamed(**kwargs):
+            yield {"type": "delta", "content": "Answer"}
+            yield {"type": "done", "model": "llama3", "finish_reason": "stop", "usage": None}
+
+        mock_search.return_value = [{"content": "Starter is $299", "source": "pricing.pdf", "score": 0.9}]
+        mock_summarize.side_effect = summarize
+        mock_stream.side_effect = streamed
+        history = conversation(30)
+
+        request = ChatRequest(query="And now?", assistant_id="a1", conversation_history=history)
+        response = await asyncio.wait_for(chat_with_rag_stream(request), timeout=1)
+        events = response.body_iterator
+        first = await asyncio.wait_for(events.__anext__(), timeout=1)
+
+        assert first.startswith("event: sources")
+        mock_stream.assert_not_called()
+        summary_gate.set()
+        rest = [event async for event in events]
+        assert rest[0] == 'event: token\ndata: {"content": "Answer"}\n\n'
+        assert mock_stream.call_args.kwargs["conversation_history"][0]["content"].endswith("Summary.")
@@ -1,8 +1,9 @@
 """Tests for document ingestion."""
 import pytest
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch, MagicMock, AsyncMock
 import sys
 import os
+import numpy as np
 
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
@@ -69,9 +70,9 @@ class TestIngestionPipeline:
     """Test the full ingestion pipeline."""
 
     @pytest.mark.asyncio
-    @patch('services.ingestion.get_pinecone_client')
-    @patch('services.ingestion.get_openai_client')
-    @patch('services.ingestion.EMBEDDING_PROVIDER', 'openai')
+    @patch('services.vector_store.get_pinecone_client')
+    @patch('services.embeddings.get_openai_client')
+    @patch('services.embeddings.EMBEDDING_PROVIDER', 'openai')
     async def test_ingest_document_structure(self, mock_openai, mock_pinecone):
         """Ingestion should return correct structure."""
         from services.ingestion import ingest_document
@@ -83,7 +84,7 @@ class TestIngestionPipeline:
         # Mock OpenAI embeddings
         mock_embedding = MagicMock()
         mock_embedding.data = [MagicMock(embedding=[0.1] * 1536)]
-        mock_openai.return_value.embeddings.create.return_value = mock_embedding
+        mock_openai.return_value.embeddings.create = AsyncMock(return_value=mock_embedding)
         
         result = await ingest_document(
             content=b"Test document content for ingestion testing.",
@@ -96,3 +97,126 @@ class TestIngestionPipeline:
         assert "chunks" in result
         assert "status" in result
         assert result["status"] == "processed"
+
+    @pytest.mark.asyncio
+    @patch('services.ingestion.get_chunk_tokenizer', lambda: None)
+    @patch('services.vector_store.get_pinecone_client')
+    @patch('services.embeddings.get_local_embedding_model')
+    @patch('services.embeddings.EMBEDDING_PROVIDER', 'local')
+    async def test_local_embedding_does_not_block_event_loop(self, mock_model, mock_pinecone):
+        """Event loop should keep serving other work while chunks are embedding."""
+        import asyncio
+        import time
+        import numpy as np
+        from services.ingestion import ingest_document
+
+        def slow_encode(texts, **kwargs):
+            time.sleep(0.3)  # Simulate CPU-bound encoding
+            return np.zeros((len(texts), 384), dtype=np.float32)
+
+        mock_model.return_value.encode.side_effect = slow_encode
+        mock_pinecone.return_value.Index.return_value = MagicMock()
+
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        ticker_task = asyncio.create_task(ticker())
+        await ingest_document(
+            content=b"Test document content for ingestion testing.",
+            filename="test.txt",
+            assistant_id="test-assistant",
+            content_type="text/plain",
+        )
+        ticker_task.cancel()
+
+        # A blocked loop would only tick once or twice during the 300ms encode
+        assert ticks >= 10
+
+
+
+class TestIncrementalUpdates:
+    """Test keyed document updates with chunk-level diffing."""
+
+    def test_stable_document_id(self):
+        """Document IDs should be deterministic per (assistant, key)."""
+        from services.ingestion import stable_document_id
+
+        assert stable_document_id("a1", "manual.pdf") == stable_document_id("a1", "manual.pdf")
+        assert stable_document_id("a1", "manual.pdf") != stable_document_id("a2", "manual.pdf")
+
+    @pytest.mark.asyncio
+    @patch('services.ingestion.chunk_spans')
+    @patch('services.vector_store.get_pinecone_client')
+    @patch('services.embeddings.get_openai_client')
+    @patch('services.embeddings.EMBEDDING_PROVIDER', 'openai')
+    async def test_update_only_writes_changed_chunks(self, mock_openai, mock_pinecone, mock_chunk_spans):
+        """Unchanged chunks are skipped, new ones upserted, removed ones deleted."""
+        from services.ingestion import ingest_document, stable_document_id, chunk_hash
+
+        document_id = stable_document_id("test-assistant", "manual")
+        kept_id = f"{document_id}#{chunk_hash('Unchanged section.')}"
+        stale_id = f"{document_id}#{chunk_hash('Removed section.')}"
+
+        mock_chunk_spans.return_value = np.array([[0, 18, 3], [19, 31, 3]])
+        mock_index = MagicMock()
+        mock_index.list.return_value = iter([[kept_id, stale_id]])
+        mock_pinecone.return_value.Index.return_value = mock_index
+
+        async def fake_create(model, input):
+            return MagicMock(data=[MagicMock(embedding=[0.1] * 8) for _ in input])
+        mock_openai.return_value.embeddings.create = AsyncMock(side_effect=fake_create)
+
+        result = await ingest_document(
+            content=b"Unchanged section. New section.",
+            filename="manual.txt",
+            assistant_id="test-assistant",
+            content_type="text/plain",
+            document_key="manual",
+        )
+
+        assert result["document_id"] == document_id
+        assert result["chunks_added"] == 1
+        assert result["chunks_removed"] == 1
+
+        embedded = mock_openai.return_value.embeddings.create.call_args.kwargs["input"]
+        assert embedded == ["New section."]
+
+        upserted = mock_index.upsert.call_args.kwargs["vectors"]
+        assert [v[0] for v in upserted] == [f"{document_id}#{chunk_hash('New section.')}"]
+        mock_index.delete.assert_called_once_with(ids=[stale_id])
+
+    @pytest.mark.asyncio
+    @patch('services.ingestion.chunk_spans')
+    @patch('services.ingestion.upsert_batched', new_callable=AsyncMock)
+    @patch('services.ingestion.get_vector_store')
+    @patch('services.ingestion.embed_matrix', new_callable=AsyncMock)
+    @patch('services.embeddings.EMBEDDING_PROVIDER', 'openai')
+    async def test_failed_update_keeps_old_chunks(self, mock_embed_matrix, mock_store, mock_upsert, mock_chunk_spans):
+        """A keyed update whose new chunks failed to upsert does not delete the previous version."""
+        from services.ingestion import ingest_document, stable_document_id, chunk_hash
+        from services.upsert import UpsertReport
+
+        document_id = stable_document_id("test-assistant", "manual")
+        stale_id = f"{document_id}#{chunk_hash('Removed section.')}"
+        new_id = f"{document_id}#{chunk_hash('New section.')}"
+        mock_chunk_spans.return_value = np.array([[0, 12, 3]])
+        mock_store.return_value.list_ids.return_value = {stale_id}
+        mock_embed_matrix.side_effect = lambda texts: np.ones((len(texts), 4), dtype=np.float32)
+        mock_upsert.return_value = UpsertReport(batches=1, failed_batches=1, failed_ids=[new_id])
+
+        result = await ingest_document(
+            content=b"New section.",
+            filename="manual.txt",
+            assistant_id="test-assistant",
+            content_type="text/plain",
+            document_key="manual",
+        )
+
+        assert result["status"] == "partial"
+        assert (result["chunks_added"], result["chunks_failed"], result["chunks_removed"]) == (0, 1, 0)
+        mock_store.return_value.delete.assert_not_called()
@@ -0,0 +1,228 @@
+"""Tests for background ingestion jobs."""
+import asyncio
+import pytest
+from unittest.mock import patch, AsyncMock
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.jobs import (
+    IngestionJobQueue,
+    QueueFullError,
+    JOB_COMPLETED,
+    JOB_DEAD_LETTER,
+)
+from services.spool import read_text, release_source
+
+
+async def wait_for_status(queue, job_id, statuses, timeout=2.0):
+    """Poll a job until it reaches one of the given statuses."""
+    deadline = asyncio.get_running_loop().time() + timeout
+    while asyncio.get_running_loop().time() < deadline:
+        job = queue.get(job_id)
+        if job.status in statuses:
+            return job
+        await asyncio.sleep(0.01)
+    raise AssertionError(f"Job {job_id} stuck in {queue.get(job_id).status}")
+
+
+class TestIngestionJobQueue:
+    """Test job lifecycle, retries and dead-lettering."""
+
+    @pytest.mark.asyncio
+    @patch('services.jobs.ingest_document', new_callable=AsyncMock)
+    async def test_job_completes_with_chunk_counts(self, mock_ingest):
+        """Completed jobs should report chunk counts and release content."""
+        async def fake_ingest(**kwargs):
+            kwargs["progress"]("embedding", chunks_total=3)
+            return {"document_id": kwargs["document_id"], "chunks": 3, "status": "processed"}
+        mock_ingest.side_effect = fake_ingest
+
+        queue = IngestionJobQueue(workers=1, retry_backoff=0)
+        job = queue.submit(b"Some text", "doc.txt", "test-assistant", "text/plain")
+        job = await wait_for_status(queue, job.job_id, [JOB_COMPLETED])
+
+        assert job.chunks_total == 3
+        assert job.chunks_processed == 3
+        assert job.stage == "done"
+        assert job.content is None
+        assert mock_ingest.call_args.kwargs["document_id"] == job.document_id
+        await queue.shutdown()
+
+    @pytest.mark.asyncio
+    @patch('services.jobs.ingest_document', new_callable=AsyncMock)
+    async def test_transient_failure_is_retried(self, mock_ingest):
+        """Transient errors should be retried until success."""
+        mock_ingest.side_effect = [
+            ConnectionError("pinecone unavailable"),
+            {"document_id": "doc", "chunks": 1, "status": "processed"},
+        ]
+
+        queue = IngestionJobQueue(workers=1, max_attempts=3, retry_backoff=0)
+        job = queue.submit(b"text", "doc.txt", "test-assistant", "text/plain")
+        job = await wait_for_status(queue, job.job_id, [JOB_COMPLETED, JOB_DEAD_LETTER])
+
+        assert job.status == JOB_COMPLETED
+        assert job.attempts == 2
+        await queue.shutdown()
+
+    @pytest.mark.asyncio
+    @patch('services.jobs.ingest_document', new_callable=AsyncMock)
+    async def test_exhausted_retries_dead_letter(self, mock_ingest):
+        """Jobs that keep failing should end in the dead-letter state."""
+        mock_ingest.side_effect = ConnectionError("pinecone unavailable")
+
+        queue = IngestionJobQueue(workers=1, max_attempts=2, retry_backoff=0)
+        job = queue.submit(b"text", "doc.txt", "test-assistant", "text/plain")
+        job = await wait_for_status(queue, job.job_id, [JOB_DEAD_LETTER])
+
+        assert job.attempts == 2
+        assert job.error == "ConnectionError"
+        await queue.shutdown()
+
+    @pytest.mark.asyncio
+    @patch('services.jobs.ingest_document', new_callable=AsyncMock)
+    async def test_invalid_document_not_retried(self, mock_ingest):
+        """ValueErrors (bad input/config) should dead-letter without retrying."""
+        mock_ingest.side_effect = ValueError("Unsupported content type")
+
+        queue = IngestionJobQueue(workers=1, max_attempts=3, retry_backoff=0)
+        job = queue.submit(b"text", "doc.txt", "test-assistant", "text/plain")
+        job = await wait_for_status(queue, job.job_id, [JOB_DEAD_LETTER])
+
+        assert job.attempts == 1
+        await queue.shutdown()
+
+    @pytest.mark.asyncio
+    async def test_corrupt_pdf_not_retried(self):
+        """PDF parse errors are bad input too, so the job dead-letters on the first attempt."""
+        queue = IngestionJobQueue(workers=1, max_attempts=3, retry_backoff=0)
+        job = queue.submit(b"%PDF-1.4 truncated", "broken.pdf", "test-assistant", "application/pdf")
+        job = await wait_for_status(queue, job.job_id, [JOB_DEAD_LETTER])
+
+        assert job.attempts == 1
+        assert job.error == "InvalidPdfError"
+        await queue.shutdown()
+
+    @pytest.mark.asyncio
+    @patch('services.jobs.ingest_document', new_callable=AsyncMock)
+    async def test_queue_full_rejects_submission(self, mock_ingest):
+        """Submissions beyond the queue bound should be rejected."""
+        release = asyncio.Event()
+
+        async def slow_ingest(**kwargs):
+            await release.wait()
+            return {"document_id": kwargs["document_id"], "chunks": 1, "status": "processed"}
+        mock_ingest.side_effect = slow_ingest
+
+        queue = IngestionJobQueue(workers=1, max_queue_size=1, retry_backoff=0)
+        queue.submit(b"a", "a.txt", "test-assistant", "text/plain")
+        await asyncio.sleep(0.01)  # Worker picks up the first job
+        queue.submit(b"b", "b.txt", "test-assistant", "text/plain")
+
+        with pytest.raises(QueueFullError):
+            queue.submit(b"c", "c.txt", "test-assistant", "text/plain")
+
+        release.set()
+        await queue.shutdown()
+
+    @pytest.mark.asyncio
+    @patch('services.jobs.ingest_document', new_callable=AsyncMock)
+    async def test_shutdown_drains_queued_jobs(self, mock_ingest):
+        """Shutdown should finish queued jobs and then refuse new ones."""
+        mock_ingest.return_value = {"document_id": "doc", "chunks": 1, "status": "processed"}
+
+        queue = IngestionJobQueue(workers=1, retry_backoff=0)
+        jobs = [queue.submit(b"x", f"{i}.txt", "test-assistant", "text/plain") for i in range(3)]
+        await queue.shutdown(timeout=2)
+
+        assert all(queue.get(job.job_id).status == JOB_COMPLETED for job in jobs)
+        assert not queue.running
+
+
+class TestJobEndpoints:
+    """Test upload queuing and job status endpoints."""
+
+    @pytest.mark.asyncio
+    @patch('main.KB_SERVICE_API_KEY', 'test-kb-key')
+    async def test_unknown_job_returns_404(self, client):
+        """Unknown job IDs should return 404."""
+        response = await client.get(
+            "/api/knowledge-base/jobs/does-not-exist",
+            headers={"Authorization": "Bearer test-kb-key"},
+        )
+        assert response.status_code == 404
+
+    @pytest.mark.asyncio
+    @patch('main.KB_SERVICE_API_KEY', 'test-kb-key')
+    @patch('main.get_job_queue')
+    async def test_upload_returns_202_with_job_id(self, mock_get_queue, client):
+        """Upload should queue the document and return a job ID."""
+        queue = IngestionJobQueue(workers=1)
+        queue.start = lambda: None  # Keep the job queued for inspection
+        queue._queue = asyncio.Queue()
+        mock_get_queue.return_value = queue
+
+        response = await client.post(
+            "/api/knowledge-base/upload",
+            headers={"Authorization": "Bearer test-kb-key"},
+            params={"assistant_id": "test-assistant"},
+            files={"file": ("test.txt", b"Test content", "text/plain")},
+        )
+
+        assert response.status_code == 202
+        data = response.json()
+        assert data["status"] == "queued"
+        job = queue.get(data["job_id"])
+        assert job.document_id == data["document_id"]
+        assert read_text(job.content) == "Test content"  # Spooled to disk, not held in memory
+        release_source(job.content)
+
+    @pytest.mark.asyncio
+    @patch('main.KB_SERVICE_API_KEY', 'test-kb-key')
+    @patch('main.MAX_UPLOAD_BYTES', 8)
+    @patch('main.get_job_queue')
+    async def test_oversized_upload_rejected_while_streaming(self, mock_get_queue, client, tmp_path):
+        """Uploads over the cap should get 413 and leave no spool file behind."""
+        from services.spool import spool_upload
+
+        async def small_pieces(file, max_bytes):
+            return await spool_upload(file, max_bytes, chunk_bytes=4, spool_dir=str(tmp_path))
+
+        with patch('main.spool_upload', small_pieces):
+            response = await client.post(
+                "/api/knowledge-base/upload",
+                headers={"Authorization": "Bearer test-kb-key"},
+                params={"assistant_id": "test-assistant"},
+                files={"file": ("test.txt", b"Far too much content", "text/plain")},
+            )
+
+        assert response.status_code == 413
+        assert list(tmp_path.iterdir()) == []
+        mock_get_queue.return_value.submit.assert_not_called()
+
+    @pytest.mark.asyncio
+    @patch('main.KB_SERVICE_API_KEY', 'test-kb-key')
+    @patch('main.get_job_queue')
+    async def test_document_update_uses_stable_id(self, mock_get_queue, client):
+        """Updating a document should queue a keyed job with a stable document ID."""
+        from services.ingestion import stable_document_id
+
+        queue = IngestionJobQueue(workers=1)
+        queue.start = lambda: None
+        queue._queue = asyncio.Queue()
+        mock_get_queue.return_value = queue
+
+        response = await client.put(
+            "/api/knowledge-base/documents",
+            headers={"Authorization": "Bearer test-kb-key"},
+            params={"assistant_id": "test-assistant"},
+            files={"file": ("handbook.txt", b"Updated content", "text/plain")},
+        )
+
+        assert response.status_code == 202
+        data = response.json()
+        assert data["document_key"] == "handbook.txt"
+        assert data["document_id"] == stable_document_id("test-assistant", "handbook.txt")
+        assert queue.get(data["job_id"]).document_key == "handbook.txt"
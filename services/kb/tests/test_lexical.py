@@ -0,0 +1,277 @@
+"""Tests for the BM25 lexical index and hybrid (dense + keyword) retrieval."""
+import pytest
+from unittest.mock import patch, AsyncMock
+import sys
+import os
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.lexical import LexicalIndex, tokenize
+from services.vector_store import Match
+
+DOCS = [
+    ("d#1", "The Starter plan costs $299 per month.", {"filename": "pricing.txt"}),
+    ("d#2", "Error E-1042 means the upload was too large.", {"filename": "errors.txt"}),
+    ("d#3", "Refunds are processed within five business days.", {"filename": "faq.txt"}),
+]
+
+
+def ids(hits):
+    return [record["id"] for record, _ in hits]
+
+
+class TestTokenize:
+    """Test term extraction."""
+
+    def test_compound_tokens_are_kept_whole_and_split(self):
+        assert tokenize("SKU AB-12/x costs $299.") == ["sku", "ab-12/x", "ab", "12", "x", "costs", "$299", "299"]
+
+    def test_casefolds(self):
+        assert tokenize("Straße ERROR") == ["strasse", "error"]
+
+
+class TestLexicalIndex:
+    """Test BM25 ranking, updates and persistence."""
+
+    def test_exact_terms_rank_first(self):
+        """Codes and prices match exactly, whatever the case or punctuation in the query."""
+        index = LexicalIndex()
+        index.add("a1", DOCS)
+
+        assert ids(index.search("a1", "what is e-1042", top_k=3)) == ["d#2"]
+        assert ids(index.search("a1", "$299", top_k=3)) == ["d#1"]
+        assert ids(index.search("a1", "unknown words", top_k=3)) == []
+
+    def test_rarer_terms_weigh_more(self):
+        """Idf favours the document with the rare query term."""
+        index = LexicalIndex()
+        index.add("a1", [("x", "plan plan refund", {}), ("y", "plan", {}), ("z", "plan", {})])
+
+        hits = index.search("a1", "plan refund", top_k=3)
+
+        assert ids(hits)[0] == "x"
+        assert hits[0][1] > hits[1][1] > 0
+
+    def test_records_carry_metadata(self):
+        index = LexicalIndex()
+        index.add("a1", DOCS)
+
+        record, _ = index.search("a1", "refunds", top_k=1)[0]
+
+        assert record == {"id": "d#3", "metadata": {"filename": "faq.txt"}}
+
+    def test_replace_and_delete(self):
+        """Re-adding an id replaces its postings; deleted ids are never returned."""
+        index = LexicalIndex()
+        index.add("a1", DOCS)
+        index.add("a1", [("d#1", "The Starter plan costs $399 per month.", {})])
+        index.delete("a1", ["d#3"])
+
+        assert ids(index.search("a1", "$299", top_k=3)) == []
+        assert ids(index.search("a1", "$399", top_k=3)) == ["d#1"]
+        assert ids(index.search("a1", "refunds", top_k=3)) == []
+        assert index.namespace("a1").live_docs == 2
+
+    def test_namespaces_are_isolated(self):
+        index = LexicalIndex()
+        index.add("a1", DOCS)
+
+        assert index.search("a2", "refunds", top_k=3) == []
+
+    def test_persists_and_syncs_between_processes(self, tmp_path):
+        """A second index on the same directory sees writes made before and after it opened."""
+        writer = LexicalIndex(str(tmp_path))
+        writer.add("a1", DOCS[:2])
+        reader = LexicalIndex(str(tmp_path))
+        assert ids(reader.search("a1", "e-1042", top_k=3)) == ["d#2"]
+
+        writer.add("a1", DOCS[2:])
+        writer.delete("a1", ["d#2"])
+
+        assert ids(reader.search("a1", "refunds", top_k=3)) == ["d#3"]
+        assert ids(reader.search("a1", "e-1042", top_k=3)) == []
+
+    def test_log_is_folded_into_memory_mapped_snapshot(self, tmp_path):
+        """Past the log threshold, live rows move to CSR arrays and the log restarts empty."""
+        writer = LexicalIndex(str(tmp_path))
+        reader = LexicalIndex(str(tmp_path))
+        writer.add("a1", DOCS)
+        assert ids(reader.search("a1", "refunds", top_k=3)) == ["d#3"]
+
+        with patch('services.lexical.LEXICAL_SNAPSHOT_LOG_BYTES', 0):
+            writer.delete("a1", ["d#3"])
+            writer.close()  # The fold runs in the background
+
+        index = writer.namespace("a1")
+        assert index.snapshot_rows == 2 and not index.delta_lengths
+        assert isinstance(index.post_rows, np.memmap)
+        assert os.path.getsize(os.path.join(index.path, index.log_name)) == 0
+        assert ids(reader.search("a1", "refunds", top_k=3)) == []
+        assert ids(reader.search("a1", "$299", top_k=3)) == ["d#1"]
+        assert ids(LexicalIndex(str(tmp_path)).search("a1", "e-1042", top_k=3)) == ["d#2"]
+
+    def test_searches_run_while_a_fold_is_pending(self, tmp_path):
+        """An ingest past the log threshold schedules the fold instead of running it under the index lock."""
+        writer = LexicalIndex(str(tmp_path))
+        writer.add("a1", DOCS[:2])
+        scheduled = []
+        index = writer.namespace("a1")
+        index._schedule = scheduled.append
+
+        with patch('services.lexical.LEXICAL_SNAPSHOT_LOG_BYTES', 0):
+            writer.add("a1", DOCS[2:])
+            writer.delete("a1", ["d#1"])
+
+            assert scheduled == [index]
+            assert index.snapshot_rows == 0
+            assert sorted(ids(writer.search("a1", "refunds upload", top_k=3))) == ["d#2", "d#3"]
+
+            index.fold()
+
+        assert index.snapshot_rows == 2 and not index.fold_pending
+        writer.add("a1", DOCS[:1])  # Scores mix snapshot and delta rows
+        assert sorted(ids(writer.search("a1", "refunds upload $299", top_k=3))) == ["d#1", "d#2", "d#3"]
+
+    def test_torn_log_line_is_ignored_then_truncated(self, tmp_path):
+        writer = LexicalIndex(str(tmp_path))
+        writer.add("a1", DOCS[:1])
+        index = writer.namespace("a1")
+        with open(os.path.join(index.path, index.log_name), "ab") as f:
+            f.write(b'{"op": "add", "id": "torn"')
+
+        reopened = LexicalIndex(str(tmp_path))
+        assert ids(reopened.search("a1", "starter", top_k=3)) == ["d#1"]
+
+        reopened.add("a1", DOCS[1:2])
+
+        assert ids(LexicalIndex(str(tmp_path)).search("a1", "upload starter", top_k=3)) == ["d#1", "d#2"]
+
+
+class TestHybridSearch:
+    """Test reciprocal-rank fusion in search_knowledge_base."""
+
+    def test_fuse_rankings(self):
+        """Chunks found by both rankings rise above those found by one."""
+        from services.retrieval import fuse_rankings
+
+        dense = [Match("a", 0.9, {"text": "A"}), Match("b", 0.8, {"text": "B"})]
+        keyword = [({"id": "b", "metadata": {"text": "B"}}, 7.5), ({"id": "c", "metadata": {"text": "C"}}, 3.0)]
+
+        results = fuse_rankings(dense, keyword, top_k=2)
+
+        assert [r["content"] for r in results] == ["B", "A"]
+        assert results[0]["fused_score"] == pytest.approx(1 / 62 + 1 / 61)
+        assert [r["score"] for r in results] == [0.8, 0.9]
+        assert (results[0]["vector_score"], results[0]["lexical_score"]) == (0.8, 7.5)
+        assert (results[1]["vector_score"], results[1]["lexical_score"]) == (0.9, None)
+
+    @pytest.mark.asyncio
+    @patch('services.lexical.LEXICAL_SEARCH_ENABLED', True)
+    @patch('services.lexical.LEXICAL_INDEX_DIR', '')
+    @patch('services.vector_store.VECTOR_STORE', 'local')
+    @patch('services.embeddings.EMBEDDING_PROVIDER', 'openai')
+    @patch('services.vector_store.LOCAL_VECTOR_STORE_DIR', '')
+    @patch('services.retrieval.embed_query', new_callable=AsyncMock)
+    @patch('services.ingestion.embed_matrix', new_callable=AsyncMock)
+    @patch('services.ingestion.chunk_spans')
+    async def test_keyword_match_beats_unrelated_embedding(self, mock_spans, mock_embed_matrix, mock_embed_query):
+        """An exact error code is found even when the query vector points at another chunk."""
+        from services.ingestion import ingest_document
+        from services.retrieval import search_knowledge_base
+
+        mock_spans.return_value = np.array([[0, 18, 4], [19, 37, 4]])
+        mock_embed_matrix.side_effect = lambda texts: np.eye(len(texts), 4, dtype=np.float32)
+        mock_embed_query.return_value = [1.0, 0.0, 0.0, 0.0]  # Nearest to the first chunk
+
+        await ingest_document(b"Refunds take days. Error X-77 fixed.", "faq.txt", "a1", "text/plain")
+
+        results = await search_knowledge_base(query="x-77", assistant_id="a1", top_k=1)
+
+        assert results[0]["content"] == "Error X-77 fixed."
+        assert results[0]["lexical_score"] > 0
+
+    @pytest.mark.asyncio
+    @patch('services.lexical.LEXICAL_SEARCH_ENABLED', True)
+    @patch('services.lexical.LEXICAL_INDEX_DIR', '')
+    @patch('services.ingestion.get_vector_store')
+    @patch('services.ingestion.embed_matrix', new_callable=AsyncMock)
+    @patch('services.ingestion.chunk_spans')
+    @patch('services.embeddings.EMBEDDING_PROVIDER', 'openai')
+    async def test_stale_chunks_leave_the_keyword_index(self, mock_spans, mock_embed_matrix, mock_store):
+        """Re-ingesting a keyed document removes its old chunks from the lexical index too."""
+        from services.ingestion import ingest_document
+        from services.lexical import get_lexical_index
+
+        store = mock_store.return_value
+        store.namespace_for.return_value = "a1"
+        store.list_ids.return_value = set()
+        mock_spans.side_effect = lambda text: np.array([[0, len(text), 3]])
+        mock_embed_matrix.side_effect = lambda texts: np.ones((len(texts), 4), dtype=np.float32)
+
+        first = await ingest_document(b"old wording", "f.txt", "a1", "text/plain", document_key="f")
+        store.list_ids.return_value = set(ids(get_lexical_index().search("a1", "old", top_k=5)))
+        await ingest_document(b"new wording", "f.txt", "a1", "text/plain", document_key="f")
+
+        assert get_lexical_index().search("a1", "old", top_k=5) == []
+        assert ids(get_lexical_index().search("a1", "wording", top_k=5))[0].startswith(first["document_id"])
+
+
+class TestRebuildLexicalIndex:
+    """Test backfilling the keyword index from the vector store."""
+
+    @pytest.mark.asyncio
+    @patch('services.lexical.LEXICAL_INDEX_DIR', '')
+    @patch('services.vector_store.VECTOR_STORE', 'local')
+    @patch('services.embeddings.EMBEDDING_PROVIDER', 'openai')
+    @patch('services.vector_store.LOCAL_VECTOR_STORE_DIR', '')
+    @patch('services.ingestion.embed_matrix', new_callable=AsyncMock)
+    @patch('services.ingestion.chunk_spans')
+    async def test_backfills_chunks_ingested_without_the_index(self, mock_spans, mock_embed_matrix):
+        """Chunks ingested while lexical search was off become searchable; stale postings are dropped."""
+        from services.ingestion import ingest_document, rebuild_lexical_index
+        from services.lexical import get_lexical_index
+
+        mock_spans.return_value = np.array([[0, 18, 4], [19, 37, 4]])
+        mock_embed_matrix.side_effect = lambda texts: np.eye(len(texts), 4, dtype=np.float32)
+        await ingest_document(b"Refunds take days. Error X-77 fixed.", "faq.txt", "a1", "text/plain")
+
+        with patch('services.lexical.LEXICAL_SEARCH_ENABLED', True):
+            get_lexical_index().add("a1", [("gone#0", "deleted chunk", {"text": "deleted chunk"})])
+
+            assert await rebuild_lexical_index("a1") == 2
+
+            hits = get_lexical_index().search("a1", "x-77", top_k=5)
+            assert hits[0][0]["metadata"]["text"] == "Error X-77 fixed."
+            assert hits[0][0]["metadata"]["filename"] == "faq.txt"
+            assert get_lexical_index().search("a1", "deleted", top_k=5) == []
+
+    @pytest.mark.asyncio
+    @patch('services.lexical.LEXICAL_SEARCH_ENABLED', True)
+    @patch('services.lexical.LEXICAL_INDEX_DIR', '')
+    @patch('services.ingestion.get_vector_store')
+    @patch('services.embeddings.EMBEDDING_PROVIDER', 'openai')
+    async def test_shared_namespace_is_filtered_by_assistant(self, mock_store):
+        """Pinecone keeps pre-computed vectors of all assistants in one namespace."""
+        from services.ingestion import rebuild_lexical_index
+        from services.lexical import get_lexical_index
+
+        store = mock_store.return_value
+        store.namespace_for.return_value = None
+        store.list_ids.return_value = {"d#0", "e#0"}
+        store.fetch.return_value = {
+            "d#0": {"assistant_id": "a1", "text": "Starter costs $299"},
+            "e#0": {"assistant_id": "a2", "text": "Pro costs $499"},
+        }
+
+        assert await rebuild_lexical_index("a1") == 1
+        assert ids(get_lexical_index().search("a1", "costs", top_k=5)) == ["d#0"]
+
+    @pytest.mark.asyncio
+    @patch('services.lexical.LEXICAL_SEARCH_ENABLED', False)
+    async def test_disabled_index_is_an_error(self):
+        from services.ingestion import rebuild_lexical_index
+
+        with pytest.raises(ValueError):
+            await rebuild_lexical_index("a1")
@@ -35,6 +35,46 @@ class TestLLMConfiguration:
             assert len(api_key) > 0
 
 
+class TestClientPool:
+    """Test the long-lived pooled client"""
+
+    @patch('services.llm.LLM_PROVIDER', 'local')
+    @patch('services.llm.LLM_MAX_CONNECTIONS', 7)
+    @patch('services.llm.LLM_CONNECT_TIMEOUT_SECONDS', 2.0)
+    def test_client_is_created_once_with_pool_settings(self):
+        """Every call should reuse one async client whose pool honours the settings"""
+        from openai import AsyncOpenAI
+        from services.llm import get_llm_client
+
+        client = get_llm_client()
+
+        assert isinstance(client, AsyncOpenAI)
+        assert get_llm_client() is client
+        assert client._client._transport._pool._max_connections == 7
+        assert client._client.timeout.connect == 2.0
+
+    @patch('services.llm.LLM_PROVIDER', 'openai')
+    @patch('services.llm.OPENAI_API_KEY', '')
+    def test_openai_provider_requires_api_key_on_use(self):
+        from services.llm import get_llm_client, start_llm_client
+
+        start_llm_client()  # Logged, not raised, so the service still starts
+
+        with pytest.raises(ValueError):
+            get_llm_client()
+
+    @pytest.mark.asyncio
+    @patch('services.llm.LLM_PROVIDER', 'local')
+    async def test_close_releases_clients(self):
+        from services.llm import close_llm_clients, get_llm_client
+
+        client = get_llm_client()
+        await close_llm_clients()
+
+        assert client.is_closed()
+        assert get_llm_client() is not client
+
+
 class TestModelSelection:
     """Test model name selection based on provider"""
 
@@ -64,7 +104,7 @@ class TestChatGeneration:
         mock_client = MagicMock()
         mock_response = MagicMock()
         mock_response.choices = [MagicMock(message=MagicMock(content="Test response"))]
-        mock_client.chat.completions.create.return_value = mock_response
+        mock_client.chat.completions.create = AsyncMock(return_value=mock_response)
         mock_get_client.return_value = mock_client
 
         from services.llm import generate_chat_response
@@ -82,7 +122,7 @@ class TestChatGeneration:
         mock_client = MagicMock()
         mock_response = MagicMock()
         mock_response.choices = [MagicMock(message=MagicMock(content="Response"))]
-        mock_client.chat.completions.create.return_value = mock_response
+        mock_client.chat.completions.create = AsyncMock(return_value=mock_response)
         mock_get_client.return_value = mock_client
 
         from services.llm import generate_chat_response
@@ -187,7 +227,7 @@ class TestTemperature:
         mock_client = MagicMock()
         mock_response = MagicMock()
         mock_response.choices = [MagicMock(message=MagicMock(content="Response"))]
-        mock_client.chat.completions.create.return_value = mock_response
+        mock_client.chat.completions.create = AsyncMock(return_value=mock_response)
         mock_get_client.return_value = mock_client
 
         from services.llm import generate_chat_response
@@ -206,7 +246,7 @@ class TestTemperature:
         mock_client = MagicMock()
         mock_response = MagicMock()
         mock_response.choices = [MagicMock(message=MagicMock(content="Response"))]
-        mock_client.chat.completions.create.return_value = mock_response
+        mock_client.chat.completions.create = AsyncMock(return_value=mock_response)
         mock_get_client.return_value = mock_client
 
         from services.llm import generate_chat_response
@@ -220,3 +260,129 @@ class TestTemperature:
         temperature = call_args.kwargs.get('temperature', 0.7)
         
         assert temperature == 0.2
+
+
+def stream_chunk(content=None, finish_reason=None, usage=None):
+    """One chunk of a streamed chat completion (usage-only chunks have no choices)"""
+    if usage is not None:
+        return MagicMock(choices=[], usage=MagicMock(**usage))
+    return MagicMock(choices=[MagicMock(delta=MagicMock(content=content), finish_reason=finish_reason)], usage=None)
+
+
+class FakeStream:
+    """Async completion stream, like the one AsyncOpenAI returns for stream=True"""
+
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.close = AsyncMock()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self.chunks)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+def streamed_completion():
+    return FakeStream([
+        stream_chunk("Pricing "),
+        stream_chunk("starts at $299."),
+        stream_chunk(None, finish_reason="stop"),
+        stream_chunk(usage={"prompt_tokens": 40, "completion_tokens": 6, "total_tokens": 46}),
+    ])
+
+
+class TestStreaming:
+    """Test token streaming from the LLM and over SSE"""
+
+    @pytest.mark.asyncio
+    @patch('services.llm.get_llm_client')
+    async def test_stream_yields_deltas_then_usage(self, mock_get_client):
+        """Deltas should arrive one by one, followed by a done event with usage"""
+        mock_get_client.return_value.chat.completions.create = AsyncMock(return_value=streamed_completion())
+
+        from services.llm import stream_chat_response
+
+        events = [event async for event in stream_chat_response([{"role": "user", "content": "Price?"}])]
+
+        assert [e["content"] for e in events if e["type"] == "delta"] == ["Pricing ", "starts at $299."]
+        assert events[-1]["type"] == "done"
+        assert events[-1]["finish_reason"] == "stop"
+        assert events[-1]["usage"] == {"prompt_tokens": 40, "completion_tokens": 6, "total_tokens": 46}
+        call_args = mock_get_client.return_value.chat.completions.create.call_args
+        assert call_args.kwargs["stream"] is True
+        assert call_args.kwargs["stream_options"] == {"include_usage": True}
+
+    @pytest.mark.asyncio
+    @patch('services.llm.get_llm_client')
+    async def test_stream_flag_joins_deltas(self, mock_get_client):
+        mock_get_client.return_value.chat.completions.create = AsyncMock(return_value=streamed_completion())
+
+        from services.llm import generate_chat_response
+
+        assert await generate_chat_response([{"role": "user", "content": "Price?"}], stream=True) == "Pricing starts at $299."
+
+    @pytest.mark.asyncio
+    @patch('services.llm.get_llm_client')
+    async def test_early_stop_closes_upstream(self, mock_get_client):
+        """A consumer that stops early (client disconnect) should close the completion stream"""
+        response = streamed_completion()
+        mock_get_client.return_value.chat.completions.create = AsyncMock(return_value=response)
+
+        from services.llm import stream_chat_response
+
+        stream = stream_chat_response([{"role": "user", "content": "Price?"}])
+        assert (await stream.__anext__())["content"] == "Pricing "
+        await stream.aclose()
+
+        response.close.assert_awaited_once()
+
+    @pytest.mark.asyncio
+    @patch('main.KB_SERVICE_API_KEY', 'test-kb-key')
+    @patch('services.llm.get_llm_client')
+    @patch('main.search_knowledge_base', new_callable=AsyncMock)
+    async def test_chat_stream_endpoint_sends_sse_events(self, mock_search, mock_get_client, client):
+        """Sources first, then tokens, then done with usage and timings"""
+        import json
+
+        mock_search.return_value = [{"content": "Starter is $299", "source": "pricing.pdf", "score": 0.9}]
+        mock_get_client.return_value.chat.completions.create = AsyncMock(return_value=streamed_completion())
+
+        response = await client.post(
+            "/api/knowledge-base/chat/stream",
+            headers={"Authorization": "Bearer test-kb-key"},
+            json={"query": "Price?", "assistant_id": "a1"},
+        )
+
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/event-stream")
+        events = [
+            (block.split("\n")[0].removeprefix("event: "), json.loads(block.split("\n")[1].removeprefix("data: ")))
+            for block in response.text.strip().split("\n\n")
+        ]
+        assert [name for name, _ in events] == ["sources", "token", "token", "done"]
+        assert events[0][1] == {"sources": [{"source": "pricing.pdf", "score": 0.9}]}
+        assert "".join(data["content"] for name, data in events if name == "token") == "Pricing starts at $299."
+        assert events[-1][1]["usage"]["total_tokens"] == 46
+        assert set(events[-1][1]["timing"]) == {"retrieval_ms", "first_token_ms", "total_ms"}
+
+    @pytest.mark.asyncio
+    @patch('main.KB_SERVICE_API_KEY', 'test-kb-key')
+    @patch('services.llm.get_llm_client')
+    @patch('main.search_knowledge_base', new_callable=AsyncMock)
+    async def test_chat_stream_reports_generation_errors(self, mock_search, mock_get_client, client):
+        mock_search.return_value = []
+        mock_get_client.return_value.chat.completions.create = AsyncMock(side_effect=RuntimeError("LLM down"))
+
+        response = await client.post(
+            "/api/knowledge-base/chat/stream",
+            headers={"Authorization": "Bearer test-kb-key"},
+            json={"query": "Price?", "assistant_id": "a1"},
+        )
+
+        assert response.status_code == 200
+        assert response.text.startswith("event: sources")
+        assert "event: error" in response.text
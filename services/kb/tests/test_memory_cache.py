@@ -0,0 +1,153 @@
+"""Tests for the in-process LRU cache and the query-embedding cache."""
+import pytest
+from unittest.mock import patch, MagicMock, AsyncMock
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.memory_cache import LRUCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestLRUCache:
+    """Test byte-bounded LRU eviction, TTL and counters."""
+
+    def test_hits_and_misses_are_counted(self):
+        """Lookups should update the hit and miss counters."""
+        cache = LRUCache(max_bytes=100)
+        cache.put("a", 1, size=10)
+
+        assert cache.get("a") == 1
+        assert cache.get("b") is None
+        assert cache.stats()["hits"] == 1
+        assert cache.stats()["misses"] == 1
+
+    def test_peek_leaves_counters_and_order(self):
+        """Peeking should neither count a hit nor protect the entry from eviction."""
+        cache = LRUCache(max_bytes=20)
+        cache.put("a", 1, size=10)
+        cache.put("b", 2, size=10)
+
+        assert cache.peek("a") == 1
+        cache.put("c", 3, size=10)
+
+        assert cache.peek("a") is None
+        assert cache.stats()["hits"] == 0
+
+    def test_evicts_least_recently_used_by_bytes(self):
+        """Once over budget, the least recently used entries are evicted."""
+        cache = LRUCache(max_bytes=30)
+        cache.put("a", 1, size=10)
+        cache.put("b", 2, size=10)
+        cache.put("c", 3, size=10)
+        cache.get("a")  # "b" is now least recently used
+        cache.put("d", 4, size=10)
+
+        assert cache.get("b") is None
+        assert cache.get("a") == 1
+        assert cache.stats()["bytes"] == 30
+        assert cache.stats()["evictions"] == 1
+
+    def test_oversized_values_are_not_cached(self):
+        """A value larger than the whole budget should not flush the cache."""
+        cache = LRUCache(max_bytes=30)
+        cache.put("a", 1, size=10)
+        cache.put("huge", 2, size=31)
+
+        assert cache.get("a") == 1
+        assert cache.get("huge") is None
+
+    def test_entries_expire(self):
+        """Entries older than the TTL should read as misses."""
+        clock = FakeClock()
+        cache = LRUCache(max_bytes=100, ttl_seconds=60, clock=clock)
+        cache.put("a", 1, size=10)
+
+        clock.now = 59
+        assert cache.get("a") == 1
+        clock.now = 61
+        assert cache.get("a") is None
+        assert cache.stats()["expirations"] == 1
+        assert len(cache) == 0
+
+
+class TestQueryEmbeddingCache:
+    """Test query-embedding caching in the retrieval path."""
+
+    @pytest.mark.asyncio
+    @patch('services.retrieval._query_embedding_cache', None)
+    @patch('services.retrieval.QUERY_EMBEDDING_CACHE_MAX_BYTES', 1024 * 1024)
+    @patch('services.vector_store.get_pinecone_client')
+    @patch('services.embeddings.get_openai_client')
+    @patch('services.embeddings.EMBEDDING_PROVIDER', 'openai')
+    async def test_repeated_query_skips_embedding(self, mock_openai, mock_pinecone):
+        """The same (normalized) query should be embedded once across searches."""
+        from services.retrieval import search_knowledge_base, get_query_embedding_cache
+
+        mock_index = MagicMock()
+        mock_index.query.return_value = MagicMock(matches=[])
+        mock_pinecone.return_value.Index.return_value = mock_index
+        mock_openai.return_value.embeddings.create = AsyncMock(
+            return_value=MagicMock(data=[MagicMock(embedding=[0.5] * 8)])
+        )
+
+        await search_knowledge_base(query="reset password", assistant_id="a1")
+        await search_knowledge_base(query="  reset   password ", assistant_id="a2")
+
+        assert mock_openai.return_value.embeddings.create.await_count == 1
+        assert mock_index.query.call_args.kwargs["vector"] == [0.5] * 8
+        stats = get_query_embedding_cache().stats()
+        assert stats["hits"] == 1
+        assert stats["misses"] == 1
+
+    @pytest.mark.asyncio
+    @patch('services.retrieval._query_embedding_cache', None)
+    @patch('services.retrieval.QUERY_EMBEDDING_CACHE_MAX_BYTES', 1024 * 1024)
+    @patch('services.embeddings.EMBEDDING_PROVIDER', 'openai')
+    @patch('services.embeddings.get_openai_client')
+    async def test_persistent_cache_hit_fills_the_lru(self, mock_openai, tmp_path):
+        """A vector read from SQLite is served from memory on the next call."""
+        import numpy as np
+        from services.embedding_cache import EmbeddingCache
+        from services.retrieval import embed_query, get_query_embedding_cache
+
+        cache = EmbeddingCache(str(tmp_path / "embeddings.db"))
+        cache.put_many("openai", "text-embedding-3-small", ["pricing"], [np.full(8, 0.5, dtype=np.float32)])
+        cache.get_many = MagicMock(wraps=cache.get_many)
+
+        with patch('services.retrieval.get_embedding_cache', return_value=cache):
+            for _ in range(3):
+                assert await embed_query("pricing") == [0.5] * 8
+
+        assert cache.get_many.call_count == 1
+        assert get_query_embedding_cache().stats()["hits"] == 2
+        mock_openai.return_value.embeddings.create.assert_not_called()
+
+    @pytest.mark.asyncio
+    @patch('services.retrieval._query_embedding_cache', None)
+    @patch('services.retrieval.QUERY_EMBEDDING_CACHE_MAX_BYTES', 1024 * 1024)
+    @patch('services.embeddings.get_openai_client')
+    async def test_cache_is_keyed_by_provider(self, mock_openai):
+        """A vector cached for one provider should not be served for another."""
+        import numpy as np
+        from services.retrieval import embed_query
+
+        mock_openai.return_value.embeddings.create = AsyncMock(
+            return_value=MagicMock(data=[MagicMock(embedding=[0.5] * 8)])
+        )
+        with patch('services.embeddings.EMBEDDING_PROVIDER', 'openai'):
+            await embed_query("pricing")
+
+        batcher = MagicMock()
+        batcher.embed_one = AsyncMock(return_value=np.ones(4, dtype=np.float32))
+        with patch('services.embeddings.EMBEDDING_PROVIDER', 'local'), \
+                patch('services.embeddings.get_local_embedding_batcher', return_value=batcher):
+            assert await embed_query("pricing") == [1.0] * 4
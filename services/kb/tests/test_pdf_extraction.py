@@ -0,0 +1,132 @@
+"""Tests for parallel PDF extraction."""
+import pytest
+from unittest.mock import patch, MagicMock, AsyncMock
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.pdf_extraction import (
+    extract_page_range,
+    extract_pdf_pages,
+    join_pages,
+    split_page_ranges,
+)
+
+
+def make_pdf(page_texts):
+    """Build a minimal multi-page PDF with one line of Helvetica text per page."""
+    objects = []
+    font_id = 3
+    page_ids = [4 + 2 * i for i in range(len(page_texts))]
+
+    objects.append(b"<< /Type /Catalog /Pages 2 0 R >>")
+    kids = " ".join(f"{pid} 0 R" for pid in page_ids)
+    objects.append(f"<< /Type /Pages /Kids [{kids}] /Count {len(page_texts)} >>".encode())
+    objects.append(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    for page_id, text in zip(page_ids, page_texts):
+        stream = f"BT /F1 12 Tf 72 720 Td ({text}) Tj ET".encode()
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents {page_id + 1} 0 R "
+            f"/Resources << /Font << /F1 {font_id} 0 R >> >> >>".encode()
+        )
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+
+    pdf = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(pdf))
+        pdf += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref_at = len(pdf)
+    pdf += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        pdf += b"%010d 00000 n \n" % offset
+    pdf += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref_at)
+    return bytes(pdf)
+
+
+class TestPageRanges:
+    """Test work splitting and page joining."""
+
+    def test_split_page_ranges(self):
+        """Pages should be split into contiguous ranges, one per worker at most."""
+        assert split_page_ranges(100, workers=4, min_pages=8) == [(0, 25), (25, 50), (50, 75), (75, 100)]
+        assert split_page_ranges(5, workers=4, min_pages=8) == [(0, 5)]
+        assert split_page_ranges(0, workers=4) == []
+
+    def test_join_pages_tracks_offsets(self):
+        """Joined text should record where each page starts."""
+        from services.ingestion import page_for_offset
+
+        text, offsets = join_pages([(1, "first"), (2, "second"), (3, "")])
+
+        assert text == "first\nsecond\n\n"
+        assert offsets == [(0, 1), (6, 2), (13, 3)]
+        assert page_for_offset(offsets, 0) == 1
+        assert page_for_offset(offsets, 8) == 2
+
+
+class TestExtraction:
+    """Test extraction, ordering and timeouts."""
+
+    def test_extract_page_range(self):
+        """Pages should come back numbered from 1 with their text."""
+        pdf = make_pdf(["Alpha page", "Beta page", "Gamma page"])
+        pages = extract_page_range(pdf, 1, 3)
+
+        assert [number for number, _ in pages] == [2, 3]
+        assert "Beta page" in pages[0][1]
+
+    def test_slow_page_times_out(self):
+        """A page exceeding the timeout should be skipped, not stall extraction."""
+        import time
+
+        pdf = make_pdf(["Fast page", "Slow page"])
+        original = __import__("PyPDF2").PageObject.extract_text
+
+        def maybe_slow(page, *args, **kwargs):
+            text = original(page, *args, **kwargs)
+            if "Slow" in text:
+                time.sleep(2)
+            return text
+
+        with patch("PyPDF2.PageObject.extract_text", maybe_slow):
+            pages = extract_page_range(pdf, page_timeout=0.1)
+
+        assert "Fast page" in pages[0][1]
+        assert pages[1] == (2, "")
+
+    @pytest.mark.asyncio
+    @patch('services.pdf_extraction.PROCESS_EXECUTOR_WORKERS', 2)
+    async def test_parallel_extraction_preserves_order(self):
+        """Pages extracted across processes should be joined in order."""
+        pdf = make_pdf([f"Page number {i}" for i in range(1, 21)])
+        pages = await extract_pdf_pages(pdf)
+
+        assert [number for number, _ in pages] == list(range(1, 21))
+        assert all(f"Page number {number}" in text for number, text in pages)
+
+    @pytest.mark.asyncio
+    @patch('services.vector_store.get_pinecone_client')
+    @patch('services.embeddings.get_openai_client')
+    @patch('services.embeddings.EMBEDDING_PROVIDER', 'openai')
+    async def test_chunks_carry_page_metadata(self, mock_openai, mock_pinecone):
+        """Ingested PDF chunks should store the page they start on."""
+        from services.ingestion import ingest_document
+
+        mock_index = MagicMock()
+        mock_pinecone.return_value.Index.return_value = mock_index
+
+        async def fake_create(model, input):
+            return MagicMock(data=[MagicMock(embedding=[0.1] * 8) for _ in input])
+        mock_openai.return_value.embeddings.create = AsyncMock(side_effect=fake_create)
+
+        await ingest_document(
+            content=make_pdf(["Refunds are issued within 30 days."]),
+            filename="policy.pdf",
+            assistant_id="test-assistant",
+            content_type="application/pdf",
+        )
+
+        vectors = mock_index.upsert.call_args.kwargs["vectors"]
+        assert vectors[0][2]["page"] == 1
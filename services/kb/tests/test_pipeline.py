@@ -0,0 +1,139 @@
+"""Tests for the streaming ingestion pipeline."""
+import pytest
+from unittest.mock import patch, MagicMock
+import asyncio
+import sys
+import os
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.pipeline import iterate_blocking, run_pipeline
+
+DIMENSION = 1024
+
+
+async def numbers(count, produced=None):
+    for i in range(count):
+        if produced is not None:
+            produced.append(i)
+        yield i
+
+
+class TestRunPipeline:
+    """Test stage overlap, backpressure and error handling."""
+
+    @pytest.mark.asyncio
+    async def test_producer_overlaps_consumer(self):
+        """The next item should be produced while the previous one is being consumed."""
+        produced = []
+        consumed = []
+
+        async def sink(item):
+            if item == 0:
+                # Item 1 is produced while item 0 is still in the sink
+                for _ in range(100):
+                    if 1 in produced:
+                        break
+                    await asyncio.sleep(0.001)
+                assert 1 in produced
+            consumed.append(item)
+
+        await run_pipeline(numbers(5, produced), sink, depth=1)
+        assert consumed == [0, 1, 2, 3, 4]
+
+    @pytest.mark.asyncio
+    async def test_queue_is_bounded(self):
+        """A slow consumer should pause the producer instead of buffering everything."""
+        produced = []
+        max_ahead = 0
+
+        async def slow_sink(item):
+            nonlocal max_ahead
+            await asyncio.sleep(0.002)
+            max_ahead = max(max_ahead, len(produced) - item)
+
+        await run_pipeline(numbers(30, produced), slow_sink, depth=2)
+        # Queued items, plus the one in the sink, plus the one waiting to be queued
+        assert max_ahead <= 2 + 2
+
+    @pytest.mark.asyncio
+    async def test_producer_error_is_raised(self):
+        """An error while producing should surface after earlier items are consumed."""
+        consumed = []
+
+        async def failing():
+            yield 1
+            raise RuntimeError("embedding failed")
+
+        async def sink(item):
+            consumed.append(item)
+
+        with pytest.raises(RuntimeError, match="embedding failed"):
+            await run_pipeline(failing(), sink)
+        assert consumed == [1]
+
+    @pytest.mark.asyncio
+    async def test_consumer_error_stops_producer(self):
+        """An error while consuming should cancel the producer."""
+        produced = []
+
+        async def sink(item):
+            raise RuntimeError("upsert failed")
+
+        with pytest.raises(RuntimeError, match="upsert failed"):
+            await run_pipeline(numbers(1000, produced), sink, depth=2)
+        assert len(produced) < 10
+
+    @pytest.mark.asyncio
+    async def test_iterate_blocking(self):
+        """Blocking iterators should be advanced off the event loop."""
+        items = [item async for item in iterate_blocking(iter([1, 2, 3]))]
+        assert items == [1, 2, 3]
+
+
+class TestIngestionMemory:
+    """Peak memory should depend on the batch size, not the document size."""
+
+    async def ingest_peak(self, paragraphs, mock_openai, mock_pinecone):
+        import tracemalloc
+        from services.ingestion import ingest_document
+
+        async def fake_create(model, input):
+            return SimpleNamespace(data=[SimpleNamespace(embedding=[0.1] * DIMENSION) for _ in input])
+
+        mock_openai.return_value.embeddings.create = fake_create
+        mock_index = MagicMock()
+        mock_index.upsert = lambda vectors: None  # MagicMock would keep every payload alive
+        mock_pinecone.return_value.Index.return_value = mock_index
+
+        content = ("Refunds are issued within thirty days of purchase. " * 8 + "\n\n").encode() * paragraphs
+        tracemalloc.start()
+        try:
+            result = await ingest_document(content, "policy.txt", "test-assistant", "text/plain")
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        return result["chunks"], peak
+
+    @pytest.mark.asyncio
+    @patch('services.ingestion.INGEST_PIPELINE_BATCH_SIZE', 32)
+    @patch('services.ingestion.get_chunk_tokenizer')
+    @patch('services.vector_store.get_pinecone_client')
+    @patch('services.embeddings.get_openai_client')
+    @patch('services.embeddings.EMBEDDING_PROVIDER', 'openai')
+    async def test_memory_high_water_is_flat(self, mock_openai, mock_pinecone, mock_tokenizer):
+        """A 4x larger document should not raise the peak by anything like 4x."""
+        from services.chunking import ApproximateTokenizer
+
+        mock_tokenizer.return_value = ApproximateTokenizer("approximate", 64)
+
+        small_chunks, small_peak = await self.ingest_peak(100, mock_openai, mock_pinecone)
+        large_chunks, large_peak = await self.ingest_peak(400, mock_openai, mock_pinecone)
+
+        # Holding every vector as Python floats at once would need ~32 bytes per value
+        vector_bytes = DIMENSION * 32
+        assert large_chunks >= 4 * small_chunks - 4
+        assert large_peak < large_chunks * vector_bytes / 4
+        # Extra chunks may only cost their text offsets and token spans, never their vectors
+        assert large_peak - small_peak < (large_chunks - small_chunks) * vector_bytes / 10
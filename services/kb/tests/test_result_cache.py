@@ -0,0 +1,104 @@
+"""Tests for the search result cache."""
+import pytest
+from unittest.mock import patch, MagicMock, AsyncMock
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.result_cache import InMemoryResultCacheBackend, SearchResultCache
+
+
+def make_index(text="Refunds within 30 days"):
+    match = MagicMock()
+    match.metadata = {"text": text, "filename": "policy.txt", "document_id": "doc-1", "chunk_index": 0}
+    match.score = 0.9
+    index = MagicMock()
+    index.query.return_value = MagicMock(matches=[match])
+    return index
+
+
+class TestSearchResultCache:
+    """Test keys, copies and generation-based invalidation."""
+
+    @pytest.mark.asyncio
+    async def test_lookup_normalizes_query(self):
+        """Whitespace and case differences should share an entry; top_k should not."""
+        cache = SearchResultCache(InMemoryResultCacheBackend(max_bytes=1024 * 1024))
+        _, key = await cache.lookup("a1", "Reset Password", 5)
+        await cache.store(key, [{"content": "Use the reset link"}])
+
+        assert (await cache.lookup("a1", "  reset   password", 5))[0] == [{"content": "Use the reset link"}]
+        assert (await cache.lookup("a1", "reset password", 3))[0] is None
+        assert (await cache.lookup("a2", "reset password", 5))[0] is None
+
+    @pytest.mark.asyncio
+    async def test_hits_are_copies(self):
+        """Mutating a returned result should not change the cached entry."""
+        cache = SearchResultCache(InMemoryResultCacheBackend(max_bytes=1024 * 1024))
+        _, key = await cache.lookup("a1", "pricing", 5)
+        await cache.store(key, [{"content": "Plans start at $49"}])
+
+        (await cache.lookup("a1", "pricing", 5))[0][0]["content"] = "changed"
+        assert (await cache.lookup("a1", "pricing", 5))[0][0]["content"] == "Plans start at $49"
+
+    @pytest.mark.asyncio
+    async def test_result_computed_before_invalidation_is_not_served(self):
+        """A search racing with an ingest stores under its old generation, which is never read again."""
+        cache = SearchResultCache(InMemoryResultCacheBackend(max_bytes=1024 * 1024))
+        _, key = await cache.lookup("a1", "pricing", 5)
+        await cache.invalidate("a1")  # Ingest finishes while the search is in flight
+        await cache.store(key, [{"content": "stale"}])
+
+        assert (await cache.lookup("a1", "pricing", 5))[0] is None
+
+
+class TestRetrievalCaching:
+    """Test the result cache in the search path."""
+
+    @pytest.mark.asyncio
+    @patch('services.result_cache._search_result_cache', None)
+    @patch('services.result_cache.SEARCH_RESULT_CACHE_MAX_BYTES', 1024 * 1024)
+    @patch('services.vector_store.get_pinecone_client')
+    @patch('services.retrieval.embed_query', new_callable=AsyncMock)
+    @patch('services.embeddings.EMBEDDING_PROVIDER', 'openai')
+    async def test_repeated_search_skips_vector_db(self, mock_embed, mock_pinecone):
+        """The second identical search should not query Pinecone."""
+        from services.retrieval import search_knowledge_base
+
+        mock_embed.return_value = [0.1] * 8
+        mock_index = make_index()
+        mock_pinecone.return_value.Index.return_value = mock_index
+
+        first = await search_knowledge_base(query="refund policy", assistant_id="a1", top_k=5)
+        second = await search_knowledge_base(query="Refund policy", assistant_id="a1", top_k=5)
+
+        assert first == second
+        assert mock_index.query.call_count == 1
+
+    @pytest.mark.asyncio
+    @patch('services.result_cache._search_result_cache', None)
+    @patch('services.result_cache.SEARCH_RESULT_CACHE_MAX_BYTES', 1024 * 1024)
+    @patch('services.vector_store.get_pinecone_client')
+    @patch('services.retrieval.embed_query', new_callable=AsyncMock)
+    @patch('services.embeddings.EMBEDDING_PROVIDER', 'openai')
+    @patch('services.embeddings.get_openai_client')
+    async def test_ingest_invalidates_assistant(self, mock_ingest_openai, mock_embed, mock_pinecone):
+        """Ingesting into an assistant should drop its cached results only."""
+        from services.ingestion import ingest_document
+        from services.retrieval import search_knowledge_base
+
+        mock_embed.return_value = [0.1] * 8
+        mock_index = make_index()
+        mock_pinecone.return_value.Index.return_value = mock_index
+        mock_ingest_openai.return_value.embeddings.create = AsyncMock(
+            return_value=MagicMock(data=[MagicMock(embedding=[0.1] * 8)])
+        )
+
+        await search_knowledge_base(query="refund policy", assistant_id="a1")
+        await search_knowledge_base(query="refund policy", assistant_id="a2")
+        await ingest_document(b"Refunds are now issued within 60 days.", "policy.txt", "a1", "text/plain")
+        await search_knowledge_base(query="refund policy", assistant_id="a1")
+        await search_knowledge_base(query="refund policy", assistant_id="a2")
+
+        assert [c.kwargs["filter"]["assistant_id"] for c in mock_index.query.call_args_list] == ["a1", "a2", "a1"]
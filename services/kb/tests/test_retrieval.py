@@ -1,6 +1,6 @@
 """Tests for knowledge base retrieval."""
 import pytest
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch, MagicMock, AsyncMock
 import sys
 import os
 
@@ -11,9 +11,9 @@ class TestSearchKnowledgeBase:
     """Test knowledge base search functionality."""
 
     @pytest.mark.asyncio
-    @patch('services.retrieval.get_pinecone_client')
-    @patch('services.retrieval.get_openai_client')
-    @patch('services.retrieval.EMBEDDING_PROVIDER', 'openai')
+    @patch('services.vector_store.get_pinecone_client')
+    @patch('services.embeddings.get_openai_client')
+    @patch('services.embeddings.EMBEDDING_PROVIDER', 'openai')
     async def test_search_returns_results(self, mock_openai, mock_pinecone):
         """Search should return formatted results."""
         from services.retrieval import search_knowledge_base
@@ -40,7 +40,7 @@ class TestSearchKnowledgeBase:
         mock_embedding_data.embedding = [0.1] * 1536
         mock_embedding_response = MagicMock()
         mock_embedding_response.data = [mock_embedding_data]
-        mock_openai.return_value.embeddings.create.return_value = mock_embedding_response
+        mock_openai.return_value.embeddings.create = AsyncMock(return_value=mock_embedding_response)
         
         results = await search_knowledge_base(
             query="test query",
@@ -54,9 +54,9 @@ class TestSearchKnowledgeBase:
         assert results[0]["source"] == "test.txt"
 
     @pytest.mark.asyncio
-    @patch('services.retrieval.get_pinecone_client')
-    @patch('services.retrieval.get_openai_client')
-    @patch('services.retrieval.EMBEDDING_PROVIDER', 'openai')
+    @patch('services.vector_store.get_pinecone_client')
+    @patch('services.embeddings.get_openai_client')
+    @patch('services.embeddings.EMBEDDING_PROVIDER', 'openai')
     async def test_search_empty_results(self, mock_openai, mock_pinecone):
         """Search should handle empty results gracefully."""
         from services.retrieval import search_knowledge_base
@@ -74,7 +74,7 @@ class TestSearchKnowledgeBase:
         mock_embedding_data.embedding = [0.1] * 1536
         mock_embedding_response = MagicMock()
         mock_embedding_response.data = [mock_embedding_data]
-        mock_openai.return_value.embeddings.create.return_value = mock_embedding_response
+        mock_openai.return_value.embeddings.create = AsyncMock(return_value=mock_embedding_response)
         
         results = await search_knowledge_base(
             query="nonexistent query",
@@ -109,3 +109,57 @@ class TestRAGChat:
         # This tests that the function signature is correct
         # The actual response depends on the LLM provider
         assert generate_rag_response is not None
+
+
+class TestBatchSearch:
+    """Test batched search: one embedding call, concurrent queries, input order."""
+
+    @pytest.mark.asyncio
+    @patch('services.vector_store.VECTOR_STORE', 'local')
+    @patch('services.embeddings.EMBEDDING_PROVIDER', 'openai')
+    @patch('services.vector_store.LOCAL_VECTOR_STORE_DIR', '')
+    @patch('services.embeddings.get_openai_client')
+    async def test_batch_embeds_once_and_keeps_order(self, mock_openai):
+        """Queries across assistants share one embedding request; duplicates are embedded once."""
+        from services.retrieval import search_knowledge_base_batch
+        from services.vector_store import get_vector_store
+
+        store = get_vector_store()
+        store.upsert("a1", [("x", [1.0, 0.0], {"text": "X", "assistant_id": "a1"})])
+        store.upsert("a2", [("y", [0.0, 1.0], {"text": "Y", "assistant_id": "a2"})])
+        vectors = {"first": [1.0, 0.0], "second": [0.0, 1.0]}
+        mock_openai.return_value.embeddings.create = AsyncMock(
+            side_effect=lambda model, input: MagicMock(data=[MagicMock(embedding=vectors[q]) for q in input])
+        )
+
+        results = await search_knowledge_base_batch([
+            ("second", "a2", 1),
+            ("first", "a1", 1),
+            ("second", "a1", 1),
+        ])
+
+        assert [[r["content"] for r in found] for found in results] == [["Y"], ["X"], ["X"]]
+        mock_openai.return_value.embeddings.create.assert_awaited_once()
+        assert mock_openai.return_value.embeddings.create.call_args.kwargs["input"] == ["second", "first"]
+
+    @pytest.mark.asyncio
+    @patch('services.retrieval.run_search', new_callable=AsyncMock)
+    @patch('services.retrieval.embed_queries', new_callable=AsyncMock)
+    @patch('services.embeddings.EMBEDDING_PROVIDER', 'openai')
+    async def test_cached_results_skip_embedding(self, mock_embed, mock_search):
+        """Only queries missing from the result cache are embedded and searched."""
+        from services.result_cache import InMemoryResultCacheBackend, SearchResultCache
+        from services.retrieval import search_knowledge_base_batch
+
+        cache = SearchResultCache(InMemoryResultCacheBackend(max_bytes=1024 * 1024))
+        _, key = await cache.lookup("a1", "cached", 5)
+        await cache.store(key, [{"content": "from cache"}])
+        mock_embed.return_value = [[0.5, 0.5]]
+        mock_search.return_value = [{"content": "fresh"}]
+
+        with patch('services.retrieval.get_search_result_cache', return_value=cache):
+            results = await search_knowledge_base_batch([("cached", "a1", 5), ("new", "a1", 5)])
+
+        assert results == [[{"content": "from cache"}], [{"content": "fresh"}]]
+        mock_embed.assert_awaited_once_with(["new"])
+        mock_search.assert_awaited_once_with("new", "a1", 5, query_vector=[0.5, 0.5])
@@ -0,0 +1,113 @@
+"""Tests for upload spooling."""
+import pytest
+from unittest.mock import patch, AsyncMock
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.spool import (
+    SpooledUpload,
+    UploadTooLargeError,
+    open_source,
+    read_text,
+    spool_upload,
+)
+
+
+class FakeUpload:
+    """Async file object that records how much was read."""
+
+    def __init__(self, data: bytes):
+        self.data = data
+        self.offset = 0
+
+    async def read(self, size: int) -> bytes:
+        piece = self.data[self.offset:self.offset + size]
+        self.offset += len(piece)
+        return piece
+
+
+class TestSpoolUpload:
+    """Test streaming uploads to disk."""
+
+    @pytest.mark.asyncio
+    async def test_upload_is_written_to_disk(self, tmp_path):
+        """The spool file should hold the upload and report its size."""
+        spooled = await spool_upload(FakeUpload(b"hello world"), max_bytes=100, chunk_bytes=4, spool_dir=str(tmp_path))
+
+        assert spooled.size == 11
+        with open(spooled.path, "rb") as f:
+            assert f.read() == b"hello world"
+        spooled.cleanup()
+        assert not os.path.exists(spooled.path)
+
+    @pytest.mark.asyncio
+    async def test_size_limit_enforced_mid_stream(self, tmp_path):
+        """Reading should stop at the first piece over the limit and remove the file."""
+        upload = FakeUpload(b"x" * 1000)
+
+        with pytest.raises(UploadTooLargeError):
+            await spool_upload(upload, max_bytes=10, chunk_bytes=8, spool_dir=str(tmp_path))
+
+        assert upload.offset == 16
+        assert list(tmp_path.iterdir()) == []
+
+
+class TestReadingSources:
+    """Test zero-copy reads from spooled uploads."""
+
+    def make_spool(self, tmp_path, data: bytes) -> SpooledUpload:
+        path = tmp_path / "upload"
+        path.write_bytes(data)
+        return SpooledUpload(path=str(path), size=len(data))
+
+    def test_read_text(self, tmp_path):
+        """Text should decode the same from bytes and from a spool file."""
+        data = "Hello, world! 你好世界".encode("utf-8")
+
+        assert read_text(self.make_spool(tmp_path, data)) == read_text(data) == "Hello, world! 你好世界"
+
+    def test_open_source_is_seekable(self, tmp_path):
+        """Spooled uploads should open as a seekable memory map."""
+        with open_source(self.make_spool(tmp_path, b"%PDF-1.4 body")) as stream:
+            stream.seek(5)
+            assert stream.read(3) == b"1.4"
+
+    def test_empty_upload(self, tmp_path):
+        """An empty file cannot be memory-mapped but should still read as empty."""
+        spooled = self.make_spool(tmp_path, b"")
+
+        assert read_text(spooled) == ""
+        with open_source(spooled) as stream:
+            assert stream.read() == b""
+
+    @pytest.mark.asyncio
+    async def test_pdf_extracted_from_spool(self, tmp_path):
+        """Worker processes should read a spooled PDF by path."""
+        from services.pdf_extraction import extract_pdf_pages
+        from tests.test_pdf_extraction import make_pdf
+
+        spooled = self.make_spool(tmp_path, make_pdf(["First page", "Second page"]))
+        pages = await extract_pdf_pages(spooled)
+
+        assert [number for number, _ in pages] == [1, 2]
+        assert "Second page" in pages[1][1]
+
+    @pytest.mark.asyncio
+    @patch('services.jobs.ingest_document', new_callable=AsyncMock)
+    async def test_finished_job_deletes_spool(self, mock_ingest, tmp_path):
+        """The spool file should be removed once its job finishes."""
+        from services.jobs import IngestionJobQueue, JOB_COMPLETED
+        from tests.test_jobs import wait_for_status
+
+        mock_ingest.return_value = {"document_id": "doc", "chunks": 1, "status": "processed"}
+        spooled = self.make_spool(tmp_path, b"Some text")
+
+        queue = IngestionJobQueue(workers=1)
+        job = queue.submit(spooled, "doc.txt", "test-assistant", "text/plain")
+        await wait_for_status(queue, job.job_id, [JOB_COMPLETED])
+
+        assert mock_ingest.call_args.kwargs["content"] == spooled
+        assert not os.path.exists(spooled.path)
+        await queue.shutdown()
@@ -0,0 +1,125 @@
+"""Tests for the batched upsert pipeline."""
+import threading
+import time
+import pytest
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.upsert import split_batches, upsert_batched
+
+
+def make_vectors(count, dims=8, text="chunk text"):
+    return [
+        (f"doc-chunk-{i}", [0.1] * dims, {"text": text, "chunk_index": i})
+        for i in range(count)
+    ]
+
+
+class ApiError(Exception):
+    def __init__(self, status):
+        super().__init__(f"HTTP {status}")
+        self.status = status
+
+
+class TestSplitBatches:
+    """Test batch packing by record count and byte budget."""
+
+    def test_splits_by_record_limit(self):
+        """Batches should hold at most max_records items."""
+        batches = split_batches(make_vectors(250), max_records=96)
+
+        assert [len(b) for b in batches] == [96, 96, 58]
+
+    def test_splits_by_byte_budget(self):
+        """Large metadata should force smaller batches."""
+        vectors = make_vectors(20, text="x" * 10_000)
+        batches = split_batches(vectors, max_records=96, max_bytes=50_000)
+
+        assert len(batches) > 1
+        assert sum(len(b) for b in batches) == 20
+        assert all(len(b) <= 4 for b in batches)
+
+    def test_record_dicts_are_supported(self):
+        """Integrated-embedding record dicts should be packed too."""
+        records = [{"_id": f"r{i}", "text": "hello"} for i in range(5)]
+        batches = split_batches(records, max_records=2)
+
+        assert [len(b) for b in batches] == [2, 2, 1]
+
+
+class TestUpsertBatched:
+    """Test concurrency, retries and partial failure reporting."""
+
+    @pytest.mark.asyncio
+    async def test_all_batches_sent(self):
+        """Every record should be upserted exactly once."""
+        sent = []
+        report = await upsert_batched(lambda batch: sent.extend(batch), make_vectors(10), max_records=3)
+
+        assert report.ok
+        assert report.upserted == 10
+        assert report.batches == 4
+        assert sorted(v[0] for v in sent) == sorted(v[0] for v in make_vectors(10))
+
+    @pytest.mark.asyncio
+    async def test_transient_failures_are_retried(self):
+        """A batch failing once should succeed on retry."""
+        calls = {"count": 0}
+
+        def flaky_send(batch):
+            calls["count"] += 1
+            if calls["count"] == 1:
+                raise ApiError(503)
+
+        report = await upsert_batched(flaky_send, make_vectors(3), max_records=10, backoff=0)
+
+        assert report.ok
+        assert calls["count"] == 2
+
+    @pytest.mark.asyncio
+    async def test_client_errors_are_not_retried(self):
+        """4xx errors (other than 429) should fail the batch immediately."""
+        calls = {"count": 0}
+
+        def bad_send(batch):
+            calls["count"] += 1
+            raise ApiError(400)
+
+        report = await upsert_batched(bad_send, make_vectors(3), max_records=10, backoff=0)
+
+        assert calls["count"] == 1
+        assert report.failed_batches == 1
+
+    @pytest.mark.asyncio
+    async def test_partial_failure_reports_failed_ids(self):
+        """Failed batches should be reported while other batches succeed."""
+        def send(batch):
+            if any(v[0] == "doc-chunk-4" for v in batch):
+                raise ApiError(503)
+
+        report = await upsert_batched(send, make_vectors(6), max_records=2, max_attempts=2, backoff=0)
+
+        assert not report.ok
+        assert report.upserted == 4
+        assert sorted(report.failed_ids) == ["doc-chunk-4", "doc-chunk-5"]
+
+    @pytest.mark.asyncio
+    async def test_concurrency_is_bounded(self):
+        """No more than `concurrency` batches should be in flight at once."""
+        lock = threading.Lock()
+        state = {"active": 0, "peak": 0}
+
+        def slow_send(batch):
+            with lock:
+                state["active"] += 1
+                state["peak"] = max(state["peak"], state["active"])
+            time.sleep(0.02)
+            with lock:
+                state["active"] -= 1
+
+        report = await upsert_batched(slow_send, make_vectors(20), max_records=2, concurrency=3)
+
+        assert report.upserted == 20
+        assert 1 < state["peak"] <= 3
@@ -0,0 +1,183 @@
+"""Tests for the memory-mapped on-disk vector store."""
+import pytest
+from unittest.mock import patch
+import sys
+import os
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.vector_segments import SegmentVectorStore
+
+
+def records(vectors, prefix="r"):
+    return [(f"{prefix}{i}", list(vector), {"n": i}) for i, vector in enumerate(vectors)]
+
+
+def segment_dir(store, namespace):
+    namespace_dir = os.path.join(store.root, "ns-" + namespace)
+    with open(os.path.join(namespace_dir, "CURRENT")) as f:
+        return os.path.join(namespace_dir, f.read())
+
+
+class TestSegmentVectorStore:
+    """Test append-only segments, memory-mapped reads and compaction."""
+
+    def test_query_ranks_by_cosine_similarity(self, tmp_path):
+        """Queries should return the nearest records with their metadata."""
+        store = SegmentVectorStore(str(tmp_path))
+        store.upsert("a1", [("x", [10.0, 0.0], {"page": 1}), ("y", [0.0, 1.0], {}), ("xy", [1.0, 1.0], {})])
+
+        matches = store.query("a1", top_k=2, vector=[1.0, 0.1])
+
+        assert [m.id for m in matches] == ["x", "xy"]
+        assert matches[0].metadata == {"page": 1}
+        assert matches[0].score == pytest.approx(1 / np.sqrt(1.01), rel=1e-5)
+
+    def test_segment_files_are_memory_mapped(self, tmp_path):
+        """Vectors are read through np.memmap, not loaded into the heap."""
+        store = SegmentVectorStore(str(tmp_path))
+        store.upsert("a1", records(np.eye(4, dtype=np.float32)))
+
+        view = store._namespace("a1").snapshot()
+
+        assert isinstance(view.vectors, np.memmap)
+        assert os.path.getsize(os.path.join(segment_dir(store, "a1"), "vectors.f32")) == 4 * 4 * 4
+        with open(os.path.join(segment_dir(store, "a1"), "ids.txt")) as f:
+            assert f.read().splitlines() == ["r0", "r1", "r2", "r3"]
+
+    def test_data_survives_reopen(self, tmp_path):
+        """A new store (e.g. another worker) should see everything written before."""
+        SegmentVectorStore(str(tmp_path)).upsert("a1", records(np.eye(3, dtype=np.float32)))
+
+        reopened = SegmentVectorStore(str(tmp_path))
+
+        assert reopened.list_namespaces() == ["a1"]
+        assert reopened.list_ids("a1", "r") == {"r0", "r1", "r2"}
+        assert reopened.query("a1", top_k=1, vector=[0.0, 1.0, 0.0])[0].id == "r1"
+
+    def test_fetch_returns_metadata_by_id(self, tmp_path):
+        """Deleted and unknown IDs are left out."""
+        store = SegmentVectorStore(str(tmp_path))
+        store.upsert("a1", records(np.eye(3, dtype=np.float32)))
+        store.delete("a1", ["r1"])
+
+        assert store.fetch("a1", ["r0", "r1", "missing"]) == {"r0": {"n": 0}}
+        assert store.fetch("a2", ["r0"]) == {}
+
+    def test_readers_see_other_writers(self, tmp_path):
+        """A reader's mapping should refresh after another store appends or deletes."""
+        writer = SegmentVectorStore(str(tmp_path))
+        reader = SegmentVectorStore(str(tmp_path))
+        writer.upsert("a1", [("x", [1.0, 0.0], {})])
+        assert [m.id for m in reader.query("a1", top_k=5, vector=[0.0, 1.0])] == ["x"]
+
+        writer.upsert("a1", [("y", [0.0, 1.0], {})])
+        writer.delete("a1", ["x"])
+
+        assert [m.id for m in reader.query("a1", top_k=5, vector=[0.0, 1.0])] == ["y"]
+
+    def test_upsert_replaces_existing_id(self, tmp_path):
+        """Re-upserting appends a row and marks the old one dead."""
+        store = SegmentVectorStore(str(tmp_path))
+        store.upsert("a1", [("doc#1", [1.0, 0.0], {"v": 1})])
+        store.upsert("a1", [("doc#1", [0.0, 1.0], {"v": 2}), ("doc#2", [1.0, 0.0], {"v": 1})])
+
+        matches = store.query("a1", top_k=5, vector=[0.0, 1.0])
+
+        assert [(m.id, m.metadata) for m in matches] == [("doc#1", {"v": 2}), ("doc#2", {"v": 1})]
+        assert store._namespace("a1").snapshot().dead.tolist() == [0]
+
+    def test_compaction_drops_dead_rows(self, tmp_path):
+        """Compaction rewrites live rows into a new segment with the same results."""
+        store = SegmentVectorStore(str(tmp_path), compact_min_rows=10 ** 9)
+        vectors = np.random.default_rng(0).standard_normal((100, 8)).astype(np.float32)
+        store.upsert("a1", records(vectors))
+        store.delete("a1", [f"r{i}" for i in range(0, 100, 2)])
+        old_segment = segment_dir(store, "a1")
+        before = store.query("a1", top_k=5, vector=vectors[1].tolist())
+
+        store._namespace("a1").compact()
+
+        assert not os.path.exists(old_segment)
+        assert store._namespace("a1").snapshot().rows == 50
+        assert store.list_ids("a1", "r") == {f"r{i}" for i in range(1, 100, 2)}
+        assert store.query("a1", top_k=5, vector=vectors[1].tolist()) == before
+
+    def test_compaction_runs_in_background(self, tmp_path):
+        """Deleting past the dead-row ratio should schedule a compaction."""
+        store = SegmentVectorStore(str(tmp_path), compact_min_rows=4, compact_ratio=0.5)
+        store.upsert("a1", records(np.eye(8, dtype=np.float32)))
+        first = segment_dir(store, "a1")
+
+        store.delete("a1", ["r0", "r1", "r2", "r3"])
+        store.close()
+
+        assert segment_dir(store, "a1") != first
+        assert store.list_ids("a1", "r") == {"r4", "r5", "r6", "r7"}
+
+    def test_torn_append_is_repaired(self, tmp_path):
+        """A partial row left by an interrupted write is ignored by readers and truncated by the next writer."""
+        store = SegmentVectorStore(str(tmp_path))
+        store.upsert("a1", records(np.eye(2, dtype=np.float32)))
+        segment = segment_dir(store, "a1")
+        with open(os.path.join(segment, "ids.txt"), "a") as f:
+            f.write("torn\n")
+        with open(os.path.join(segment, "vectors.f32"), "ab") as f:
+            f.write(b"\x00" * 3)
+
+        reopened = SegmentVectorStore(str(tmp_path))
+        assert [m.id for m in reopened.query("a1", top_k=5, vector=[1.0, 0.0])] == ["r0", "r1"]
+
+        reopened.upsert("a1", [("r2", [0.0, 1.0], {})])
+
+        assert reopened.list_ids("a1", "r") == {"r0", "r1", "r2"}
+        assert os.path.getsize(os.path.join(segment, "vectors.f32")) == 3 * 2 * 4
+
+    def test_namespaces_are_isolated(self, tmp_path):
+        """Each namespace has its own directory; names are escaped."""
+        store = SegmentVectorStore(str(tmp_path))
+        store.upsert("team/a", [("one", [1.0, 0.0], {})])
+        store.upsert(None, [("two", [1.0, 0.0], {})])
+
+        assert [m.id for m in store.query("team/a", top_k=5, vector=[1.0, 0.0])] == ["one"]
+        assert store.list_namespaces() == ["", "team/a"]
+
+        store.delete_namespace("team/a")
+
+        assert store.query("team/a", top_k=5, vector=[1.0, 0.0]) == []
+        assert store.list_namespaces() == [""]
+
+    def test_evicted_namespaces_reopen(self, tmp_path):
+        """Only max_open namespaces stay mapped; others reopen on demand."""
+        store = SegmentVectorStore(str(tmp_path), max_open=2)
+        for name in ("a", "b", "c"):
+            store.upsert(name, [(name, [1.0, 0.0], {})])
+
+        assert len(store._namespaces) == 2
+        assert store.query("a", top_k=1, vector=[1.0, 0.0])[0].id == "a"
+
+    def test_rejects_dimension_mismatch(self, tmp_path):
+        store = SegmentVectorStore(str(tmp_path))
+        store.upsert("a1", [("x", [1.0, 0.0], {})])
+
+        with pytest.raises(ValueError):
+            store.upsert("a1", [("y", [1.0, 0.0, 0.0], {})])
+        with pytest.raises(ValueError):
+            store.query("a1", top_k=1, vector=[1.0])
+
+
+class TestGetVectorStore:
+    """Test backend selection."""
+
+    @patch('services.vector_store.VECTOR_STORE', 'local')
+    @patch('services.embeddings.EMBEDDING_PROVIDER', 'local')
+    def test_local_backend_uses_segments(self, tmp_path):
+        from services.vector_store import get_vector_store
+
+        with patch('services.vector_store.LOCAL_VECTOR_STORE_DIR', str(tmp_path)):
+            store = get_vector_store()
+
+        assert isinstance(store, SegmentVectorStore)
+        assert store.root == str(tmp_path)
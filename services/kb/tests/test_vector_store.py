@@ -0,0 +1,264 @@
+"""Tests for the vector store interface and the in-process NumPy backend."""
+import pytest
+from unittest.mock import patch, MagicMock, AsyncMock
+import sys
+import os
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.local_vector_store import NumpyVectorStore, matches_filter, top_k_indices
+
+
+def records(vectors, prefix="r", **metadata):
+    return [(f"{prefix}{i}", list(vector), {"n": i, **metadata}) for i, vector in enumerate(vectors)]
+
+
+class TestNumpyVectorStore:
+    """Test exact cosine search over per-namespace matrices."""
+
+    def test_query_ranks_by_cosine_similarity(self):
+        """The closest vector by angle should rank first, regardless of magnitude."""
+        store = NumpyVectorStore()
+        store.upsert("a1", [("x", [10.0, 0.0], {}), ("y", [0.0, 1.0], {}), ("xy", [1.0, 1.0], {})])
+
+        matches = store.query("a1", top_k=3, vector=[1.0, 0.1])
+
+        assert [m.id for m in matches] == ["x", "xy", "y"]
+        assert matches[0].score == pytest.approx(1 / np.sqrt(1.01), rel=1e-5)
+
+    def test_top_k_matches_full_sort(self):
+        """argpartition selection should return the same top-k as a full sort."""
+        rng = np.random.default_rng(0)
+        vectors = rng.standard_normal((5000, 32)).astype(np.float32)
+        store = NumpyVectorStore()
+        store.upsert(None, records(vectors))
+        query = rng.standard_normal(32)
+
+        matches = store.query(None, top_k=10, vector=query.tolist())
+
+        normalized = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+        expected = np.argsort(-(normalized @ (query / np.linalg.norm(query))))[:10]
+        assert [m.id for m in matches] == [f"r{i}" for i in expected]
+
+    def test_matrix_grows_past_initial_capacity(self):
+        """Upserts beyond the initial capacity should keep every row searchable."""
+        store = NumpyVectorStore()
+        vectors = np.eye(3000, 8, dtype=np.float32) + 0.01
+        store.upsert("a1", records(vectors))
+
+        assert len(store.list_ids("a1", "r")) == 3000
+        assert store.query("a1", top_k=1, vector=vectors[5].tolist())[0].id == "r5"
+
+    def test_upsert_replaces_existing_id(self):
+        """Re-upserting an ID should replace its vector and metadata, not add a row."""
+        store = NumpyVectorStore()
+        store.upsert("a1", [("doc#1", [1.0, 0.0], {"v": 1})])
+        store.upsert("a1", [("doc#1", [0.0, 1.0], {"v": 2})])
+
+        matches = store.query("a1", top_k=5, vector=[0.0, 1.0])
+
+        assert len(matches) == 1
+        assert matches[0].metadata == {"v": 2}
+        assert matches[0].score == pytest.approx(1.0)
+
+    def test_delete_keeps_remaining_rows(self):
+        """Deleting moves the last row into the hole; every other record stays findable."""
+        store = NumpyVectorStore()
+        vectors = np.eye(4, dtype=np.float32)
+        store.upsert("a1", records(vectors))
+
+        store.delete("a1", ["r1", "missing"])
+
+        assert store.list_ids("a1", "r") == {"r0", "r2", "r3"}
+        for i in (0, 2, 3):
+            assert store.query("a1", top_k=1, vector=vectors[i].tolist())[0].id == f"r{i}"
+
+    def test_list_ids_by_prefix(self):
+        """Only IDs with the prefix should be listed."""
+        store = NumpyVectorStore()
+        store.upsert("a1", [("docA#1", [1.0], {}), ("docA#2", [1.0], {}), ("docB#1", [1.0], {})])
+
+        assert store.list_ids("a1", "docA#") == {"docA#1", "docA#2"}
+
+    def test_namespaces_are_isolated(self):
+        """Queries only see their own namespace; deleting one leaves the others."""
+        store = NumpyVectorStore()
+        store.upsert("a1", [("one", [1.0, 0.0], {})])
+        store.upsert("a2", [("two", [1.0, 0.0], {})])
+
+        assert [m.id for m in store.query("a1", top_k=5, vector=[1.0, 0.0])] == ["one"]
+        assert store.list_namespaces() == ["a1", "a2"]
+
+        store.delete_namespace("a1")
+
+        assert store.query("a1", top_k=5, vector=[1.0, 0.0]) == []
+        assert store.list_namespaces() == ["a2"]
+
+    def test_filter_falls_back_to_full_scan(self):
+        """A filter matching only low-scoring rows should still return them."""
+        store = NumpyVectorStore()
+        vectors = [[1.0, i / 100] for i in range(100)]
+        items = [(f"r{i}", v, {"assistant_id": "a2" if i >= 95 else "a1"}) for i, v in enumerate(vectors)]
+        store.upsert(None, items)
+
+        matches = store.query(None, top_k=3, vector=[1.0, 0.0], filter={"assistant_id": "a2"})
+
+        assert [m.id for m in matches] == ["r95", "r96", "r97"]
+
+    def test_rejects_dimension_mismatch(self):
+        """Vectors of another dimension should be rejected."""
+        store = NumpyVectorStore()
+        store.upsert("a1", [("x", [1.0, 0.0], {})])
+
+        with pytest.raises(ValueError):
+            store.upsert("a1", [("y", [1.0, 0.0, 0.0], {})])
+        with pytest.raises(ValueError):
+            store.query("a1", top_k=1, vector=[1.0])
+
+    def test_rejects_integrated_records(self):
+        """Text-only records and queries need Pinecone's integrated embeddings."""
+        store = NumpyVectorStore()
+
+        with pytest.raises(ValueError):
+            store.upsert("a1", [{"_id": "x", "text": "hello"}])
+        with pytest.raises(ValueError):
+            store.query("a1", top_k=1, text="hello")
+
+
+class TestHelpers:
+    """Test top-k selection and metadata filters."""
+
+    def test_top_k_indices_orders_best_first(self):
+        scores = np.array([0.1, 0.9, 0.5, 0.7], dtype=np.float32)
+
+        assert top_k_indices(scores, 2).tolist() == [1, 3]
+        assert top_k_indices(scores, 10).tolist() == [1, 3, 2, 0]
+        assert top_k_indices(scores, 0).tolist() == []
+
+    def test_matches_filter_operators(self):
+        metadata = {"assistant_id": "a1", "page": 3}
+
+        assert matches_filter(metadata, {"assistant_id": "a1"})
+        assert matches_filter(metadata, {"page": {"$in": [2, 3]}})
+        assert not matches_filter(metadata, {"assistant_id": {"$ne": "a1"}})
+        assert not matches_filter(metadata, {"page": {"$eq": 4}})
+        with pytest.raises(ValueError):
+            matches_filter(metadata, {"page": {"$gt": 1}})
+
+
+class TestGetVectorStore:
+    """Test backend selection."""
+
+    @patch('services.vector_store.VECTOR_STORE', 'local')
+    @patch('services.embeddings.EMBEDDING_PROVIDER', 'openai')
+    @patch('services.vector_store.LOCAL_VECTOR_STORE_DIR', '')
+    def test_local_backend(self):
+        from services.vector_store import get_vector_store
+
+        assert isinstance(get_vector_store(), NumpyVectorStore)
+        assert get_vector_store() is get_vector_store()
+
+    @patch('services.vector_store.VECTOR_STORE', 'local')
+    @patch('services.embeddings.EMBEDDING_PROVIDER', 'pinecone')
+    def test_local_backend_needs_vectors(self):
+        from services.vector_store import get_vector_store
+
+        with pytest.raises(ValueError):
+            get_vector_store()
+
+
+class TestPineconeIndexHandles:
+    """Test the per-worker index handle registry, pooling options and warmup."""
+
+    @patch('services.vector_store.PINECONE_INDEX_HOST', 'idx-abc.svc.pinecone.io')
+    @patch('services.vector_store.get_pinecone_client')
+    def test_handle_is_created_once(self, mock_pinecone):
+        """Every store operation should reuse one handle, resolved from the configured host."""
+        from services.vector_store import PineconeVectorStore, PINECONE_INDEX_NAME
+
+        store = PineconeVectorStore()
+        mock_pinecone.return_value.Index.return_value.query.return_value = MagicMock(matches=[])
+        for _ in range(3):
+            store.query(None, 5, vector=[0.1, 0.2])
+        PineconeVectorStore().list_ids(None, "doc#")
+
+        mock_pinecone.return_value.Index.assert_called_once_with(
+            name=PINECONE_INDEX_NAME, host='idx-abc.svc.pinecone.io'
+        )
+
+    @patch('services.vector_store._pinecone_client', None)
+    @patch('services.vector_store.PINECONE_POOL_MAXSIZE', 64)
+    @patch('services.vector_store.Pinecone')
+    def test_pool_size_is_passed_to_client(self, mock_client):
+        from services.vector_store import get_pinecone_client
+
+        with patch.dict(os.environ, {"PINECONE_API_KEY": "pk"}):
+            get_pinecone_client()
+
+        mock_client.assert_called_once_with(api_key="pk", connection_pool_maxsize=64)
+
+    @patch('services.vector_store._pinecone_client', None)
+    @patch('services.vector_store.PINECONE_GRPC', True)
+    @patch('pinecone.grpc.PineconeGRPC')
+    def test_grpc_client(self, mock_grpc):
+        """PINECONE_GRPC switches the data plane to gRPC (HTTP/2)."""
+        from services.vector_store import get_pinecone_client
+
+        with patch.dict(os.environ, {"PINECONE_API_KEY": "pk"}):
+            assert get_pinecone_client() is mock_grpc.return_value
+
+    @patch('services.vector_store.get_pinecone_client')
+    def test_warm_up_and_close(self, mock_pinecone):
+        """Warmup opens the handle with a stats call; close releases it."""
+        from services.vector_store import PineconeVectorStore, _index_handles
+
+        store = PineconeVectorStore()
+        store.warm_up()
+        handle = mock_pinecone.return_value.Index.return_value
+
+        handle.describe_index_stats.assert_called_once()
+        store.close()
+        handle.close.assert_called_once()
+        assert _index_handles == {}
+
+    @patch('services.vector_store.VECTOR_STORE', 'pinecone')
+    @patch('services.vector_store.PINECONE_WARMUP', True)
+    @patch('services.vector_store.get_pinecone_client')
+    def test_warmup_failure_is_not_fatal(self, mock_pinecone):
+        from services.vector_store import warm_up_vector_store
+
+        mock_pinecone.return_value.Index.side_effect = RuntimeError("unreachable")
+
+        warm_up_vector_store()
+
+
+class TestLocalPipeline:
+    """Test ingestion and search end to end without Pinecone."""
+
+    @pytest.mark.asyncio
+    @patch('services.vector_store.VECTOR_STORE', 'local')
+    @patch('services.embeddings.EMBEDDING_PROVIDER', 'openai')
+    @patch('services.vector_store.LOCAL_VECTOR_STORE_DIR', '')
+    @patch('services.vector_store.get_pinecone_client')
+    @patch('services.retrieval.embed_query', new_callable=AsyncMock)
+    @patch('services.ingestion.embed_matrix', new_callable=AsyncMock)
+    @patch('services.ingestion.chunk_spans')
+    async def test_ingest_then_search(self, mock_spans, mock_embed_matrix, mock_embed_query, mock_pinecone):
+        """Chunks ingested into the local store should be searchable per assistant."""
+        from services.ingestion import ingest_document
+        from services.retrieval import search_knowledge_base
+
+        mock_spans.return_value = np.array([[0, 18, 4], [19, 37, 4]])
+        mock_embed_matrix.side_effect = lambda texts: np.eye(len(texts), 4, dtype=np.float32)
+        mock_embed_query.return_value = [0.0, 1.0, 0.0, 0.0]
+
+        await ingest_document(b"Refunds take days. Shipping is free.", "faq.txt", "a1", "text/plain")
+        await ingest_document(b"Refunds take days. Shipping is free.", "faq.txt", "a2", "text/plain")
+
+        results = await search_knowledge_base(query="shipping", assistant_id="a1", top_k=1)
+
+        assert results[0]["content"] == "Shipping is free."
+        assert results[0]["score"] == pytest.approx(1.0)
+        mock_pinecone.assert_not_called()